@@ -0,0 +1,254 @@
+"""Cold storage for finished records.
+
+Once they are old, finished food requests, their fulfillments and
+confirmed deliveries are only read by history views and analytics.
+`archive_matching` moves such documents out of the operational
+collections in batches, so the collections behind every hot query stay
+small enough to keep in RAM. An `ArchiveStore` holds what was moved.
+Two backends are available:
+
+- `MongoArchiveStore` keeps each collection's records in `<name>_archive`
+  in the same database (default).
+- `SegmentArchiveStore` writes each batch as a gzip-compressed JSON Lines
+  segment file on local disk. A manifest document per segment, in
+  `archive_segments`, lists the ids and owners it holds, so a lookup only
+  opens the segments with the user's records. Every worker must see the
+  same ARCHIVE_PATH. Segments cannot be aggregated in place, so donor
+  suggestions only learn from fulfillments that are still hot.
+
+A record's owners are the fields in `ARCHIVE_OWNERS`, the same fields
+the per-user history endpoints filter on. `get_archive_store` picks the
+backend from the ARCHIVE_STORE environment variable.
+"""
+import asyncio
+import gzip
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from pymongo.errors import BulkWriteError
+
+# collection -> fields naming the users a record belongs to
+ARCHIVE_OWNERS: Dict[str, Sequence[str]] = {
+    "food_requests": ("ngo_id",),
+    "fulfillments": ("donor_id",),
+    "deliveries": ("volunteer_id", "additional_volunteers"),
+}
+
+def owner_values(collection: str, doc: Dict[str, Any]) -> List[str]:
+    values = []
+    for field in ARCHIVE_OWNERS[collection]:
+        value = doc.get(field)
+        if isinstance(value, list):
+            values.extend(value)
+        elif value is not None:
+            values.append(value)
+    return values
+
+def created(doc: Dict[str, Any]) -> str:
+    return str(doc.get("created_at") or "")
+
+def newest_first(docs: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """The `limit` newest documents, dropping repeats of an id"""
+    seen, unique = set(), []
+    for doc in docs:
+        if doc["id"] not in seen:
+            seen.add(doc["id"])
+            unique.append(doc)
+    unique.sort(key=created, reverse=True)
+    return unique[:limit]
+
+class ArchiveStore(ABC):
+    """Interface implemented by the archive backends."""
+
+    name = "base"
+
+    @abstractmethod
+    async def write(self, collection: str, docs: List[Dict[str, Any]]) -> None:
+        """Store a batch; writing a record that is already archived must not fail"""
+
+    @abstractmethod
+    async def find(self, collection: str, owner_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Up to `limit` records owned by `owner_id`, newest first"""
+
+    @abstractmethod
+    async def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """The archived record with this id, if any"""
+
+    @abstractmethod
+    async def status_counts(self, collection: str) -> Dict[str, int]:
+        """Number of archived records per status, counting each record once"""
+
+    async def aggregate(self, collection: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run a pipeline over the archived records, where the backend can"""
+        return []
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """Sizes for the admin stats endpoint"""
+
+class MongoArchiveStore(ArchiveStore):
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+
+    def collection(self, name: str):
+        return self.db[f"{name}_archive"]
+
+    async def write(self, collection: str, docs: List[Dict[str, Any]]) -> None:
+        try:
+            await self.collection(collection).insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Copies left by an interrupted run are already archived
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+    async def find(self, collection: str, owner_id: str, limit: int) -> List[Dict[str, Any]]:
+        query = {"$or": [{field: owner_id} for field in ARCHIVE_OWNERS[collection]]}
+        return await self.collection(collection).find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(None)
+
+    async def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection(collection).find_one({"id": record_id}, {"_id": 0})
+
+    async def status_counts(self, collection: str) -> Dict[str, int]:
+        rows = await self.collection(collection).aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {(row["_id"] if row["_id"] is not None else "none"): row["count"] for row in rows}
+
+    async def aggregate(self, collection: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self.collection(collection).aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+    async def stats(self) -> Dict[str, Any]:
+        counts = await asyncio.gather(*(self.collection(c).estimated_document_count() for c in ARCHIVE_OWNERS))
+        return {"records": dict(zip(ARCHIVE_OWNERS, counts))}
+
+def write_segment(path: Path, docs: List[Dict[str, Any]]) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".part")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, default=str) + "\n")
+    os.replace(tmp_path, path)
+    return path.stat().st_size
+
+def read_segment(path: Path) -> List[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class SegmentArchiveStore(ArchiveStore):
+    """Archive segments on local disk, indexed by a manifest collection.
+
+    The manifest needs indexes on (collection, owners, max_created_at) and
+    (collection, ids).
+    """
+
+    name = "segments"
+
+    def __init__(self, root: Path, manifest):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest = manifest
+
+    async def write(self, collection: str, docs: List[Dict[str, Any]]) -> None:
+        # Records left behind by an interrupted run are already in a segment
+        ids = [d["id"] for d in docs]
+        archived = set(await self.manifest.distinct("ids", {"collection": collection, "ids": {"$in": ids}}))
+        docs = [d for d in docs if d["id"] not in archived]
+        if not docs:
+            return
+        now = datetime.now(timezone.utc)
+        segment_id = f"{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        path = Path(collection) / f"{segment_id}.jsonl.gz"
+        size = await asyncio.to_thread(write_segment, self.root / path, docs)
+        # The manifest goes in last, so a segment is never listed before it is complete
+        await self.manifest.insert_one({
+            "id": segment_id,
+            "collection": collection,
+            "path": str(path),
+            "records": len(docs),
+            "bytes": size,
+            "ids": [d["id"] for d in docs],
+            "owners": sorted({o for d in docs for o in owner_values(collection, d)}),
+            "statuses": dict(Counter(str(d.get("status") or "none") for d in docs)),
+            "max_created_at": max(created(d) for d in docs),
+            "created_at": now.isoformat(),
+        })
+
+    async def find(self, collection: str, owner_id: str, limit: int) -> List[Dict[str, Any]]:
+        segments = self.manifest.find(
+            {"collection": collection, "owners": owner_id}, {"_id": 0, "path": 1, "max_created_at": 1}
+        ).sort("max_created_at", -1)
+        found: List[Dict[str, Any]] = []
+        async for segment in segments:
+            # Every record in the remaining segments is older than the ones already kept
+            if len(found) >= limit and segment["max_created_at"] < created(found[-1]):
+                break
+            docs = await asyncio.to_thread(read_segment, self.root / segment["path"])
+            found = newest_first(found + [d for d in docs if owner_id in owner_values(collection, d)], limit)
+        return found
+
+    async def get(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        segment = await self.manifest.find_one({"collection": collection, "ids": record_id}, {"_id": 0, "path": 1})
+        if not segment:
+            return None
+        docs = await asyncio.to_thread(read_segment, self.root / segment["path"])
+        return next((d for d in docs if d.get("id") == record_id), None)
+
+    async def status_counts(self, collection: str) -> Dict[str, int]:
+        counts: Counter = Counter()
+        async for segment in self.manifest.find({"collection": collection}, {"_id": 0, "statuses": 1}):
+            counts.update(segment.get("statuses") or {})
+        return dict(counts)
+
+    async def stats(self) -> Dict[str, Any]:
+        rows = await self.manifest.aggregate([
+            {"$group": {"_id": "$collection", "segments": {"$sum": 1}, "records": {"$sum": "$records"}, "bytes": {"$sum": "$bytes"}}}
+        ]).to_list(None)
+        return {
+            "records": {row["_id"]: row["records"] for row in rows},
+            "segments": {row["_id"]: row["segments"] for row in rows},
+            "bytes": {row["_id"]: row["bytes"] for row in rows},
+        }
+
+def get_archive_store(db, default_root: Path) -> ArchiveStore:
+    """Build the archive store selected by ARCHIVE_STORE (mongo or segments)."""
+    backend = os.environ.get('ARCHIVE_STORE', 'mongo')
+    if backend == "mongo":
+        return MongoArchiveStore(db)
+    if backend == "segments":
+        return SegmentArchiveStore(Path(os.environ.get('ARCHIVE_PATH', default_root)), db.archive_segments)
+    raise ValueError(f"Unknown ARCHIVE_STORE backend: {backend}")
+
+async def archive_matching(
+    collection,
+    store: ArchiveStore,
+    name: str,
+    query: Dict[str, Any],
+    batch_size: int = 500
+) -> List[str]:
+    """Move every document of `collection` matching `query` into `store`, a batch at a time.
+
+    A batch is written to the store before it is deleted, so a failure in
+    between leaves a record in both places rather than in neither. Readers
+    that merge the two drop the repeat. Returns the ids that were moved.
+    """
+    moved: List[str] = []
+    while True:
+        docs = await collection.find(query, {"_id": 0}).limit(batch_size).to_list(None)
+        if not docs:
+            break
+        now = datetime.now(timezone.utc).isoformat()
+        await store.write(name, [{**d, "archived_at": now} for d in docs])
+        ids = [d["id"] for d in docs]
+        await collection.delete_many({**query, "id": {"$in": ids}})
+        moved.extend(ids)
+        if len(docs) < batch_size:
+            break
+    return moved
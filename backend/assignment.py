@@ -0,0 +1,191 @@
+"""Batch assignment of pending deliveries to volunteers.
+
+`assign` looks at every open delivery and every available volunteer at
+once. It picks the pairs that minimise total travel time: the volunteer's
+ride to the pickup plus the trip to the drop-off, at the speed of the
+volunteer's transport mode. Each mode also limits how far a volunteer is
+sent and how many deliveries they can carry at a time.
+
+The solver is an auction algorithm, run in Jacobi fashion: all
+unassigned deliveries bid in the same NumPy step. Volunteers with
+capacity c are sold as c interchangeable slots, each with its own price
+(the "similar objects" form of the auction). There is no
+epsilon scaling. A slot, once sold, stays sold, so slots that are never
+sold keep a price of zero, and the result stays within n * eps of the
+optimum even when there are more deliveries than slots. Warm-started
+scaling phases would break that property. To
+keep 5,000 x 5,000 instances fast, the full cost matrix is built in
+chunks, and only each delivery's `candidates` cheapest feasible
+volunteers are kept. A volunteer who is not among a delivery's cheapest
+candidates would be a poor match for it anyway. A delivery that no
+volunteer can serve at a reasonable price stays unassigned.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from distance import haversine_matrix
+
+# transport_mode -> (speed km/h, deliveries carried at once, furthest pickup in km)
+TRANSPORT_MODES: Dict[str, Tuple[float, int, float]] = {
+    "walk": (5.0, 1, 3.0),
+    "bike": (15.0, 2, 10.0),
+    "auto": (25.0, 3, 20.0),
+    "car": (30.0, 4, 30.0),
+}
+DEFAULT_TRANSPORT_MODE = "bike"
+
+def mode_profile(mode: Optional[str]) -> Tuple[float, int, float]:
+    return TRANSPORT_MODES.get(mode or DEFAULT_TRANSPORT_MODE, TRANSPORT_MODES[DEFAULT_TRANSPORT_MODE])
+
+def candidate_costs(
+    pickup_lat: np.ndarray,
+    pickup_lng: np.ndarray,
+    trip_km: np.ndarray,
+    vol_lat: np.ndarray,
+    vol_lng: np.ndarray,
+    speed_kmh: np.ndarray,
+    reach_km: np.ndarray,
+    candidates: int = 32,
+    chunk: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Each delivery's cheapest volunteers: (volunteer index, minutes), both n x k.
+
+    Pairs beyond the volunteer's reach cost +inf. Rows are computed
+    `chunk` deliveries at a time, so memory stays at chunk x volunteers.
+    """
+    n, m = len(pickup_lat), len(vol_lat)
+    k = min(candidates, m)
+    idx = np.empty((n, k), dtype=np.int64)
+    cost = np.empty((n, k), dtype=np.float64)
+    minutes_per_km = (60.0 / speed_kmh).astype(np.float32)[None, :]
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        ride = haversine_matrix(pickup_lat[start:stop], pickup_lng[start:stop], vol_lat, vol_lng, dtype=np.float32)
+        minutes = (ride + trip_km[start:stop, None].astype(np.float32)) * minutes_per_km
+        minutes[ride > reach_km[None, :]] = np.inf
+        top = np.argpartition(minutes, k - 1, axis=1)[:, :k] if k < m else np.broadcast_to(np.arange(m), (stop - start, m))
+        idx[start:stop] = top
+        cost[start:stop] = np.take_along_axis(minutes, top, axis=1)
+    return idx, cost
+
+def auction(
+    idx: np.ndarray,
+    cost: np.ndarray,
+    capacity: np.ndarray,
+    eps: float = 0.01,
+    max_rounds: int = 100000
+) -> np.ndarray:
+    """Minimum-cost assignment of rows to capacitated columns over sparse candidates.
+
+    `idx`/`cost` are the n x k candidate lists from `candidate_costs`.
+    Returns the column for each row, or -1 where leaving the row
+    unassigned is cheaper than any slot still on offer. The result is
+    within n * eps of the optimum over the candidate pairs.
+    """
+    n, k = cost.shape
+    m = len(capacity)
+    assignment = np.full(n, -1, dtype=np.int64)
+    feasible = np.isfinite(cost)
+    if n == 0 or m == 0 or capacity.max() <= 0 or not feasible.any():
+        return assignment
+
+    max_cost = float(cost[feasible].max())
+    # Leaving a row unassigned is charged twice the worst feasible cost
+    dummy_value = -(2 * max_cost + 1)
+    values_base = np.where(feasible, -cost, -np.inf)
+
+    slots = int(capacity.max())
+    prices = np.zeros((m, slots), dtype=np.float64)
+    prices[np.arange(slots)[None, :] >= capacity[:, None]] = np.inf
+    rows = np.arange(n)
+
+    owner = np.full((m, slots), -1, dtype=np.int64)
+    settled = np.zeros(n, dtype=bool)
+    for _ in range(max_rounds):
+        bidders = rows[(assignment < 0) & ~settled]
+        if len(bidders) == 0:
+            break
+        cheapest_slot = prices.argmin(axis=1)
+        cheapest = prices[np.arange(m), cheapest_slot]
+
+        cand = idx[bidders]
+        values = values_base[bidders] - cheapest[cand]
+        best_k = values.argmax(axis=1)
+        r = np.arange(len(bidders))
+        best_value = values[r, best_k]
+        target = cand[r, best_k]
+        values[r, best_k] = -np.inf
+        # Slots of one volunteer are interchangeable, so the runner-up is
+        # another volunteer or nothing. Comparing against the same
+        # volunteer's next slot would make every bid an eps-sized step.
+        runner_up = np.maximum(values.max(axis=1), dummy_value)
+
+        # Prices only rise, so a row that prefers nothing now always will
+        give_up = best_value <= dummy_value
+        settled[bidders[give_up]] = True
+        keep = ~give_up
+        bidders, target = bidders[keep], target[keep]
+        bids = cheapest[target] + (best_value[keep] - runner_up[keep]) + eps
+
+        # Each volunteer sells its cheapest slot to the highest bidder this round
+        order = np.lexsort((-bids, target))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = target[order][1:] != target[order][:-1]
+        winners = order[first]
+        win_rows, win_cols, win_bids = bidders[winners], target[winners], bids[winners]
+        win_slots = cheapest_slot[win_cols]
+
+        outbid = owner[win_cols, win_slots]
+        assignment[outbid[outbid >= 0]] = -1
+        owner[win_cols, win_slots] = win_rows
+        prices[win_cols, win_slots] = win_bids
+        assignment[win_rows] = win_cols
+    return assignment
+
+def assign(
+    deliveries: Sequence[Dict[str, Any]],
+    volunteers: Sequence[Dict[str, Any]],
+    candidates: int = 32,
+    eps: float = 0.01
+) -> Dict[str, Any]:
+    """Assign open deliveries to volunteers.
+
+    Deliveries need `id`, `pickup_location` and optionally `trip_km`.
+    Volunteers need `user_id`, `location`, `transport_mode` and
+    `capacity` (free slots). Returns the chosen pairs with their travel
+    minutes, plus the ids left unassigned.
+    """
+    if not deliveries or not volunteers:
+        return {"pairs": [], "unassigned": [d["id"] for d in deliveries], "total_minutes": 0.0}
+
+    pickup_lat = np.array([d["pickup_location"]["lat"] for d in deliveries], dtype=np.float64)
+    pickup_lng = np.array([d["pickup_location"]["lng"] for d in deliveries], dtype=np.float64)
+    trip_km = np.array([d.get("trip_km") or 0.0 for d in deliveries], dtype=np.float64)
+    vol_lat = np.array([v["location"]["lat"] for v in volunteers], dtype=np.float64)
+    vol_lng = np.array([v["location"]["lng"] for v in volunteers], dtype=np.float64)
+    profiles = [mode_profile(v.get("transport_mode")) for v in volunteers]
+    speed = np.array([p[0] for p in profiles], dtype=np.float64)
+    reach = np.array([p[2] for p in profiles], dtype=np.float32)
+    capacity = np.array([v["capacity"] for v in volunteers], dtype=np.int64)
+
+    idx, cost = candidate_costs(pickup_lat, pickup_lng, trip_km, vol_lat, vol_lng, speed, reach, candidates)
+    assignment = auction(idx, cost, capacity, eps)
+
+    pairs: List[Dict[str, Any]] = []
+    unassigned: List[str] = []
+    for row, col in enumerate(assignment.tolist()):
+        if col < 0:
+            unassigned.append(deliveries[row]["id"])
+            continue
+        minutes = float(cost[row][idx[row] == col][0])
+        pairs.append({
+            "delivery_id": deliveries[row]["id"],
+            "volunteer_id": volunteers[col]["user_id"],
+            "minutes": round(minutes, 2),
+        })
+    return {
+        "pairs": pairs,
+        "unassigned": unassigned,
+        "total_minutes": round(sum(p["minutes"] for p in pairs), 2),
+    }
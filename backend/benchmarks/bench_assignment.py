@@ -0,0 +1,76 @@
+"""Benchmark batch assignment against greedy first-come-first-served dispatch.
+
+Deliveries and volunteers are scattered around a city centre, and
+volunteers get a mix of transport modes. The greedy baseline takes
+deliveries in random order, the way volunteers self-select today, and
+gives each one to the cheapest volunteer with room left. Both methods
+use the same candidate lists.
+
+Run from the backend directory:
+
+    python benchmarks/bench_assignment.py --sizes 1000x1000 5000x5000 5000x1000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from assignment import TRANSPORT_MODES, auction, candidate_costs, mode_profile  # noqa: E402
+
+def random_points(rng, n, center=(28.6139, 77.2090), spread=0.2):
+    """Points scattered around a city centre (New Delhi by default)."""
+    return center[0] + rng.uniform(-spread, spread, n), center[1] + rng.uniform(-spread, spread, n)
+
+def greedy(rng, idx, cost, capacity):
+    left = capacity.copy()
+    assignment = np.full(len(idx), -1)
+    for row in rng.permutation(len(idx)):
+        for k in np.argsort(cost[row]):
+            col = idx[row, k]
+            if np.isfinite(cost[row, k]) and left[col] > 0:
+                assignment[row] = col
+                left[col] -= 1
+                break
+    return assignment
+
+def summarize(assignment, idx, cost):
+    rows = np.flatnonzero(assignment >= 0)
+    picked = cost[rows, np.argmax(idx[rows] == assignment[rows, None], axis=1)]
+    return len(rows), float(picked.sum())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["1000x1000", "5000x5000", "5000x1000"])
+    parser.add_argument("--candidates", type=int, default=32)
+    args = parser.parse_args()
+    rng = np.random.default_rng(7)
+
+    print(f"{'deliveries x volunteers':>24} {'costs (s)':>9} {'auction (s)':>11} {'assigned':>9} "
+          f"{'avg min':>8} {'greedy assigned':>16} {'greedy avg min':>15}")
+    for size in args.sizes:
+        n, m = (int(v) for v in size.lower().split("x"))
+        lat, lng = random_points(rng, n)
+        vlat, vlng = random_points(rng, m)
+        trip_km = rng.uniform(1, 8, n)
+        profiles = [mode_profile(mode) for mode in rng.choice(list(TRANSPORT_MODES), m)]
+        speed = np.array([p[0] for p in profiles])
+        capacity = np.array([p[1] for p in profiles])
+        reach = np.array([p[2] for p in profiles], dtype=np.float32)
+
+        start = time.perf_counter()
+        idx, cost = candidate_costs(lat, lng, trip_km, vlat, vlng, speed, reach, args.candidates)
+        costs_s = time.perf_counter() - start
+        start = time.perf_counter()
+        assigned, minutes = summarize(auction(idx, cost, capacity), idx, cost)
+        auction_s = time.perf_counter() - start
+        g_assigned, g_minutes = summarize(greedy(rng, idx, cost, capacity), idx, cost)
+
+        print(f"{size:>24} {costs_s:>9.2f} {auction_s:>11.2f} {assigned:>9,} {minutes / max(assigned, 1):>8.1f} "
+              f"{g_assigned:>16,} {g_minutes / max(g_assigned, 1):>15.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark the in-memory dispatch index against a brute-force NumPy scan.
+
+Open deliveries are scattered around a city centre. For each size, this
+reports the build time, k-nearest and radius query latency, and the latency
+of ranking every point with the distance matrix, which is what the index
+replaces. The index results are checked against the scan.
+
+Run from the backend directory:
+
+    python benchmarks/bench_dispatch_index.py --sizes 10000 100000 1000000
+"""
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dispatch_index import DispatchIndex  # noqa: E402
+from distance import haversine_matrix  # noqa: E402
+
+def random_points(rng, n, center=(28.6139, 77.2090), spread=0.5):
+    """Points scattered around a city centre (New Delhi by default)."""
+    return center[0] + rng.uniform(-spread, spread, n), center[1] + rng.uniform(-spread, spread, n)
+
+def timed_us(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(*q)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--precision", type=int, default=6)
+    parser.add_argument("--memory", action="store_true", help="measure index memory with tracemalloc (slow)")
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+
+    print(f"{'open':>10} {'build (s)':>10} {'MiB':>7} {'knn p50/p99 (us)':>18} "
+          f"{'radius p50/p99 (us)':>20} {'scan p50 (us)':>14} {'agree':>6}")
+    for n in args.sizes:
+        lat, lng = random_points(rng, n)
+        ids = [f"d{i}" for i in range(n)]
+        index = DispatchIndex(args.precision)
+
+        if args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        index.load(zip(ids, lat.tolist(), lng.tolist()))
+        build_s = time.perf_counter() - start
+        mib = "-"
+        if args.memory:
+            mib = f"{tracemalloc.get_traced_memory()[0] / 2**20:.0f}"
+            tracemalloc.stop()
+
+        qlat, qlng = random_points(rng, args.queries, spread=0.4)
+        queries = list(zip(qlat.tolist(), qlng.tolist()))
+        knn = timed_us(lambda a, b: index.nearest(a, b, args.k), queries)
+        radius = timed_us(lambda a, b: index.within(a, b, args.radius_km), queries)
+
+        def scan(a, b):
+            d = haversine_matrix([a], [b], lat, lng)[0]
+            top = np.argpartition(d, args.k)[:args.k]
+            return top[np.argsort(d[top])]
+        scan_us = timed_us(scan, queries[:50])
+
+        agree = all(
+            [ids[i] for i in scan(a, b)] == [i for _, i in index.nearest(a, b, args.k)]
+            for a, b in queries[:20]
+        )
+        print(f"{n:>10,} {build_s:>10.2f} {mib:>7} {knn[0]:>8.0f} / {knn[1]:<7.0f} "
+              f"{radius[0]:>9.0f} / {radius[1]:<8.0f} {scan_us[0]:>14.0f} {str(agree):>6}")
+
+if __name__ == "__main__":
+    main()
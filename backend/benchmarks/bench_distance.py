@@ -0,0 +1,58 @@
+"""Compare the scalar haversine loop with the batched NumPy distance matrix.
+
+Run from the backend directory:
+
+    python benchmarks/bench_distance.py --sizes 100x100 1000x1000 5000x2000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from distance import haversine, haversine_matrix  # noqa: E402
+
+def random_points(rng, n, center=(28.6139, 77.2090), spread=0.3):
+    """Points scattered around a city centre (New Delhi by default)."""
+    return center[0] + rng.uniform(-spread, spread, n), center[1] + rng.uniform(-spread, spread, n)
+
+def bench_loop(lat1, lng1, lat2, lng2):
+    """The per-row pattern the endpoints used before: one haversine call per pair."""
+    lat1, lng1, lat2, lng2 = (a.tolist() for a in (lat1, lng1, lat2, lng2))
+    out = []
+    for i in range(len(lat1)):
+        out.append([haversine(lat1[i], lng1[i], lat2[j], lng2[j]) for j in range(len(lat2))])
+    return np.array(out)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["100x100", "500x500", "1000x1000"])
+    parser.add_argument("--max-loop-pairs", type=int, default=2_000_000,
+                        help="skip the scalar loop above this many pairs")
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+    
+    print(f"{'size':>12} {'pairs':>12} {'loop (s)':>10} {'matrix (s)':>11} {'speedup':>8} {'max err (m)':>12}")
+    for size in args.sizes:
+        n, m = (int(v) for v in size.lower().split("x"))
+        lat1, lng1 = random_points(rng, n)
+        lat2, lng2 = random_points(rng, m)
+        
+        start = time.perf_counter()
+        matrix = haversine_matrix(lat1, lng1, lat2, lng2)
+        matrix_s = time.perf_counter() - start
+        
+        if n * m <= args.max_loop_pairs:
+            start = time.perf_counter()
+            looped = bench_loop(lat1, lng1, lat2, lng2)
+            loop_s = time.perf_counter() - start
+            err_m = float(np.abs(looped - matrix).max()) * 1000
+            print(f"{size:>12} {n * m:>12,} {loop_s:>10.4f} {matrix_s:>11.4f} {loop_s / matrix_s:>7.1f}x {err_m:>12.6f}")
+        else:
+            print(f"{size:>12} {n * m:>12,} {'skipped':>10} {matrix_s:>11.4f} {'-':>8} {'-':>12}")
+
+if __name__ == "__main__":
+    main()
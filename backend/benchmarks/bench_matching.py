@@ -0,0 +1,90 @@
+"""Benchmark donor matching: latitude-slab candidates against scoring every donor.
+
+Donor profiles are scattered over a region of several cities, with random
+histories. For each size this reports the time to build the matcher, the
+latency of a top-k query, and the latency of scoring every donor and
+taking the top k. It also reports how often the two give the same top k.
+They can differ when a distant donor's history outweighs the proximity
+of the donors inside the search radius.
+
+Run from the backend directory:
+
+    python benchmarks/bench_matching.py --sizes 10000 100000
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from matching import FOOD_CONDITIONS, FOOD_TYPE_CONDITIONS, DonorMatcher  # noqa: E402
+
+def random_profiles(rng, n, center=(28.6139, 77.2090), spread=1.5):
+    """Donor profiles around a city centre (New Delhi by default)"""
+    now = time.time()
+    lat = center[0] + rng.uniform(-spread, spread, n)
+    lng = center[1] + rng.uniform(-spread, spread, n)
+    counts = rng.geometric(0.3, n)
+    conditions = rng.multinomial(1, [1 / len(FOOD_CONDITIONS)] * len(FOOD_CONDITIONS), size=n) * counts[:, None]
+    last = now - rng.exponential(30 * 86400, n)
+    return [{
+        "_id": f"donor{i}",
+        "lat": float(lat[i]),
+        "lng": float(lng[i]),
+        "fulfillments": int(counts[i]),
+        "quantity": int(counts[i] * 20),
+        "last_at": float(last[i]),
+        **{c: int(conditions[i, j]) for j, c in enumerate(FOOD_CONDITIONS)},
+    } for i in range(n)]
+
+def timed_us(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(*q)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=25.0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(5)
+
+    print(f"{'donors':>8} {'build (s)':>10} {'top-k p50/p99 (us)':>20} {'scan p50/p99 (us)':>19} {'same top-k':>11}")
+    for n in args.sizes:
+        profiles = random_profiles(rng, n)
+        start = time.perf_counter()
+        matcher = DonorMatcher(profiles)
+        build_s = time.perf_counter() - start
+
+        qlat = 28.6139 + rng.uniform(-1.2, 1.2, args.queries)
+        qlng = 77.2090 + rng.uniform(-1.2, 1.2, args.queries)
+        types = rng.choice(list(FOOD_TYPE_CONDITIONS), args.queries)
+        queries = list(zip(qlat.tolist(), qlng.tolist(), types.tolist()))
+        now = time.time()
+
+        def top(a, b, food_type):
+            return [m["donor_id"] for m in matcher.top(a, b, food_type, args.k, args.radius_km, now=now)]
+
+        def scan(a, b, food_type):
+            scores = matcher.score(np.arange(len(matcher)), a, b, food_type, now)["score"]
+            best = np.argpartition(-scores, args.k - 1)[:args.k]
+            return matcher.ids[best[np.argsort(-scores[best], kind="stable")]].tolist()
+
+        top_us = timed_us(top, queries)
+        scan_us = timed_us(scan, queries[:100])
+        same = sum(top(*q) == scan(*q) for q in queries) / len(queries)
+        print(f"{n:>8,} {build_s:>10.2f} {top_us[0]:>9.0f} / {top_us[1]:<8.0f} "
+              f"{scan_us[0]:>8.0f} / {scan_us[1]:<8.0f} {same:>10.0%}")
+
+if __name__ == "__main__":
+    main()
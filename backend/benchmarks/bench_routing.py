@@ -0,0 +1,95 @@
+"""Benchmark multi-stop route planning against one-at-a-time deliveries.
+
+Each trial places a volunteer in a city centre with open deliveries
+around them. Deliveries have mixed food conditions, and some become
+available later. The planner may add any delivery, and the run is
+capped at `--hours`. The baseline is how volunteers work today: go to
+the nearest delivery that is still good to take, drop it off, and
+repeat until the time is up. Reported per volunteer-hour, along with
+the planner's latency.
+
+Run from the backend directory:
+
+    python benchmarks/bench_routing.py --sizes 10 25 50 --modes bike car
+"""
+import argparse
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from assignment import mode_profile  # noqa: E402
+from routing import SERVICE_MINUTES, RoutingProblem, SHELF_LIFE_MINUTES, plan_route  # noqa: E402
+
+def random_jobs(rng, n, center=(28.6139, 77.2090), spread=0.05):
+    """Open deliveries around a city centre (New Delhi by default)"""
+    def point():
+        return {"lat": center[0] + rng.uniform(-spread, spread), "lng": center[1] + rng.uniform(-spread, spread)}
+    return [{
+        "id": f"d{i}",
+        "pickup": point(),
+        "dropoff": point(),
+        "ready_minutes": float(rng.choice([0.0, 0.0, 30.0, 60.0])),
+        "shelf_life_minutes": SHELF_LIFE_MINUTES[rng.choice(list(SHELF_LIFE_MINUTES))],
+        "required": False,
+    } for i in range(n)]
+
+def one_at_a_time(problem, horizon):
+    """Nearest-first single deliveries; returns (delivered, minutes)"""
+    t, at, left, done = 0.0, 0, set(range(len(problem.jobs))), 0
+    while left:
+        options = []
+        for j in left:
+            pick = max(t + problem.travel[at][problem.pickup(j)], problem.ready[j]) + problem.service
+            drop = pick + problem.travel[problem.pickup(j)][problem.dropoff(j)]
+            if drop - (pick - problem.service) <= problem.max_ride[j] and drop + problem.service <= horizon:
+                options.append((pick, j, drop + problem.service))
+        if not options:
+            break
+        _, j, t = min(options)
+        at = problem.dropoff(j)
+        left.discard(j)
+        done += 1
+    return done, t
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 25, 50])
+    parser.add_argument("--modes", nargs="+", default=["bike", "car"])
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--budget-ms", type=float, default=200.0)
+    parser.add_argument("--hours", type=float, default=4.0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(11)
+    horizon = args.hours * 60
+
+    print(f"{'mode':>5} {'open':>5} {'plan p50/max (ms)':>18} {'routed/h':>9} {'min/delivery':>13} "
+          f"{'single/h':>9} {'single min/delivery':>20}")
+    for mode in args.modes:
+        speed, capacity, _ = mode_profile(mode)
+        for n in args.sizes:
+            latency, routed, routed_min, single, single_min = [], 0, 0.0, 0, 0.0
+            for _ in range(args.trials):
+                jobs = random_jobs(rng, n)
+                start = {"lat": 28.6139, "lng": 77.2090}
+                began = time.perf_counter()
+                plan = plan_route(start, jobs, speed, capacity, budget_ms=args.budget_ms,
+                                  max_minutes=horizon, max_added_minutes=math.inf)
+                latency.append((time.perf_counter() - began) * 1000)
+                routed += len(plan["deliveries"])
+                routed_min += plan["total_minutes"]
+                done, minutes = one_at_a_time(RoutingProblem(start, jobs, speed, capacity, SERVICE_MINUTES), horizon)
+                single += done
+                single_min += minutes
+            hours = args.trials * args.hours
+            print(f"{mode:>5} {n:>5} {statistics.median(latency):>8.1f} / {max(latency):<7.1f} "
+                  f"{routed / hours:>9.2f} {routed_min / max(routed, 1):>13.1f} "
+                  f"{single / hours:>9.2f} {single_min / max(single, 1):>20.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark rule-based urgency scoring of every open request in one pass.
+
+Open requests and donors are scattered around a city centre. For each
+size this reports the time for `rescore_by_rules`, including NGO backlog
+and donor density, against scoring the same requests one at a time with
+`heuristic_score`.
+
+Run from the backend directory:
+
+    python benchmarks/bench_urgency.py --sizes 1000 10000 100000
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from matching import FOOD_CONDITIONS, DonorMatcher  # noqa: E402
+from urgency import FOOD_TYPE_BONUS, URGENCY_LEVEL_BASE, heuristic_score, rescore_by_rules  # noqa: E402
+
+def random_requests(rng, n, now, center=(28.6139, 77.2090), spread=0.3):
+    lat = center[0] + rng.uniform(-spread, spread, n)
+    lng = center[1] + rng.uniform(-spread, spread, n)
+    quantity = rng.integers(10, 500, n)
+    levels, types = list(URGENCY_LEVEL_BASE), list(FOOD_TYPE_BONUS)
+    return [{
+        "id": f"r{i}",
+        "ngo_id": f"ngo{rng.integers(0, max(n // 20, 1))}",
+        "location": {"lat": float(lat[i]), "lng": float(lng[i])},
+        "urgency_level": levels[rng.integers(0, len(levels))],
+        "food_type": types[rng.integers(0, len(types))],
+        "quantity": int(quantity[i]),
+        "fulfilled_quantity": int(rng.integers(0, quantity[i])),
+        "created_at": (now - timedelta(hours=float(rng.uniform(0, 72)))).isoformat(),
+        "expires_at": (now + timedelta(hours=float(rng.uniform(-2, 48)))).isoformat() if rng.random() < 0.7 else None,
+    } for i in range(n)]
+
+def random_donors(rng, n, center=(28.6139, 77.2090), spread=0.3):
+    lat = center[0] + rng.normal(0, spread / 2, n)
+    lng = center[1] + rng.normal(0, spread / 2, n)
+    return [{"_id": f"d{i}", "lat": float(lat[i]), "lng": float(lng[i]), "fulfillments": 1,
+             FOOD_CONDITIONS[0]: 1} for i in range(n)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--donors", type=int, default=20_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(3)
+    now = datetime.now(timezone.utc)
+    matcher = DonorMatcher(random_donors(rng, args.donors))
+
+    print(f"{'open':>8} {'vectorised (ms)':>16} {'per request (ms)':>17} {'speedup':>8}")
+    for n in args.sizes:
+        requests = random_requests(rng, n, now)
+        start = time.perf_counter()
+        rescore_by_rules(requests, matcher.nearby_counts, now)
+        vector_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for request in requests:
+            heuristic_score(request, now)
+        loop_ms = (time.perf_counter() - start) * 1000
+        print(f"{n:>8,} {vector_ms:>16.1f} {loop_ms:>17.1f} {loop_ms / vector_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
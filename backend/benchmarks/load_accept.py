@@ -0,0 +1,56 @@
+"""Fire many concurrent claims at one delivery and check that exactly one wins.
+
+Runs `claim_delivery` from server.py directly against a real MongoDB, in a
+scratch database, with a distinct volunteer id for every attempt:
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/load_accept.py --concurrency 500 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+async def contend(server, delivery_id: str, concurrency: int) -> int:
+    volunteers = [f"load-volunteer-{uuid.uuid4()}" for _ in range(concurrency)]
+    results = await asyncio.gather(*(server.claim_delivery(delivery_id, v) for v in volunteers))
+    winners = [v for v, previous in zip(volunteers, results) if previous is not None]
+    stored = await server.db.deliveries.find_one({"id": delivery_id}, {"_id": 0, "volunteer_id": 1})
+    assert len(winners) == 1, f"{len(winners)} volunteers won delivery {delivery_id}"
+    assert stored["volunteer_id"] == winners[0], "stored volunteer does not match the winner"
+    return len(winners)
+
+async def run(server, args):
+    try:
+        latencies = []
+        for _ in range(args.rounds):
+            delivery_id = str(uuid.uuid4())
+            await server.db.deliveries.insert_one({"id": delivery_id, "status": "pending", "volunteer_id": None})
+            start = time.perf_counter()
+            await contend(server, delivery_id, args.concurrency)
+            latencies.append(time.perf_counter() - start)
+        print(f"{args.rounds} rounds x {args.concurrency} concurrent claims: exactly one winner each time")
+        print(f"round wall time: min {min(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+    finally:
+        await server.client.drop_database(args.db)
+        server.client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=300, help="claims fired at each delivery")
+    parser.add_argument("--rounds", type=int, default=10, help="deliveries to contend for")
+    parser.add_argument("--db", default="smartplate_load_accept", help="scratch database (dropped afterwards)")
+    args = parser.parse_args()
+
+    # server.py reads DB_NAME when imported, so the import waits for the arguments
+    os.environ["DB_NAME"] = args.db
+    import server
+
+    asyncio.run(run(server, args))
+
+if __name__ == "__main__":
+    main()
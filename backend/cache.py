@@ -0,0 +1,276 @@
+"""Caches shared by the API handlers.
+
+`TTLCache` is a bounded in-process LRU with expiry, used for authenticated
+users. `ResponseCache` caches whole JSON responses for public endpoints. It
+serves stale entries while one task revalidates them, and it coalesces
+concurrent recomputations. Its storage is pluggable: `MemoryResponseBackend`
+lives in the worker, and `MongoResponseBackend` is shared by every worker.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire `ttl` seconds after being stored.
+
+    Not thread-safe; it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Bumped on every invalidation so a fetch that raced with a write
+        # does not put the stale value back (see `set`).
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, generation: Optional[int] = None, ttl: Optional[float] = None) -> None:
+        """Store a value; skipped if `generation` is given and an invalidation happened since.
+
+        `ttl` overrides the cache-wide expiry for this entry.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0
+        }
+
+class MemoryResponseBackend:
+    """Response cache storage local to this worker."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = 1000):
+        self._entries = TTLCache(maxsize=maxsize)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, entry: Dict[str, Any], expire_seconds: float) -> None:
+        self._entries.set(key, entry, ttl=expire_seconds)
+
+    async def delete(self, key: str) -> None:
+        self._entries.invalidate(key)
+
+    async def acquire(self, key: str, lease_seconds: float) -> Optional[str]:
+        # Recomputations are already coalesced within the worker
+        return self.name
+
+    async def release(self, key: str, token: str) -> None:
+        pass
+
+class MongoResponseBackend:
+    """Response cache storage in a Mongo collection shared by every worker.
+
+    The collection needs a unique index on `key` and a TTL index on
+    `expires_at`. A lease document, `lock:<key>`, makes sure only one worker
+    recomputes a given entry at a time. The lease records a token naming
+    its holder, so a worker can only release a lease it still holds.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        doc = await self.collection.find_one({"key": key}, {"_id": 0, "entry": 1})
+        return doc["entry"] if doc else None
+
+    async def set(self, key: str, entry: Dict[str, Any], expire_seconds: float) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=expire_seconds)
+        await self.collection.update_one(
+            {"key": key}, {"$set": {"entry": entry, "expires_at": expires_at}}, upsert=True
+        )
+
+    async def delete(self, key: str) -> None:
+        await self.collection.delete_one({"key": key})
+
+    async def acquire(self, key: str, lease_seconds: float) -> Optional[str]:
+        """Take the recompute lease for `key`; returns its token, or None if another worker holds it"""
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        lock = {"key": f"lock:{key}", "owner": token, "expires_at": now + timedelta(seconds=lease_seconds)}
+        try:
+            await self.collection.insert_one({**lock})
+            return token
+        except DuplicateKeyError:
+            pass
+        # The TTL monitor only runs once a minute, so clear a lapsed lease ourselves
+        result = await self.collection.delete_one({"key": lock["key"], "expires_at": {"$lt": now}})
+        if not result.deleted_count:
+            return None
+        try:
+            await self.collection.insert_one({**lock})
+            return token
+        except DuplicateKeyError:
+            return None
+
+    async def release(self, key: str, token: str) -> None:
+        # A lease that lapsed and was taken over belongs to its new holder
+        await self.collection.delete_one({"key": f"lock:{key}", "owner": token})
+
+class ResponseCache:
+    """Stale-while-revalidate JSON response cache with single-flight recomputation.
+
+    Each entry is fresh for `ttl` seconds, then served stale for another
+    `stale_ttl` seconds while one background task recomputes it. Concurrent
+    misses for the same key share one recomputation within a worker. The
+    backend's lease keeps recomputation to one worker when the backend is
+    shared: the others serve the stale entry if there is one, and otherwise
+    wait for the holder's result. They only compute themselves once the
+    holder gives the lease up or it expires.
+    """
+
+    LEASE_SECONDS = 30
+    # How often a worker without the lease checks for the holder's result
+    LEASE_POLL_SECONDS = 0.05
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.recomputes = 0
+        self.coalesced = 0
+        # Entries another worker computed while this one waited on its lease
+        self.shared = 0
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float) -> Dict[str, Any]:
+        """Return the cache entry for `key` ({body, etag, ...}), computing it if needed."""
+        entry = await self.backend.get(key)
+        now = time.time()
+        if entry is not None:
+            if now < entry["fresh_until"]:
+                self.hits += 1
+                return entry
+            if now < entry["stale_until"]:
+                self.stale_hits += 1
+                self._refresh(key, compute, ttl, stale_ttl)
+                return entry
+        self.misses += 1
+        # Shielded so a disconnecting client does not cancel the shared recomputation
+        return await asyncio.shield(self._refresh(key, compute, ttl, stale_ttl))
+
+    async def invalidate(self, key: str) -> None:
+        await self.backend.delete(key)
+
+    def _refresh(self, key: str, compute, ttl: float, stale_ttl: float) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._recompute(key, compute, ttl, stale_ttl))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Response cache recompute for {key} failed: {task.exception()}")
+
+    async def _recompute(self, key: str, compute, ttl: float, stale_ttl: float) -> Dict[str, Any]:
+        token, entry = await self._lease_or_entry(key)
+        if entry is not None:
+            self.shared += 1
+            return entry
+        try:
+            self.recomputes += 1
+            body = json.dumps(await compute(), default=str, separators=(",", ":"))
+            now = time.time()
+            entry = {
+                "body": body,
+                "etag": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+                "fresh_until": now + ttl,
+                "stale_until": now + ttl + stale_ttl
+            }
+            await self.backend.set(key, entry, ttl + stale_ttl)
+            return entry
+        finally:
+            await self.backend.release(key, token)
+
+    async def _lease_or_entry(self, key: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Take the recompute lease, or an entry that makes recomputing unnecessary.
+
+        Returns (token, None) once this worker holds the lease, or
+        (None, entry) when another worker's entry can be served: a fresh one,
+        or a stale one while that worker refreshes it. With no entry to serve
+        this keeps waiting. The lease is free again once its holder releases
+        it or it expires, LEASE_SECONDS after being taken.
+        """
+        while True:
+            token = await self.backend.acquire(key, self.LEASE_SECONDS)
+            entry = await self.backend.get(key)
+            now = time.time()
+            if token is not None:
+                if entry is not None and now < entry["fresh_until"]:
+                    # The previous holder finished just before we got the lease
+                    await self.backend.release(key, token)
+                    return None, entry
+                return token, None
+            if entry is not None and now < entry["stale_until"]:
+                return None, entry
+            await asyncio.sleep(self.LEASE_POLL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "recomputes": self.recomputes,
+            "coalesced": self.coalesced,
+            "shared": self.shared,
+            "inflight": len(self._inflight)
+        }
@@ -0,0 +1,258 @@
+"""In-memory spatial index of open deliveries, used to find nearby work.
+
+Pickups are bucketed into a grid whose cells are geohash cells: the
+world is split into 2^lat_bits rows and 2^lng_bits columns, with
+`precision` base-32 characters' worth of bits. At the default precision
+of 6, a cell is about 0.6 km by 1.2 km at the equator. A cell is keyed by
+its row and column, not by the geohash string, so finding neighbours is
+simple arithmetic. Columns wrap at the antimeridian.
+
+`nearest` searches rings of cells outward from the query point. It stops
+once the k-th best candidate is closer than anything that could still lie
+outside the searched rings. The bound it uses is exact on the sphere, so
+results match a brute-force scan. `within` is the same search with no k
+and a distance cutoff.
+
+The index belongs to one worker. It is only useful while a change stream
+feeds the live feed's event bus, since otherwise a worker never hears
+about writes made on other workers. The server therefore loads it from
+MongoDB when the stream opens, keeps it current from the bus, checks it
+against the database periodically (see `diff`), and unloads it when the
+stream goes away.
+"""
+import math
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from distance import EARTH_RADIUS_KM
+
+class Entry:
+    __slots__ = ("id", "lat", "lng", "rlat", "rlng", "cos_lat", "cell")
+
+    def __init__(self, delivery_id: str, lat: float, lng: float, rlat: float, rlng: float, cos_lat: float, cell: Tuple[int, int]):
+        self.id = delivery_id
+        self.lat = lat
+        self.lng = lng
+        self.rlat = rlat
+        self.rlng = rlng
+        self.cos_lat = cos_lat
+        self.cell = cell
+
+@lru_cache(maxsize=256)
+def ring_offsets(ring: int) -> Tuple[Tuple[int, int], ...]:
+    """(row, col) offsets of the cells exactly `ring` cells away"""
+    if ring == 0:
+        return ((0, 0),)
+    span = range(-ring, ring + 1)
+    offsets = [(dr, dc) for dr in (-ring, ring) for dc in span]
+    offsets += [(dr, dc) for dc in (-ring, ring) for dr in range(-ring + 1, ring)]
+    return tuple(offsets)
+
+class DispatchIndex:
+    def __init__(self, precision: int = 6):
+        bits = 5 * precision
+        self.precision = precision
+        self.rows = 1 << (bits // 2)
+        self.cols = 1 << (bits - bits // 2)
+        self.cell_lat = 180.0 / self.rows
+        self.cell_lng = 360.0 / self.cols
+        self._entries: Dict[str, Entry] = {}
+        self._cells: Dict[Tuple[int, int], Dict[str, Entry]] = {}
+        # Set once the index holds every open delivery; until then callers use MongoDB
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, delivery_id: str) -> bool:
+        return delivery_id in self._entries
+
+    def cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = min(int((lat + 90.0) / self.cell_lat), self.rows - 1)
+        col = int(((lng + 180.0) % 360.0) / self.cell_lng) % self.cols
+        return row, col
+
+    def upsert(self, delivery_id: str, lat: float, lng: float) -> None:
+        entry = self._entries.get(delivery_id)
+        if entry is not None:
+            if entry.lat == lat and entry.lng == lng:
+                return
+            self.remove(delivery_id)
+        rlat = math.radians(lat)
+        self._insert(Entry(delivery_id, lat, lng, rlat, math.radians(lng), math.cos(rlat), self.cell_of(lat, lng)))
+
+    def _insert(self, entry: Entry) -> None:
+        self._entries[entry.id] = entry
+        self._cells.setdefault(entry.cell, {})[entry.id] = entry
+
+    def remove(self, delivery_id: str) -> bool:
+        entry = self._entries.pop(delivery_id, None)
+        if entry is None:
+            return False
+        bucket = self._cells[entry.cell]
+        del bucket[delivery_id]
+        if not bucket:
+            del self._cells[entry.cell]
+        return True
+
+    def load(self, points: Iterable[Tuple[str, float, float]]) -> None:
+        """Replace the contents with (id, lat, lng) triples and mark the index ready"""
+        self._entries.clear()
+        self._cells.clear()
+        points = list(points)
+        if points:
+            ids = [p[0] for p in points]
+            lat = np.array([p[1] for p in points], dtype=np.float64)
+            lng = np.array([p[2] for p in points], dtype=np.float64)
+            # Same arithmetic as cell_of, done for every point at once
+            rows = np.minimum(((lat + 90.0) / self.cell_lat).astype(np.int64), self.rows - 1)
+            cols = (((lng + 180.0) % 360.0) / self.cell_lng).astype(np.int64) % self.cols
+            rlat, rlng = np.radians(lat), np.radians(lng)
+            columns = (lat.tolist(), lng.tolist(), rlat.tolist(), rlng.tolist(), np.cos(rlat).tolist(), rows.tolist(), cols.tolist())
+            for delivery_id, a, b, ra, rb, c, row, col in zip(ids, *columns):
+                if delivery_id in self._entries:
+                    self.remove(delivery_id)
+                self._insert(Entry(delivery_id, a, b, ra, rb, c, (row, col)))
+        self.ready = True
+
+    def unload(self) -> None:
+        """Drop every entry and mark the index not ready"""
+        self._entries.clear()
+        self._cells.clear()
+        self.ready = False
+
+    def location(self, delivery_id: str) -> Optional[Tuple[float, float]]:
+        entry = self._entries.get(delivery_id)
+        return (entry.lat, entry.lng) if entry else None
+
+    def ids(self) -> Set[str]:
+        return set(self._entries)
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_km: Optional[float] = None,
+        after: Optional[Tuple[float, str]] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None
+    ) -> List[Tuple[float, str]]:
+        """The k closest entries as (km, id), nearest first, ties broken by id.
+
+        `after` skips everything up to and including that (km, id) pair,
+        which is how callers page. `bbox` (min_lat, min_lng, max_lat,
+        max_lng) drops entries outside the box.
+        """
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        rlat, rlng = math.radians(lat), math.radians(lng)
+        cos_lat = math.cos(rlat)
+        row0, col0 = self.cell_of(lat, lng)
+        cells_by_key, n_cols = self._cells, self.cols
+        found: List[Tuple[float, str]] = []
+        limit = math.inf if max_km is None else max_km
+        # Compare haversine's inner term instead of km until a hit is kept
+        limit_a = sin(min(limit / EARTH_RADIUS_KM, math.pi) / 2) ** 2
+        brute_force_after = 4 * len(cells_by_key) + 64
+        visited_cells = 0
+        ring = 0
+        while True:
+            offsets = ring_offsets(ring)
+            visited_cells += len(offsets)
+            if visited_cells > brute_force_after:
+                # Sparse data far from the query: scanning the remaining
+                # occupied cells is cheaper than walking empty rings
+                cells = [c for c in cells_by_key if self._ring_of(row0, col0, c) >= ring]
+            elif 2 * ring + 1 > n_cols:
+                # Wrapped all the way round; offsets would repeat columns
+                cells = {(row0 + dr, (col0 + dc) % n_cols) for dr, dc in offsets}
+            else:
+                cells = [(row0 + dr, (col0 + dc) % n_cols) for dr, dc in offsets]
+            for cell in cells:
+                bucket = cells_by_key.get(cell)
+                if not bucket:
+                    continue
+                for entry in bucket.values():
+                    if bbox is not None and not (bbox[0] <= entry.lat <= bbox[2] and bbox[1] <= entry.lng <= bbox[3]):
+                        continue
+                    a = sin((entry.rlat - rlat) / 2) ** 2 + cos_lat * entry.cos_lat * sin((entry.rlng - rlng) / 2) ** 2
+                    if a > limit_a:
+                        continue
+                    km = 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+                    if km > limit:
+                        continue
+                    key = (km, entry.id)
+                    if after is not None and key <= after:
+                        continue
+                    found.append(key)
+            if visited_cells > brute_force_after:
+                break
+            bound = self._outside_bound(lat, lng, row0, col0, ring)
+            if bound > limit:
+                break
+            if len(found) >= k:
+                found.sort()
+                del found[k:]
+                if found[-1][0] <= bound:
+                    break
+                # Nothing farther than the current k-th best can make the cut
+                limit = found[-1][0]
+                limit_a = sin(min(limit / EARTH_RADIUS_KM, math.pi) / 2) ** 2
+            ring += 1
+        found.sort()
+        return found[:k]
+
+    def within(self, lat: float, lng: float, radius_km: float, **kwargs) -> List[Tuple[float, str]]:
+        """Every entry within `radius_km`, nearest first"""
+        return self.nearest(lat, lng, len(self._entries), max_km=radius_km, **kwargs)
+
+    def _ring_of(self, row0: int, col0: int, cell: Tuple[int, int]) -> int:
+        dc = abs(cell[1] - col0)
+        return max(abs(cell[0] - row0), min(dc, self.cols - dc))
+
+    def _outside_bound(self, lat: float, lng: float, row0: int, col0: int, ring: int) -> float:
+        """Lower bound, in km, on the distance to any cell beyond `ring`"""
+        low_lat = -90.0 + (row0 - ring) * self.cell_lat
+        high_lat = -90.0 + (row0 + ring + 1) * self.cell_lat
+        lat_gap = math.inf
+        if low_lat > -90.0:
+            lat_gap = lat - low_lat
+        if high_lat < 90.0:
+            lat_gap = min(lat_gap, high_lat - lat)
+        if 2 * ring + 1 >= self.cols:
+            return EARTH_RADIUS_KM * math.radians(lat_gap) if lat_gap != math.inf else math.inf
+        lng_in_cell = (lng + 180.0) % 360.0 - col0 * self.cell_lng
+        lng_gap = min(ring * self.cell_lng + lng_in_cell, (ring + 1) * self.cell_lng - lng_in_cell)
+        # Distance from the point to the meridian `lng_gap` degrees away;
+        # everything past that meridian is farther. Past 90 degrees the
+        # nearest point of such a meridian is the pole.
+        if lng_gap >= 90.0:
+            lng_km = EARTH_RADIUS_KM * math.radians(90.0 - abs(lat))
+        else:
+            lng_km = EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(math.radians(lng_gap))))
+        return min(EARTH_RADIUS_KM * math.radians(lat_gap), lng_km)
+
+    def diff(self, points: Iterable[Tuple[str, float, float]]) -> Dict[str, List[str]]:
+        """Compare with the database's open deliveries given as (id, lat, lng)"""
+        missing, moved, seen = [], [], set()
+        for delivery_id, lat, lng in points:
+            seen.add(delivery_id)
+            entry = self._entries.get(delivery_id)
+            if entry is None:
+                missing.append(delivery_id)
+            elif entry.lat != lat or entry.lng != lng:
+                moved.append(delivery_id)
+        stale = [i for i in self._entries if i not in seen]
+        return {"missing": missing, "stale": stale, "moved": moved}
+
+    def stats(self) -> Dict[str, float]:
+        sizes = [len(b) for b in self._cells.values()]
+        return {
+            "ready": self.ready,
+            "entries": len(self._entries),
+            "cells": len(sizes),
+            "max_per_cell": max(sizes, default=0),
+            "precision": self.precision,
+            "cell_km": round(EARTH_RADIUS_KM * math.radians(self.cell_lat), 3),
+        }
@@ -0,0 +1,63 @@
+"""Great-circle distance helpers.
+
+`haversine` handles a single pair with plain floats and stays available as
+the scalar fallback. The NumPy functions compute whole batches at once:
+`haversine_matrix` for every origin/destination pair and
+`haversine_pairwise` for aligned arrays of pairs.
+"""
+from math import radians, cos, sin, asin, sqrt
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Calculate the great circle distance in km between two points."""
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return c * EARTH_RADIUS_KM
+
+def to_arrays(points: Sequence[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Split a sequence of {lat, lng} dicts into latitude and longitude arrays."""
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=len(points))
+    lng = np.fromiter((p["lng"] for p in points), dtype=np.float64, count=len(points))
+    return lat, lng
+
+def haversine_matrix(lat1, lng1, lat2, lng2, dtype=np.float64) -> np.ndarray:
+    """N x M matrix of distances in km between two point sets given in degrees.
+
+    Row i, column j is the distance from origin i to destination j. Pass
+    dtype=np.float32 to halve memory on very large matrices.
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=dtype))[:, None]
+    lng1 = np.radians(np.asarray(lng1, dtype=dtype))[:, None]
+    lat2 = np.radians(np.asarray(lat2, dtype=dtype))[None, :]
+    lng2 = np.radians(np.asarray(lng2, dtype=dtype))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2
+    a += np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    np.clip(a, 0, 1, out=a)
+    return (2 * EARTH_RADIUS_KM) * np.arcsin(np.sqrt(a, out=a), out=a)
+
+def haversine_pairwise(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Distances in km between aligned pairs (lat1[i], lng1[i]) -> (lat2[i], lng2[i])."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def distance_matrix(origins: Sequence[Dict[str, float]], destinations: Sequence[Dict[str, float]], dtype=np.float64) -> np.ndarray:
+    """N x M distance matrix in km between two lists of {lat, lng} dicts."""
+    lat1, lng1 = to_arrays(origins)
+    lat2, lng2 = to_arrays(destinations)
+    return haversine_matrix(lat1, lng1, lat2, lng2, dtype=dtype)
+
+def pickup_volunteer_matrix(deliveries: Sequence[Dict], volunteer_locations: Sequence[Dict[str, float]], dtype=np.float64) -> np.ndarray:
+    """Distances from each delivery's pickup (rows) to each volunteer position (columns)."""
+    return distance_matrix([d["pickup_location"] for d in deliveries], volunteer_locations, dtype=dtype)
+
+def donor_request_matrix(donor_locations: Sequence[Dict[str, float]], requests: Sequence[Dict], dtype=np.float64) -> np.ndarray:
+    """Distances from each donor position (rows) to each food request's location (columns)."""
+    return distance_matrix(donor_locations, [r["location"] for r in requests], dtype=dtype)
@@ -0,0 +1,229 @@
+"""Live change feed for food requests and deliveries.
+
+`EventBus` sends change events to the clients subscribed to this worker.
+Each event gets an id, and recent events are kept in a bounded ring buffer,
+so a client that reconnects with `Last-Event-ID` receives what it missed.
+Each subscriber has its own bounded queue. A subscriber that falls behind
+does not grow memory: its backlog is dropped and it receives a single
+`resync` event telling it to refetch.
+
+Events come from one of two sources. On a replica set, `watch_changes`
+tails a MongoDB change stream, which sees the writes of every worker. On a
+standalone server there are no change streams, so the API handlers publish
+their own writes, and a client only sees writes made through its worker.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Shapes the event for one subscriber, or returns None to skip it
+EventView = Callable[["Event"], Optional[Dict[str, Any]]]
+
+# Change stream errors that mean the stored resume token can no longer be used
+CHANGE_STREAM_HISTORY_LOST = 286
+CHANGE_STREAM_FATAL = 280
+
+class Event:
+    __slots__ = ("seq", "collection", "op", "doc")
+
+    def __init__(self, seq: int, collection: str, op: str, doc: Dict[str, Any]):
+        self.seq = seq
+        self.collection = collection
+        self.op = op
+        self.doc = doc
+
+RESYNC = Event(0, "resync", "resync", {})
+
+class Subscription:
+    def __init__(self, view: EventView, maxsize: int):
+        self.view = view
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self._lagging = False
+
+    def offer(self, event: Event) -> None:
+        """Queue an event without blocking the publisher"""
+        if self._lagging:
+            self.dropped += 1
+            return
+        if event is not RESYNC and self.view(event) is None:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client cannot keep up. Keep only a resync marker; the client
+            # refetches and the feed carries on from there.
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self._lagging = True
+
+    async def next(self, timeout: float) -> Optional[Event]:
+        """Next queued event, or None after `timeout` seconds of silence"""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is RESYNC:
+            self._lagging = False
+        return event
+
+class EventBus:
+    def __init__(self, history: int = 1000, queue_size: int = 256):
+        # Event ids are "<epoch>-<seq>". The epoch changes on every start,
+        # so an id from another worker or an earlier run is never trusted.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self.history: Deque[Event] = deque(maxlen=history)
+        self.subscribers: Set[Subscription] = set()
+        # Called synchronously with every event, e.g. to keep in-memory indexes current
+        self.listeners: List[Callable[[Event], None]] = []
+        # True while a change stream feeds the bus; handlers then do not publish
+        self.external = False
+        self._seq = 0
+        self.published = 0
+
+    def event_id(self, event: Event) -> str:
+        return f"{self.epoch}-{event.seq}"
+
+    def publish(self, collection: str, op: str, doc: Dict[str, Any]) -> Event:
+        self._seq += 1
+        event = Event(self._seq, collection, op, doc)
+        self.history.append(event)
+        self.published += 1
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Live feed listener failed: {e}")
+        for sub in self.subscribers:
+            sub.offer(event)
+        return event
+
+    def resync_all(self) -> None:
+        """Tell every subscriber to refetch, e.g. after the change stream lost its place"""
+        self.history.clear()
+        for sub in self.subscribers:
+            sub.offer(RESYNC)
+
+    def subscribe(self, view: EventView, last_event_id: Optional[str] = None) -> Subscription:
+        """Register a subscriber, replaying the events after `last_event_id` if still buffered"""
+        sub = Subscription(view, self.queue_size)
+        if last_event_id:
+            for event in self._replay(last_event_id):
+                sub.offer(event)
+        self.subscribers.add(sub)
+        return sub
+
+    def _replay(self, last_event_id: str) -> List[Event]:
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return [RESYNC]
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        if not self.history or self.history[0].seq > seq + 1:
+            # The events in between have left the ring buffer
+            return [RESYNC]
+        return [e for e in self.history if e.seq > seq]
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self.subscribers.discard(sub)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": "change_stream" if self.external else "in_process",
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "buffered": len(self.history),
+            "dropped": sum(s.dropped for s in self.subscribers),
+        }
+
+def format_sse(event_id: Optional[str], event: str, data: Any) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+async def sse_stream(bus: EventBus, sub: Subscription, heartbeat_seconds: float = 15.0) -> AsyncIterator[str]:
+    """Encode a subscription as Server-Sent Events until the client goes away"""
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield "retry: 3000\n\n"
+        while True:
+            event = await sub.next(heartbeat_seconds)
+            if event is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            if event is RESYNC:
+                yield format_sse(None, "resync", {})
+                continue
+            data = sub.view(event)
+            if data is not None:
+                yield format_sse(bus.event_id(event), event.collection, {"op": event.op, "doc": data})
+    finally:
+        bus.unsubscribe(sub)
+
+async def watch_changes(
+    db,
+    bus: EventBus,
+    collections: List[str],
+    fields: List[str],
+    retry_seconds: float = 5.0,
+    on_open: Optional[Callable[[], Awaitable[Any]]] = None
+) -> None:
+    """Feed `bus` from a change stream on `collections` until cancelled.
+
+    The last resume token is kept, so after a network error the stream
+    continues where it stopped. If the server says the stream cannot run,
+    the bus goes back to in-process publishing. `on_open` is awaited each
+    time the stream opens, before the bus is marked external. State that
+    was loaded before the stream existed can catch up there, since every
+    later write arrives through the stream.
+    """
+    pipeline = [
+        {"$match": {"ns.coll": {"$in": collections}, "operationType": {"$in": ["insert", "update", "replace"]}}},
+        {"$project": {"operationType": 1, "ns": 1, **{f"fullDocument.{f}": 1 for f in fields}}},
+    ]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                if on_open is not None:
+                    await on_open()
+                bus.external = True
+                logger.info("Live feed is following the MongoDB change stream")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    doc = change.get("fullDocument")
+                    if doc:
+                        doc.pop("_id", None)
+                        op = "insert" if change["operationType"] == "insert" else "update"
+                        bus.publish(change["ns"]["coll"], op, doc)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code in (CHANGE_STREAM_HISTORY_LOST, CHANGE_STREAM_FATAL):
+                logger.warning(f"Change stream lost its resume point, clients will resync: {e}")
+                resume_token = None
+                bus.resync_all()
+            else:
+                logger.warning(f"Change streams unavailable, publishing in process: {e}")
+                bus.external = False
+                return
+        except PyMongoError as e:
+            logger.warning(f"Change stream interrupted, retrying: {e}")
+        # Handlers publish while the stream is down so clients keep getting events
+        bus.external = False
+        await asyncio.sleep(retry_seconds)
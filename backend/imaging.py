@@ -0,0 +1,78 @@
+"""Image derivatives for uploaded photos and documents.
+
+`make_derivatives` is CPU-bound and runs in a process pool (see server.py).
+It writes no files: it takes the original bytes and returns the encoded
+variants. Every variant is re-encoded without EXIF. Any GPS position found
+in the original is returned separately so it can be kept as metadata.
+"""
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+from PIL import Image, ImageOps
+
+# Longest edge in pixels for each derivative size
+DERIVATIVE_SIZES = {"thumb": 256, "medium": 1280}
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+GPS_IFD = 0x8825
+
+class UnsupportedImage(ValueError):
+    """The input is not an image Pillow can decode."""
+
+def _to_degrees(value, ref) -> Optional[float]:
+    try:
+        degrees, minutes, seconds = (float(v) for v in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return -decimal if ref in ("S", "W") else decimal
+
+def extract_geo(image: Image.Image) -> Optional[Dict[str, float]]:
+    """Read the GPS position from an image's EXIF as {lat, lng}, if present."""
+    try:
+        gps = image.getexif().get_ifd(GPS_IFD)
+    except Exception:
+        return None
+    if not gps or 2 not in gps or 4 not in gps:
+        return None
+    lat = _to_degrees(gps[2], gps.get(1))
+    lng = _to_degrees(gps[4], gps.get(3))
+    if lat is None or lng is None:
+        return None
+    return {"lat": lat, "lng": lng}
+
+def make_derivatives(data: bytes) -> Dict[str, Any]:
+    """Build every size/format variant of an image.
+
+    Returns {"geo": {lat, lng} | None, "variants": {"thumb.webp": {...}, ...}}
+    where each variant carries its encoded `data`, `content_type`, `width`
+    and `height`. Raises UnsupportedImage when the input cannot be decoded.
+    """
+    try:
+        with Image.open(BytesIO(data)) as original:
+            geo = extract_geo(original)
+            # Apply the EXIF orientation before the tag is dropped
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image = image.convert("RGBA" if has_alpha else "RGB")
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        # Unknown formats, truncated files and oversized images all end up here
+        raise UnsupportedImage(str(e)) from None
+    
+    variants = {}
+    for size_name, max_edge in DERIVATIVE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        for ext, (pil_format, content_type, options) in FORMATS.items():
+            frame = resized.convert("RGB") if pil_format == "JPEG" and resized.mode != "RGB" else resized
+            out = BytesIO()
+            frame.save(out, pil_format, **options)
+            variants[f"{size_name}.{ext}"] = {
+                "data": out.getvalue(),
+                "content_type": content_type,
+                "width": frame.width,
+                "height": frame.height
+            }
+    return {"geo": geo, "variants": variants}
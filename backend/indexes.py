@@ -0,0 +1,316 @@
+"""Index declarations and query-plan diagnostics for the SmartPlate collections.
+
+`INDEXES` lists every index the API relies on. `ensure_indexes` creates them
+idempotently at startup. `QUERY_SHAPES` mirrors the filters, sorts and
+pipelines that server.py sends to Mongo. `verify_query_plans` explains each
+one and flags any shape whose winning plan falls back to a collection scan.
+
+Diagnostics can also be run from the command line:
+
+    python indexes.py --explain
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ASC = 1
+DESC = -1
+GEO = "2dsphere"
+
+# collection -> [(keys, options)]
+INDEXES: Dict[str, List[Tuple[List[Tuple[str, Any]], Dict[str, Any]]]] = {
+    "users": [
+        ([("id", ASC)], {"unique": True}),
+        ([("email", ASC)], {"unique": True}),
+        ([("role", ASC), ("is_verified", ASC)], {}),
+        ([("created_at", ASC), ("id", ASC)], {}),
+        ([("role", ASC), ("created_at", ASC), ("id", ASC)], {}),
+    ],
+    "ngo_verifications": [
+        ([("id", ASC)], {"unique": True}),
+        ([("user_id", ASC)], {"unique": True}),
+        ([("status", ASC), ("created_at", ASC)], {}),
+    ],
+    "volunteers": [
+        ([("id", ASC)], {"unique": True}),
+        ([("user_id", ASC)], {"unique": True}),
+        ([("status", ASC), ("created_at", ASC)], {}),
+        ([("status", ASC), ("last_location_at", ASC)], {}),
+    ],
+    "food_requests": [
+        ([("id", ASC)], {"unique": True}),
+        ([("ngo_id", ASC), ("created_at", DESC)], {}),
+        ([("status", ASC), ("created_at", DESC), ("id", DESC)], {}),
+        ([("created_at", DESC), ("id", DESC)], {}),
+        ([("location_geo", GEO), ("status", ASC)], {}),
+        ([("status", ASC), ("expires_at", ASC)], {}),
+        ([("status", ASC), ("receipt_confirmed_at", ASC)], {}),
+        ([("status", ASC), ("expired_at", ASC)], {}),
+    ],
+    "fulfillments": [
+        ([("id", ASC)], {"unique": True}),
+        ([("donor_id", ASC), ("created_at", DESC)], {}),
+        ([("request_id", ASC)], {}),
+    ],
+    "deliveries": [
+        ([("id", ASC)], {"unique": True}),
+        ([("request_id", ASC)], {}),
+        ([("volunteer_id", ASC), ("status", ASC)], {}),
+        ([("additional_volunteers", ASC)], {}),
+        ([("status", ASC), ("volunteer_id", ASC), ("created_at", ASC), ("id", ASC)], {}),
+        ([("created_at", ASC), ("id", ASC)], {}),
+        ([("pickup_geo", GEO), ("status", ASC), ("volunteer_id", ASC)], {}),
+        ([("status", ASC), ("claim_expires_at", ASC)], {}),
+        ([("status", ASC), ("stalled_at", ASC), ("picked_up_at", ASC)], {}),
+        ([("status", ASC), ("confirmed_at", ASC)], {}),
+    ],
+    # Archive store (ARCHIVE_STORE=mongo), read by id and by owner
+    "food_requests_archive": [
+        ([("id", ASC)], {"unique": True}),
+        ([("ngo_id", ASC), ("created_at", DESC)], {}),
+    ],
+    "fulfillments_archive": [
+        ([("id", ASC)], {"unique": True}),
+        ([("donor_id", ASC), ("created_at", DESC)], {}),
+    ],
+    "deliveries_archive": [
+        ([("id", ASC)], {"unique": True}),
+        ([("volunteer_id", ASC), ("created_at", DESC)], {}),
+        ([("additional_volunteers", ASC), ("created_at", DESC)], {}),
+    ],
+    # Segment manifest (ARCHIVE_STORE=segments)
+    "archive_segments": [
+        ([("id", ASC)], {"unique": True}),
+        ([("collection", ASC), ("owners", ASC), ("max_created_at", DESC)], {}),
+        ([("collection", ASC), ("ids", ASC)], {}),
+    ],
+    "admin_approvals": [
+        ([("id", ASC)], {"unique": True}),
+        ([("target_id", ASC), ("target_type", ASC), ("final_status", ASC)], {}),
+    ],
+    # One bucket per metric, period, city and start date (see rollups.py)
+    "analytics_rollups": [
+        ([("metric", ASC), ("period", ASC), ("city", ASC), ("start", ASC)], {"unique": True}),
+    ],
+    "uploads": [
+        ([("id", ASC)], {"unique": True}),
+    ],
+    "impact_summary": [
+        ([("id", ASC)], {"unique": True}),
+    ],
+    "scheduler_leases": [
+        ([("name", ASC)], {"unique": True}),
+    ],
+    "scheduler_jobs": [
+        ([("name", ASC)], {"unique": True}),
+    ],
+    "idempotency_keys": [
+        ([("scope", ASC), ("user_id", ASC), ("key", ASC)], {"unique": True}),
+        ([("created_at", ASC)], {"expireAfterSeconds": 24 * 3600}),
+    ],
+    # Shared response cache (RESPONSE_CACHE_BACKEND=mongo)
+    "response_cache": [
+        ([("key", ASC)], {"unique": True}),
+        ([("expires_at", ASC)], {"expireAfterSeconds": 0}),
+    ],
+}
+
+_NEAR = {"type": "Point", "coordinates": [77.2090, 28.6139]}
+
+# Query shapes issued by server.py. Values are placeholders; only the shape
+# matters to the planner. Each entry is explained as a find (filter/sort),
+# a count (count=True) or an aggregate (pipeline).
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"collection": "users", "filter": {"id": "x"}},
+    {"collection": "users", "filter": {"email": "x"}},
+    {"collection": "users", "filter": {"id": {"$in": ["x", "y"]}}},
+    {"collection": "users", "filter": {"role": "ngo"}, "count": True},
+    {"collection": "users", "filter": {"role": "ngo", "is_verified": True}, "count": True},
+    {"collection": "users", "filter": {"role": "donor"}},
+    {"collection": "ngo_verifications", "filter": {"id": "x"}},
+    {"collection": "ngo_verifications", "filter": {"user_id": "x"}},
+    {"collection": "ngo_verifications", "filter": {"status": "pending"}},
+    {"collection": "ngo_verifications", "filter": {"status": "approved"}},
+    {"collection": "volunteers", "filter": {"user_id": "x"}},
+    {"collection": "volunteers", "filter": {"status": "pending"}},
+    {"collection": "volunteers", "filter": {"status": "approved", "last_location_at": {"$gte": "x"}}},
+    {"collection": "food_requests", "filter": {"id": "x"}},
+    {"collection": "food_requests", "filter": {"id": "x", "ngo_id": "x"}},
+    {"collection": "food_requests", "filter": {"id": "x", "ngo_id": "x", "receipt_confirmed_at": None}},
+    {"collection": "food_requests", "filter": {"ngo_id": "x"}},
+    {"collection": "food_requests", "filter": {"status": {"$in": ["approved", "active"]}},
+     "sort": [("created_at", DESC), ("id", DESC)]},
+    {"collection": "food_requests", "filter": {"status": "fulfilled"}, "count": True},
+    {"collection": "food_requests", "pipeline": [{"$geoNear": {
+        "near": _NEAR, "key": "location_geo", "distanceField": "distance_m", "spherical": True,
+        "query": {"status": {"$in": ["approved", "active"]}}
+    }}, {"$limit": 10}]},
+    {"collection": "food_requests", "filter": {}, "sort": [("created_at", DESC), ("id", DESC)]},
+    {"collection": "fulfillments", "filter": {"donor_id": "x"}},
+    {"collection": "deliveries", "filter": {"id": "x"}},
+    {"collection": "deliveries", "filter": {"id": "x", "volunteer_id": "x"}},
+    {"collection": "deliveries", "filter": {"request_id": "x"}},
+    {"collection": "deliveries", "filter": {"$or": [{"volunteer_id": "x"}, {"additional_volunteers": "x"}]}},
+    {"collection": "deliveries", "filter": {"status": "pending", "volunteer_id": None},
+     "sort": [("created_at", ASC), ("id", ASC)]},
+    {"collection": "deliveries", "filter": {}, "sort": [("created_at", DESC), ("id", DESC)]},
+    {"collection": "deliveries", "filter": {"status": "pending", "volunteer_id": None}},
+    {"collection": "deliveries", "filter": {"volunteer_id": {"$in": ["x"]}, "status": {"$in": ["assigned", "picked_up"]}}},
+    {"collection": "users", "filter": {}, "sort": [("created_at", DESC), ("id", DESC)]},
+    {"collection": "users", "filter": {"role": "volunteer"}, "sort": [("created_at", DESC), ("id", DESC)]},
+    {"collection": "deliveries", "pipeline": [{"$geoNear": {
+        "near": _NEAR, "key": "pickup_geo", "distanceField": "distance_m", "spherical": True,
+        "query": {"status": "pending", "volunteer_id": None}
+    }}, {"$limit": 10}]},
+    {"collection": "admin_approvals", "filter": {"id": "x"}},
+    {"collection": "admin_approvals", "filter": {"target_id": "x", "target_type": "ngo", "final_status": "pending"}},
+    {"collection": "analytics_rollups", "filter": {
+        "metric": "meals_delivered", "period": "daily", "city": "all", "start": {"$gte": "x", "$lte": "y"}
+    }},
+    {"collection": "analytics_rollups", "pipeline": [
+        {"$match": {"metric": "meals_delivered", "period": "monthly", "city": {"$ne": "all"}, "start": {"$gte": "x", "$lte": "y"}}},
+        {"$group": {"_id": "$city", "value": {"$sum": "$value"}}}
+    ]},
+    {"collection": "analytics_rollups", "pipeline": [
+        {"$match": {"metric": "meals_delivered", "period": "monthly", "city": "all"}},
+        {"$group": {"_id": None, "value": {"$sum": "$value"}}}
+    ]},
+    {"collection": "uploads", "filter": {"id": "x"}},
+    {"collection": "impact_summary", "filter": {"id": "global"}},
+    {"collection": "response_cache", "filter": {"key": "x"}},
+    {"collection": "food_requests", "filter": {"status": {"$in": ["pending", "approved", "active"]}, "expires_at": {"$lt": "x"}}},
+    {"collection": "deliveries", "filter": {"status": "assigned", "claim_expires_at": {"$lt": "x"}}},
+    {"collection": "deliveries", "filter": {"status": "picked_up", "stalled_at": None, "picked_up_at": {"$lt": "x"}}},
+    {"collection": "deliveries", "filter": {"status": "confirmed", "confirmed_at": {"$lt": "x"}}},
+    {"collection": "scheduler_leases", "filter": {"name": "scheduler"}},
+    {"collection": "food_requests", "filter": {"status": "fulfilled", "receipt_confirmed_at": {"$lt": "x"}}},
+    {"collection": "food_requests", "filter": {"status": "expired", "expired_at": {"$lt": "x"}}},
+    {"collection": "fulfillments", "filter": {"request_id": {"$in": ["x", "y"]}}},
+    {"collection": "food_requests", "filter": {"ngo_id": "x"}, "sort": [("created_at", DESC)]},
+    {"collection": "fulfillments", "filter": {"donor_id": "x"}, "sort": [("created_at", DESC)]},
+    {"collection": "food_requests_archive", "filter": {"$or": [{"ngo_id": "x"}]}, "sort": [("created_at", DESC)]},
+    {"collection": "fulfillments_archive", "filter": {"$or": [{"donor_id": "x"}]}, "sort": [("created_at", DESC)]},
+    {"collection": "deliveries_archive", "filter": {"$or": [{"volunteer_id": "x"}, {"additional_volunteers": "x"}]},
+     "sort": [("created_at", DESC)]},
+    {"collection": "food_requests_archive", "filter": {"id": "x"}},
+    {"collection": "archive_segments", "filter": {"collection": "food_requests", "owners": "x"},
+     "sort": [("max_created_at", DESC)]},
+    {"collection": "archive_segments", "filter": {"collection": "food_requests", "ids": "x"}},
+    {"collection": "idempotency_keys", "filter": {"scope": "donor_fulfill", "user_id": "x", "key": "x"}},
+]
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every declared index. Safe to run on each startup.
+
+    A failing index (duplicate values under a unique key, or an existing
+    index with conflicting options) is logged and skipped so the API still
+    starts. Returns the created index names per collection.
+    """
+    created: Dict[str, List[str]] = {}
+    for collection, specs in INDEXES.items():
+        for keys, options in specs:
+            try:
+                name = await db[collection].create_index(keys, **options)
+                created.setdefault(collection, []).append(name)
+            except OperationFailure as e:
+                logger.error(f"Could not create index {keys} on {collection}: {e}")
+    return created
+
+def _find_stages(plan: Any, found: List[str]) -> List[str]:
+    """Collect every `stage` name in an explain plan tree."""
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            found.append(plan["stage"])
+        for value in plan.values():
+            _find_stages(value, found)
+    elif isinstance(plan, list):
+        for value in plan:
+            _find_stages(value, found)
+    return found
+
+def _winning_plans(explain: Any, found: List[Dict]) -> List[Dict]:
+    """Collect every winningPlan in an explain result, including aggregation sub-plans."""
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            found.append(explain["winningPlan"])
+        for value in explain.values():
+            _winning_plans(value, found)
+    elif isinstance(explain, list):
+        for value in explain:
+            _winning_plans(value, found)
+    return found
+
+def _explain_command(shape: Dict[str, Any]) -> Dict[str, Any]:
+    collection = shape["collection"]
+    if "pipeline" in shape:
+        return {"aggregate": collection, "pipeline": shape["pipeline"], "cursor": {}}
+    if shape.get("count"):
+        return {"count": collection, "query": shape["filter"]}
+    command: Dict[str, Any] = {"find": collection, "filter": shape["filter"]}
+    if shape.get("sort"):
+        command["sort"] = dict(shape["sort"])
+    return command
+
+async def verify_query_plans(db, shapes: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Explain each query shape and report the plan stages it uses.
+
+    Every result has `collscan` set when a winning plan contains a COLLSCAN
+    stage. Each one is also logged as a warning.
+    """
+    results = []
+    for shape in shapes or QUERY_SHAPES:
+        command = _explain_command(shape)
+        result = {
+            "collection": shape["collection"],
+            "query": shape.get("pipeline") or shape.get("filter"),
+            "kind": next(iter(command)),
+        }
+        try:
+            explain = await db.command("explain", command, verbosity="queryPlanner")
+        except OperationFailure as e:
+            result.update({"error": str(e), "collscan": None})
+            results.append(result)
+            continue
+        stages = []
+        for plan in _winning_plans(explain, []):
+            _find_stages(plan, stages)
+        result["stages"] = stages
+        result["collscan"] = "COLLSCAN" in stages
+        if result["collscan"]:
+            logger.warning(f"Collection scan on {shape['collection']} for {result['kind']} {result['query']}")
+        results.append(result)
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import json
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Create indexes and/or explain every query shape")
+    parser.add_argument("--explain", action="store_true", help="report the plan of every query shape")
+    parser.add_argument("--skip-create", action="store_true", help="do not create missing indexes first")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        if not args.skip_create:
+            print(json.dumps(await ensure_indexes(db), indent=2))
+        if args.explain:
+            results = await verify_query_plans(db)
+            print(json.dumps(results, indent=2, default=str))
+            print(f"{sum(1 for r in results if r['collscan'])} of {len(results)} query shapes scan a collection")
+        client.close()
+
+    asyncio.run(main())
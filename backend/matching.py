@@ -0,0 +1,256 @@
+"""Donor suggestions for a food request.
+
+Donors are known by what they have given before. `donor_profile_pipeline`
+condenses each donor's fulfillments into one profile. A profile holds
+where they give from (the mean of their geo tags), how often and how much
+they give, which food conditions they bring, and when they last gave.
+`DonorMatcher` keeps these profiles as NumPy columns sorted by latitude.
+Candidates near a request are then one `searchsorted` over a latitude
+slab plus a longitude mask. Scoring those candidates is a handful of
+vector operations, and `argpartition` picks the top k.
+
+A donor's score is a weighted sum of four parts, each in [0, 1]:
+
+- proximity, which decays with distance over `DISTANCE_SCALE_KM`;
+- history, which saturates with the number of past fulfillments;
+- compatibility, the smoothed share of past fulfillments whose
+  food_condition suits the request's food_type;
+- recency, which decays with days since the last fulfillment.
+"""
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from distance import EARTH_RADIUS_KM
+
+FOOD_CONDITIONS = ("fresh", "cooked", "packed")
+# Request food_type -> donor food_conditions that can serve it
+FOOD_TYPE_CONDITIONS: Dict[str, Sequence[str]] = {
+    "cooked": ("cooked",),
+    "packaged": ("packed",),
+    "raw": ("fresh",),
+    "mixed": FOOD_CONDITIONS,
+}
+MATCH_WEIGHTS = {"proximity": 0.4, "compatibility": 0.25, "history": 0.2, "recency": 0.15}
+DISTANCE_SCALE_KM = 10.0
+HISTORY_SCALE = 5.0
+RECENCY_SCALE_DAYS = 30.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180.0
+
+def donor_profile_pipeline() -> List[Dict[str, Any]]:
+    """Aggregation over `fulfillments` producing one profile per donor"""
+    by_condition = {
+        condition: {"$sum": {"$cond": [{"$eq": ["$food_condition", condition]}, 1, 0]}}
+        for condition in FOOD_CONDITIONS
+    }
+    return [
+        {"$group": {
+            "_id": "$donor_id",
+            # $avg skips fulfillments without a geo tag
+            "lat": {"$avg": "$geo_tag.lat"},
+            "lng": {"$avg": "$geo_tag.lng"},
+            "fulfillments": {"$sum": 1},
+            "quantity": {"$sum": "$quantity"},
+            "last_at": {"$max": "$created_at"},
+            **by_condition,
+        }},
+        {"$match": {"lat": {"$ne": None}, "lng": {"$ne": None}}},
+    ]
+
+def merge_profiles(*groups: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Combine profiles built over separate collections, such as hot and archived fulfillments.
+
+    Locations are averaged weighted by fulfillments, since the number of
+    geo-tagged fulfillments behind each average is not kept.
+    """
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for profile in (p for group in groups for p in group):
+        current = merged.get(profile["_id"])
+        if current is None:
+            merged[profile["_id"]] = dict(profile)
+            continue
+        total = current["fulfillments"] + profile["fulfillments"]
+        for axis in ("lat", "lng"):
+            current[axis] = (current[axis] * current["fulfillments"] + profile[axis] * profile["fulfillments"]) / total
+        for field in ("quantity", *FOOD_CONDITIONS):
+            current[field] = (current.get(field) or 0) + (profile.get(field) or 0)
+        current["last_at"] = max((v for v in (current.get("last_at"), profile.get("last_at")) if v), key=timestamp, default=None)
+        current["fulfillments"] = total
+    return list(merged.values())
+
+def timestamp(value: Any) -> float:
+    """Epoch seconds of an ISO string or datetime; 0 when missing"""
+    if not value:
+        return 0.0
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return 0.0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+class DonorMatcher:
+    def __init__(self, profiles: Iterable[Dict[str, Any]] = ()):
+        self.load(profiles)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def load(self, profiles: Iterable[Dict[str, Any]]) -> None:
+        """Replace the profiles with rows from `donor_profile_pipeline`"""
+        profiles = sorted(profiles, key=lambda p: p["lat"])
+        self.ids = np.array([p["_id"] for p in profiles], dtype=object)
+        self.rows = {donor_id: row for row, donor_id in enumerate(self.ids.tolist())}
+        self.lat = np.array([p["lat"] for p in profiles], dtype=np.float64)
+        self.lng = np.array([p["lng"] for p in profiles], dtype=np.float64)
+        self.rlat, self.rlng = np.radians(self.lat), np.radians(self.lng)
+        self.fulfillments = np.array([p["fulfillments"] for p in profiles], dtype=np.float64)
+        self.quantity = np.array([p.get("quantity") or 0 for p in profiles], dtype=np.float64)
+        self.last_at = np.array([timestamp(p.get("last_at")) for p in profiles], dtype=np.float64)
+        # n x len(FOOD_CONDITIONS) counts
+        self.conditions = np.array(
+            [[p.get(c, 0) for c in FOOD_CONDITIONS] for p in profiles], dtype=np.float64
+        ).reshape(len(profiles), len(FOOD_CONDITIONS))
+        # History does not depend on the request, so it is computed once
+        self.history = 1.0 - np.exp(-self.fulfillments / HISTORY_SCALE)
+        self.built_at = time.time()
+
+    def candidates(self, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """Rows whose latitude and longitude lie within `radius_km` of the point"""
+        dlat = radius_km / KM_PER_DEGREE
+        lo, hi = np.searchsorted(self.lat, [lat - dlat, lat + dlat + 1e-12])
+        rows = np.arange(lo, hi)
+        cos_lat = math.cos(math.radians(min(89.0, abs(lat) + dlat)))
+        dlng = radius_km / (KM_PER_DEGREE * max(cos_lat, 1e-6))
+        if dlng < 180.0:
+            gap = np.abs((self.lng[rows] - lng + 180.0) % 360.0 - 180.0)
+            rows = rows[gap <= dlng]
+        return rows
+
+    def nearby_counts(self, lat: np.ndarray, lng: np.ndarray, cell_km: float = 5.0) -> np.ndarray:
+        """Approximate number of donors around each point, in one pass.
+
+        Donors are counted on a grid of roughly `cell_km` square cells.
+        A point gets the total of its own cell and the eight around it.
+        """
+        lat, lng = np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64)
+        if not len(self.ids) or not len(lat):
+            return np.zeros(len(lat))
+        cell = cell_km / KM_PER_DEGREE
+
+        def cells(a: np.ndarray, b: np.ndarray):
+            row = np.floor((a + 90.0) / cell).astype(np.int64)
+            # Columns narrow with latitude so cells stay roughly square
+            width = cell / np.maximum(np.cos(np.radians(-90.0 + (row + 0.5) * cell)), 1e-6)
+            return row, np.floor((b + 180.0) / width).astype(np.int64)
+
+        def key(row: np.ndarray, col: np.ndarray) -> np.ndarray:
+            return (row << 32) + col
+
+        keys, counts = np.unique(key(*cells(self.lat, self.lng)), return_counts=True)
+        row, col = cells(lat, lng)
+        total = np.zeros(len(lat))
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                probe = key(row + dr, col + dc)
+                at = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+                total += np.where(keys[at] == probe, counts[at], 0)
+        return total
+
+    def score(
+        self,
+        rows: np.ndarray,
+        lat: float,
+        lng: float,
+        food_type: Optional[str],
+        now: float
+    ) -> Dict[str, np.ndarray]:
+        rlat, rlng = math.radians(lat), math.radians(lng)
+        a = np.sin((self.rlat[rows] - rlat) / 2) ** 2 + math.cos(rlat) * np.cos(self.rlat[rows]) * np.sin((self.rlng[rows] - rlng) / 2) ** 2
+        km = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+        suitable = FOOD_TYPE_CONDITIONS.get(food_type or "mixed", FOOD_CONDITIONS)
+        columns = [FOOD_CONDITIONS.index(c) for c in suitable]
+        # Laplace smoothing keeps a donor with one fulfillment from scoring 0 or 1
+        compatibility = (self.conditions[rows][:, columns].sum(axis=1) + 1.0) / (self.fulfillments[rows] + 2.0)
+
+        days = np.maximum(now - self.last_at[rows], 0.0) / 86400.0
+        parts = {
+            "proximity": np.exp(-km / DISTANCE_SCALE_KM),
+            "compatibility": compatibility,
+            "history": self.history[rows],
+            "recency": np.exp(-days / RECENCY_SCALE_DAYS),
+        }
+        parts["score"] = sum(MATCH_WEIGHTS[name] * parts[name] for name in MATCH_WEIGHTS)
+        parts["km"] = km
+        return parts
+
+    def top(
+        self,
+        lat: float,
+        lng: float,
+        food_type: Optional[str],
+        k: int = 5,
+        radius_km: float = 25.0,
+        max_radius_km: float = 400.0,
+        exclude: Iterable[str] = (),
+        now: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """The k best donors for a request at (lat, lng), best first.
+
+        The search radius doubles until it holds k donors or passes
+        `max_radius_km`, after which every donor is a candidate.
+        """
+        if not len(self.ids):
+            return []
+        now = time.time() if now is None else now
+        # One mask per call, so filtering stays vectorised however large the fallback
+        keep = None
+        excluded = [self.rows[i] for i in exclude if i in self.rows]
+        if excluded:
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[excluded] = False
+        radius = radius_km
+        while True:
+            rows = self.candidates(lat, lng, radius)
+            if keep is not None:
+                rows = rows[keep[rows]]
+            if len(rows) >= k:
+                break
+            if radius >= max_radius_km:
+                rows = np.arange(len(self.ids)) if keep is None else np.flatnonzero(keep)
+                break
+            radius *= 2
+        if not len(rows):
+            return []
+
+        parts = self.score(rows, lat, lng, food_type, now)
+        scores = parts["score"]
+        best = np.argpartition(-scores, k - 1)[:k] if len(rows) > k else np.arange(len(rows))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        results = []
+        for i in best.tolist():
+            row = rows[i]
+            results.append({
+                "donor_id": self.ids[row],
+                "score": round(float(scores[i]), 4),
+                "distance_km": round(float(parts["km"][i]), 2),
+                "fulfillments": int(self.fulfillments[row]),
+                "quantity": int(self.quantity[row]),
+                "last_fulfilled_at": datetime.fromtimestamp(self.last_at[row], timezone.utc).isoformat() if self.last_at[row] else None,
+                "breakdown": {name: round(float(parts[name][i]), 4) for name in MATCH_WEIGHTS},
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "donors": len(self.ids),
+            "built_at": datetime.fromtimestamp(self.built_at, timezone.utc).isoformat() if self.built_at else None,
+        }
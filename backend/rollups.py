@@ -0,0 +1,156 @@
+"""Pre-aggregated time series for impact reporting.
+
+Each event adds its value to one bucket document per period (daily,
+weekly, monthly), both for its city and for all cities together. The
+writes are one unordered bulk of `$inc` upserts. A unique index on
+(metric, period, city, start) means concurrent first writes to a new
+bucket cannot create two documents. The write that loses the race fails
+with a duplicate key error and is retried as a plain update.
+
+Reading a series is one range scan over that index. A year of daily
+values is therefore 365 small documents, however many events went into
+them. Buckets are in UTC. A bucket's `start` is the ISO date of its
+first day, and weeks start on Monday.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+PERIODS = ("daily", "weekly", "monthly")
+METRICS = ("meals_delivered", "meals_donated", "requests_created", "requests_fulfilled", "deliveries_completed")
+ALL_CITIES = "all"
+UNKNOWN_CITY = "unknown"
+# Longest series one query may return
+MAX_BUCKETS = 1000
+
+# (metric, value, city, at); at defaults to now
+Event = Tuple[str, float, Optional[str], Optional[datetime]]
+
+def city_key(city: Optional[str]) -> str:
+    """The bucket name for a city, so "new  delhi" and "New Delhi" share one"""
+    city = " ".join(str(city or "").split())
+    return city.title() if city else UNKNOWN_CITY
+
+def to_date(value: Any) -> date:
+    """The UTC date of a datetime, ISO string or date"""
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, date):
+        return value
+    else:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.date()
+
+def bucket_start(value: Any, period: str) -> date:
+    day = to_date(value)
+    if period == "weekly":
+        return day - timedelta(days=day.weekday())
+    if period == "monthly":
+        return day.replace(day=1)
+    return day
+
+def next_start(start: date, period: str) -> date:
+    if period == "weekly":
+        return start + timedelta(days=7)
+    if period == "monthly":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def bucket_starts(start: Any, end: Any, period: str) -> List[date]:
+    """Every bucket start from the bucket holding `start` to the one holding `end`"""
+    current, last = bucket_start(start, period), bucket_start(end, period)
+    starts = []
+    while current <= last:
+        if len(starts) == MAX_BUCKETS:
+            raise ValueError(f"At most {MAX_BUCKETS} {period} buckets per query")
+        starts.append(current)
+        current = next_start(current, period)
+    return starts
+
+class Rollups:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record(self, metric: str, value: float, city: Optional[str] = None, at: Optional[datetime] = None) -> None:
+        await self.record_many([(metric, value, city, at)])
+
+    async def record_many(self, events: Iterable[Event], retries: int = 3) -> None:
+        """Add a batch of events, combining those that land in the same bucket"""
+        now = datetime.now(timezone.utc)
+        buckets: Dict[Tuple[str, str, str, str], List[float]] = {}
+        for metric, value, city, at in events:
+            if not value:
+                continue
+            for period in PERIODS:
+                start = bucket_start(at or now, period).isoformat()
+                for name in (city_key(city), ALL_CITIES):
+                    totals = buckets.setdefault((metric, period, name, start), [0, 0])
+                    totals[0] += value
+                    totals[1] += 1
+        ops = [
+            UpdateOne(
+                {"metric": metric, "period": period, "city": name, "start": start},
+                {"$inc": {"value": value, "count": count}, "$set": {"updated_at": now.isoformat()}},
+                upsert=True
+            )
+            for (metric, period, name, start), (value, count) in buckets.items()
+        ]
+        for attempt in range(retries):
+            if not ops:
+                return
+            try:
+                await self.collection.bulk_write(ops, ordered=False)
+                return
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if attempt == retries - 1 or any(err.get("code") != 11000 for err in errors):
+                    raise
+                # Another writer created these buckets first; the retry updates them
+                ops = [ops[err["index"]] for err in errors]
+
+    async def series(
+        self,
+        metric: str,
+        period: str,
+        start: Any,
+        end: Any,
+        city: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """One entry per bucket from `start` to `end`, with zeros where nothing happened"""
+        starts = [s.isoformat() for s in bucket_starts(start, end, period)]
+        name = city_key(city) if city else ALL_CITIES
+        docs = await self.collection.find(
+            {"metric": metric, "period": period, "city": name, "start": {"$gte": starts[0], "$lte": starts[-1]}},
+            {"_id": 0, "start": 1, "value": 1, "count": 1}
+        ).to_list(None)
+        by_start = {d["start"]: d for d in docs}
+        return [
+            {"start": s, "value": by_start.get(s, {}).get("value", 0), "count": by_start.get(s, {}).get("count", 0)}
+            for s in starts
+        ]
+
+    async def by_city(self, metric: str, period: str, start: Any, end: Any, limit: int = 20) -> List[Dict[str, Any]]:
+        """Cities ranked by their total over the buckets from `start` to `end`"""
+        starts = bucket_starts(start, end, period)
+        rows = await self.collection.aggregate([
+            {"$match": {
+                "metric": metric, "period": period, "city": {"$ne": ALL_CITIES},
+                "start": {"$gte": starts[0].isoformat(), "$lte": starts[-1].isoformat()}
+            }},
+            {"$group": {"_id": "$city", "value": {"$sum": "$value"}, "count": {"$sum": "$count"}}},
+            {"$sort": {"value": -1, "_id": 1}},
+            {"$limit": limit}
+        ]).to_list(None)
+        return [{"city": row["_id"], "value": row["value"], "count": row["count"]} for row in rows]
+
+    async def total(self, metric: str, city: Optional[str] = None) -> float:
+        """All-time total, summed over the monthly buckets"""
+        rows = await self.collection.aggregate([
+            {"$match": {"metric": metric, "period": "monthly", "city": city_key(city) if city else ALL_CITIES}},
+            {"$group": {"_id": None, "value": {"$sum": "$value"}}}
+        ]).to_list(1)
+        return rows[0]["value"] if rows else 0
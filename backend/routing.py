@@ -0,0 +1,359 @@
+"""Multi-stop route planning for one volunteer.
+
+`plan_route` turns a volunteer's deliveries into one run of pickups and
+drop-offs. It can also add nearby open deliveries, but only when they fit
+into the run cheaply. The run has to respect three limits:
+
+- a pickup cannot happen before the donor's `availability_time`, so the
+  volunteer waits if they arrive early, nor after the volunteer's claim
+  on the delivery lapses;
+- food may spend only so long between pickup and drop-off, depending on
+  its `food_condition` (see `SHELF_LIFE_MINUTES`);
+- the volunteer carries at most as many deliveries as their transport
+  mode allows (`assignment.TRANSPORT_MODES`).
+
+This is a pickup-and-delivery problem with time windows, solved
+heuristically. Deliveries are added by cheapest insertion: each round
+tries every (pickup, drop-off) position pair for every delivery still
+out, and takes the one that lengthens the run least. Then a relocate
+local search takes each delivery out and puts it back at its best
+position, until nothing improves or the time budget runs out. A
+position pair is abandoned as soon as its partial schedule is already
+worse than the best found so far.
+"""
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from distance import haversine_matrix
+
+# food_condition -> longest time food may be carried between pickup and drop-off, in minutes
+SHELF_LIFE_MINUTES: Dict[str, float] = {
+    "cooked": 90.0,
+    "fresh": 180.0,
+    "packed": 480.0,
+}
+DEFAULT_SHELF_LIFE_MINUTES = 120.0
+# Time spent at each stop handing food over
+SERVICE_MINUTES = 5.0
+
+# (elapsed minutes, stop, load, {job: pickup minute} for food on board)
+State = Tuple[float, int, int, Dict[int, float]]
+
+def shelf_life(food_condition: Optional[str]) -> float:
+    return SHELF_LIFE_MINUTES.get(food_condition or "", DEFAULT_SHELF_LIFE_MINUTES)
+
+def minutes_since(then: Optional[str], now: datetime) -> Optional[float]:
+    """Minutes from an ISO timestamp to `now`; naive timestamps are taken as UTC"""
+    if not then:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(then).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (now - moment).total_seconds() / 60.0
+
+def delivery_job(
+    delivery: Dict[str, Any],
+    fulfillment: Optional[Dict[str, Any]],
+    now: datetime,
+    required: bool = True
+) -> Dict[str, Any]:
+    """Describe a delivery for `plan_route`.
+
+    A delivery that is already picked up only needs its drop-off, and the
+    time it has spent on board counts against its shelf life. An assigned
+    delivery has to be picked up before its claim expires. Optional jobs
+    are open deliveries the plan may add.
+    """
+    fulfillment = fulfillment or {}
+    on_board = delivery.get("status") == "picked_up"
+    waiting = minutes_since(fulfillment.get("availability_time"), now)
+    claim_left = minutes_since(delivery.get("claim_expires_at"), now)
+    return {
+        "id": delivery["id"],
+        "pickup": delivery["pickup_location"],
+        "dropoff": delivery["dropoff_location"],
+        "pickup_address": delivery.get("pickup_address"),
+        "dropoff_address": delivery.get("dropoff_address"),
+        "ready_minutes": max(0.0, -waiting) if waiting is not None else 0.0,
+        "pickup_by_minutes": -claim_left if claim_left is not None and not on_board else None,
+        "shelf_life_minutes": shelf_life(fulfillment.get("food_condition")),
+        "on_board": on_board,
+        "carried_minutes": max(0.0, minutes_since(delivery.get("picked_up_at"), now) or 0.0) if on_board else 0.0,
+        "required": required,
+    }
+
+class RoutingProblem:
+    """Travel times and limits for one volunteer's jobs.
+
+    Stop 0 is the volunteer's position. Job j picks up at stop 2j + 1 and
+    drops off at stop 2j + 2; routes are lists of stops.
+    """
+
+    def __init__(
+        self,
+        start: Dict[str, float],
+        jobs: Sequence[Dict[str, Any]],
+        speed_kmh: float,
+        capacity: int,
+        service_minutes: float = SERVICE_MINUTES
+    ):
+        self.jobs = list(jobs)
+        self.capacity = capacity
+        self.service = service_minutes
+        points = [start]
+        for job in self.jobs:
+            points += [job["pickup"], job["dropoff"]]
+        lat = [p["lat"] for p in points]
+        lng = [p["lng"] for p in points]
+        self.travel: List[List[float]] = (haversine_matrix(lat, lng, lat, lng) * (60.0 / speed_kmh)).tolist()
+
+        self.ready = [job.get("ready_minutes", 0.0) for job in self.jobs]
+        self.pickup_by = [math.inf] * len(self.jobs)
+        self.max_ride = [job.get("shelf_life_minutes", DEFAULT_SHELF_LIFE_MINUTES) for job in self.jobs]
+        onboard = {}
+        for j, job in enumerate(self.jobs):
+            if job.get("pickup_by_minutes") is not None:
+                # A claim that lapses before the volunteer could get there
+                # still allows going straight to the pickup
+                direct = max(self.travel[0][self.pickup(j)], self.ready[j])
+                self.pickup_by[j] = max(job["pickup_by_minutes"], direct)
+            if job.get("on_board"):
+                onboard[j] = -job.get("carried_minutes", 0.0)
+                # Food past its shelf life still has to be dropped off;
+                # allow at least a direct ride there
+                self.max_ride[j] = max(self.max_ride[j], job.get("carried_minutes", 0.0) + self.travel[0][self.dropoff(j)])
+        self.initial: State = (0.0, 0, len(onboard), onboard)
+
+    @staticmethod
+    def pickup(j: int) -> int:
+        return 2 * j + 1
+
+    @staticmethod
+    def dropoff(j: int) -> int:
+        return 2 * j + 2
+
+    def advance(self, state: State, stop: int) -> Optional[State]:
+        """State after travelling to and serving `stop`, or None if that breaks a limit"""
+        t, at, load, onboard = state
+        t += self.travel[at][stop]
+        j = (stop - 1) // 2
+        if stop % 2:
+            if t < self.ready[j]:
+                t = self.ready[j]
+            if t > self.pickup_by[j]:
+                return None
+            load += 1
+            if load > self.capacity:
+                return None
+            onboard = {**onboard, j: t}
+        else:
+            picked = onboard.get(j)
+            if picked is None or t - picked > self.max_ride[j]:
+                return None
+            onboard = {k: v for k, v in onboard.items() if k != j}
+            load -= 1
+        return t + self.service, stop, load, onboard
+
+    def states(self, route: List[int]) -> Optional[List[State]]:
+        """The state before each stop, plus the final state; None if the route is infeasible"""
+        states = [self.initial]
+        for stop in route:
+            state = self.advance(states[-1], stop)
+            if state is None:
+                return None
+            states.append(state)
+        return states
+
+    def finish(self, state: Optional[State], stops: Sequence[int], bound: float) -> float:
+        """Duration after also visiting `stops`, or inf if infeasible or not under `bound`"""
+        for stop in stops:
+            if state is None or state[0] >= bound:
+                return math.inf
+            state = self.advance(state, stop)
+        if state is None or state[0] >= bound:
+            return math.inf
+        return state[0]
+
+    def best_insertion(
+        self, route: List[int], states: List[State], j: int, bound: float = math.inf
+    ) -> Tuple[float, Optional[List[int]]]:
+        """Cheapest way to add job j to a feasible route, if any beats `bound`"""
+        best, best_route = bound, None
+        drop = self.dropoff(j)
+        n = len(route)
+        if j in self.initial[3]:
+            # Already on board: only the drop-off goes in
+            for k in range(n + 1):
+                cost = self.finish(self.advance(states[k], drop), route[k:], best)
+                if cost < best:
+                    best, best_route = cost, route[:k] + [drop] + route[k:]
+            return best, best_route
+
+        pick = self.pickup(j)
+        for i in range(n + 1):
+            state = self.advance(states[i], pick)
+            for k in range(i, n + 1):
+                if k > i:
+                    state = self.advance(state, route[k - 1])
+                if state is None or state[0] >= best:
+                    # Later drop-off positions only carry more and arrive later
+                    break
+                after_drop = self.advance(state, drop)
+                if after_drop is None:
+                    # Arrival at the drop-off never gets earlier as k grows
+                    break
+                cost = self.finish(after_drop, route[k:], best)
+                if cost < best:
+                    best, best_route = cost, route[:i] + [pick] + route[i:k] + [drop] + route[k:]
+        return best, best_route
+
+    def without(self, route: List[int], j: int) -> List[int]:
+        return [s for s in route if (s - 1) // 2 != j]
+
+def plan_route(
+    start: Dict[str, float],
+    jobs: Sequence[Dict[str, Any]],
+    speed_kmh: float,
+    capacity: int,
+    budget_ms: float = 200.0,
+    max_minutes: float = 240.0,
+    max_added_minutes: float = 30.0,
+    now: Optional[datetime] = None,
+    service_minutes: float = SERVICE_MINUTES
+) -> Dict[str, Any]:
+    """Plan one run through `jobs` (see `delivery_job`) from `start`.
+
+    Required jobs are always attempted, whatever the budget; those that
+    cannot be scheduled within their limits come back in `unrouted`. If
+    a pickup can only be reached after the claim on it lapses, it is
+    planned anyway and listed in `renew_claims`.
+    Optional jobs are added while each adds at most `max_added_minutes`
+    and the run stays within `max_minutes`. The local search stops when
+    `budget_ms` is spent.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000.0
+    problem = RoutingProblem(start, jobs, speed_kmh, capacity, service_minutes)
+    required = [j for j, job in enumerate(problem.jobs) if job.get("required", True)]
+    optional = [j for j, job in enumerate(problem.jobs) if not job.get("required", True)]
+
+    route: List[int] = []
+    cost = 0.0
+    unrouted: List[int] = []
+    renew: List[int] = []
+    while required:
+        states = problem.states(route)
+        options = [(problem.best_insertion(route, states, j), j) for j in required]
+        stuck = [j for (_, new_route), j in options if new_route is None]
+        options = [o for o in options if o[0][1] is not None]
+        for j in stuck:
+            if problem.pickup_by[j] < math.inf:
+                # Picking up late only means claiming the delivery again
+                problem.pickup_by[j] = math.inf
+                renew.append(j)
+                options.append((problem.best_insertion(route, states, j), j))
+        # A job that fits nowhere now cannot fit once the route is longer
+        unrouted += [j for (_, new_route), j in options if new_route is None]
+        options = [o for o in options if o[0][1] is not None]
+        if not options:
+            break
+        (cost, route), j = min(options, key=lambda o: o[0][0])
+        required = [o[1] for o in options if o[1] != j]
+
+    def add_optional() -> bool:
+        nonlocal route, cost
+        added = False
+        while optional and time.perf_counter() < deadline:
+            states = problem.states(route)
+            bound = min(cost + max_added_minutes, max_minutes) + 1e-9
+            best = (bound, None, None)
+            for j in optional:
+                new_cost, new_route = problem.best_insertion(route, states, j, best[0])
+                if new_route is not None:
+                    best = (new_cost, new_route, j)
+            if best[1] is None:
+                break
+            cost, route = best[0], best[1]
+            optional.remove(best[2])
+            added = True
+        return added
+
+    add_optional()
+    rounds = 0
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        rounds += 1
+        for j in sorted({(s - 1) // 2 for s in route}):
+            if time.perf_counter() >= deadline:
+                break
+            rest = problem.without(route, j)
+            states = problem.states(rest)
+            if states is None:
+                # Taking j out moved another pickup earlier and stretched its ride
+                continue
+            new_cost, new_route = problem.best_insertion(rest, states, j, cost - 1e-6)
+            if new_route is not None:
+                route, cost, improved = new_route, new_cost, True
+        if add_optional():
+            improved = True
+
+    return {
+        **schedule(problem, route, now),
+        "unrouted": [problem.jobs[j]["id"] for j in unrouted],
+        "renew_claims": [problem.jobs[j]["id"] for j in renew if j not in unrouted],
+        "one_at_a_time_minutes": round(one_at_a_time(problem, route), 1),
+        "search": {"rounds": rounds, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)},
+    }
+
+def schedule(problem: RoutingProblem, route: List[int], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Stops of a feasible route with arrival times, and the run's totals"""
+    stops = []
+    state = problem.initial
+    for stop in route:
+        arrive = state[0] + problem.travel[state[1]][stop]
+        state = problem.advance(state, stop)
+        job = problem.jobs[(stop - 1) // 2]
+        action = "pickup" if stop % 2 else "dropoff"
+        entry = {
+            "delivery_id": job["id"],
+            "action": action,
+            "location": job[action],
+            "address": job.get(f"{action}_address"),
+            "arrive_minutes": round(arrive, 1),
+            "depart_minutes": round(state[0], 1),
+            "wait_minutes": round(max(0.0, state[0] - problem.service - arrive), 1),
+        }
+        if now is not None:
+            entry["eta"] = (now + timedelta(minutes=arrive)).isoformat()
+        stops.append(entry)
+    routed = {(s - 1) // 2 for s in route}
+    return {
+        "stops": stops,
+        "deliveries": [problem.jobs[j]["id"] for j in sorted(routed)],
+        "added": [problem.jobs[j]["id"] for j in sorted(routed) if not problem.jobs[j].get("required", True)],
+        "total_minutes": round(state[0], 1),
+    }
+
+def one_at_a_time(problem: RoutingProblem, route: List[int]) -> float:
+    """Duration of the same deliveries carried singly, in the route's pickup order.
+
+    Food already on board is dropped off first. Waiting for
+    availability still applies, but shelf life is not checked.
+    """
+    t, at = 0.0, 0
+    routed = {(s - 1) // 2 for s in route}
+    order = [j for j in sorted(problem.initial[3]) if j in routed] + [(s - 1) // 2 for s in route if s % 2]
+    for j in order:
+        if j not in problem.initial[3]:
+            t += problem.travel[at][problem.pickup(j)]
+            t = max(t, problem.ready[j]) + problem.service
+            at = problem.pickup(j)
+        t += problem.travel[at][problem.dropoff(j)] + problem.service
+        at = problem.dropoff(j)
+    return t
@@ -0,0 +1,209 @@
+"""Periodic background jobs, run once across every API worker.
+
+Each worker runs a `Scheduler`, but only one of them is the leader. The
+leader is whoever holds a lease document in MongoDB. A worker claims the
+lease when it is free or has expired. The leader renews it every third of
+`lease_seconds`, and a worker that stops renewing loses it once it
+expires. Jobs added with `leader_only=False` run on every worker. That
+is for work on in-process state, such as the dispatch index.
+
+Leadership can move between workers while a job is running, so a job
+may occasionally run twice. Every job here is a conditional update, so
+running it twice does no harm.
+
+The scheduler times each job and records its runs, failures and last
+result. `on_run` receives every record, so the server can keep them
+where any worker can read them.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+RunSink = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+def summarize(result: Any) -> Optional[Dict[str, Any]]:
+    """The scalar fields of a job's result, and of dicts nested one level down.
+
+    Lists, such as the pairs of a batch assignment, can be large, so they
+    are left out of the metrics.
+    """
+    if not isinstance(result, dict):
+        return None
+    scalar = (str, int, float, bool, type(None))
+    summary = {}
+    for key, value in result.items():
+        if isinstance(value, scalar):
+            summary[key] = value
+        elif isinstance(value, dict) and all(isinstance(v, scalar) for v in value.values()):
+            summary[key] = value
+    return summary
+
+class Scheduler:
+    def __init__(
+        self,
+        leases,
+        name: str = "scheduler",
+        lease_seconds: float = 30.0,
+        on_run: Optional[RunSink] = None
+    ):
+        self.leases = leases
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.on_run = on_run
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Monotonic time until which this worker may act as leader
+        self._leader_until = 0.0
+        self.counts = {"elections": 0, "renewals": 0, "lost": 0, "errors": 0}
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._leader_until
+
+    def add(self, name: str, interval_seconds: float, job: Job, leader_only: bool = True) -> None:
+        """Run `job` every `interval_seconds`; a non-positive interval disables it"""
+        if interval_seconds <= 0:
+            return
+        self.jobs[name] = {
+            "job": job,
+            "interval_seconds": interval_seconds,
+            "leader_only": leader_only,
+            "runs": 0,
+            "failures": 0,
+            "skipped": 0,
+            "last_started_at": None,
+            "last_duration_ms": None,
+            "last_result": None,
+            "last_error": None,
+        }
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        if any(j["leader_only"] for j in self.jobs.values()):
+            self._tasks.append(asyncio.create_task(self._elect()))
+        for name in self.jobs:
+            self._tasks.append(asyncio.create_task(self._loop(name)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.is_leader:
+            # Hand over now rather than making the next leader wait out the lease
+            self._leader_until = 0.0
+            try:
+                await self.leases.update_one(
+                    {"name": self.name, "owner": self.owner},
+                    {"$set": {"expires_at": datetime.fromtimestamp(0, timezone.utc)}}
+                )
+            except PyMongoError as e:
+                logger.warning(f"Could not release scheduler lease: {e}")
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; True while this worker holds it"""
+        now = datetime.now(timezone.utc)
+        started = time.monotonic()
+        try:
+            # The upsert inserts when no lease exists yet; when another worker
+            # holds a live lease it collides with the unique name instead
+            lease = await self.leases.find_one_and_update(
+                {"name": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {
+                    "owner": self.owner,
+                    "expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "renewed_at": now
+                }, "$setOnInsert": {"acquired_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            lease = None
+            held = False
+        except PyMongoError as e:
+            # Step down rather than risk two leaders while the database is unreachable
+            self.counts["errors"] += 1
+            logger.warning(f"Scheduler lease check failed: {e}")
+            held = False
+        else:
+            held = True
+        if held:
+            self.counts["renewals" if lease and lease.get("owner") == self.owner else "elections"] += 1
+            if not self.is_leader:
+                logger.info(f"Scheduler leadership acquired by {self.owner}")
+            self._leader_until = started + self.lease_seconds
+        elif self.is_leader:
+            self.counts["lost"] += 1
+            logger.warning(f"Scheduler leadership lost by {self.owner}")
+            self._leader_until = 0.0
+        return held
+
+    async def _elect(self) -> None:
+        while True:
+            await self.acquire()
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def _loop(self, name: str) -> None:
+        job = self.jobs[name]
+        while True:
+            await asyncio.sleep(job["interval_seconds"])
+            if job["leader_only"] and not self.is_leader:
+                job["skipped"] += 1
+                continue
+            try:
+                await self.run(name)
+            except Exception:
+                # Already logged and recorded; the next interval tries again
+                pass
+
+    async def run(self, name: str) -> Any:
+        """Run one job now, recording its outcome; failures are logged and re-raised"""
+        job = self.jobs[name]
+        job["last_started_at"] = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        try:
+            result = await job["job"]()
+        except Exception as e:
+            job["failures"] += 1
+            job["last_error"] = str(e)
+            logger.error(f"Scheduled job {name} failed: {e}")
+            await self._finish(name, start)
+            raise
+        job["runs"] += 1
+        job["last_error"] = None
+        job["last_result"] = summarize(result)
+        await self._finish(name, start)
+        return result
+
+    async def _finish(self, name: str, start: float) -> None:
+        self.jobs[name]["last_duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if self.on_run is not None:
+            try:
+                await self.on_run(name, self._record(name))
+            except Exception as e:
+                logger.warning(f"Could not record scheduled job {name}: {e}")
+
+    def _record(self, name: str) -> Dict[str, Any]:
+        job = self.jobs[name]
+        return {k: v for k, v in job.items() if k != "job"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "leader": self.is_leader,
+            **self.counts,
+            "jobs": {name: self._record(name) for name in self.jobs},
+        }
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Query, Response, Header, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -7,16 +8,39 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 import jwt
 import httpx
-from math import radians, cos, sin, asin, sqrt
 import base64
 import json
+import csv
+import io
 import bcrypt
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from archive import archive_matching, get_archive_store, newest_first
+from assignment import assign, mode_profile
+from cache import TTLCache, ResponseCache, MemoryResponseBackend, MongoResponseBackend
+from dispatch_index import DispatchIndex
+from distance import haversine, haversine_pairwise
+from events import EventBus, sse_stream, watch_changes
+from indexes import ensure_indexes, verify_query_plans
+from imaging import UnsupportedImage, make_derivatives
+from matching import DonorMatcher, donor_profile_pipeline, merge_profiles
+from rollups import ALL_CITIES, METRICS, Rollups, city_key, to_date
+from routing import delivery_job, plan_route
+from scheduler import Scheduler
+from storage import CHUNK_SIZE, get_blob_store, parse_range
+from urgency import LlmUrgencyModel, StubUrgencyModel, UrgencyScorer, rescore_by_rules
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -30,6 +54,48 @@ db = client[os.environ['DB_NAME']]
 JWT_SECRET = os.environ.get('JWT_SECRET', 'smartplate-secret-key')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# Live feed URLs carry a short-lived token scoped to the feed, never the session token
+LIVE_FEED_TOKEN_SECONDS = int(os.environ.get('LIVE_FEED_TOKEN_SECONDS', '60'))
+LIVE_FEED_SCOPE = "live_feed"
+
+# Authenticated-user cache; entries are dropped whenever a handler changes the user
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_MAX_SIZE', '10000')),
+    ttl=float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+)
+
+# Cached responses for public read-heavy endpoints; route -> (fresh seconds, stale seconds)
+RESPONSE_CACHE_TTLS = {
+    "analytics_public": (60, 300),
+    "ngos_verified": (300, 900)
+}
+response_cache = ResponseCache(
+    MongoResponseBackend(db.response_cache)
+    if os.environ.get('RESPONSE_CACHE_BACKEND', 'memory') == 'mongo'
+    else MemoryResponseBackend()
+)
+
+# File uploads: blobs go to the configured store, metadata to db.uploads
+blob_store = get_blob_store(ROOT_DIR / 'uploads')
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+
+# Finished records moved out of the operational collections (see archive.py)
+archive_store = get_archive_store(db, ROOT_DIR / 'archive')
+
+# Daily, weekly and monthly impact totals per city (see rollups.py)
+rollups = Rollups(db.analytics_rollups)
+
+# Live feed of food request and delivery changes (see events.py)
+event_bus = EventBus(
+    history=int(os.environ.get('LIVE_FEED_HISTORY', '1000')),
+    queue_size=int(os.environ.get('LIVE_FEED_QUEUE_SIZE', '256'))
+)
+
+# In-memory spatial index of open deliveries (see dispatch_index.py)
+DISPATCH_INDEX_ENABLED = os.environ.get('DISPATCH_INDEX', 'true').lower() in ('1', 'true', 'yes')
+DISPATCH_INDEX_CHECK_SECONDS = int(os.environ.get('DISPATCH_INDEX_CHECK_SECONDS', '300'))
+dispatch_index = DispatchIndex(precision=int(os.environ.get('DISPATCH_INDEX_PRECISION', '6')))
 
 # Google OAuth
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
@@ -46,6 +112,7 @@ api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -126,7 +193,8 @@ class FoodRequest(BaseModel):
     description: Optional[str] = None
     location: Dict[str, float]  # {lat, lng}
     address: str
-    status: str = "pending"  # pending, approved, active, fulfilled, cancelled
+    city: Optional[str] = None  # the NGO's city, for per-city rollups
+    status: str = "pending"  # pending, approved, active, fulfilled, cancelled, expired
     approved_by: Optional[str] = None
     approved_at: Optional[datetime] = None
     fulfilled_quantity: int = 0
@@ -161,6 +229,7 @@ class Delivery(BaseModel):
     pickup_address: str
     dropoff_location: Dict[str, float]
     dropoff_address: str
+    city: Optional[str] = None
     status: str = "pending"  # pending, assigned, picked_up, in_transit, delivered, confirmed
     delivery_proof: Optional[str] = None
     extra_volunteer_required: bool = False
@@ -186,14 +255,6 @@ class AdminApproval(BaseModel):
     reason: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-class AnalyticsMetric(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    metric_type: str  # meals_delivered, people_fed, ngos_served, delivery_success_rate
-    value: float
-    period: str  # daily, weekly, monthly, all_time
-    date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
 # ============ HELPER FUNCTIONS ============
 
 def create_jwt_token(user_id: str, email: str, role: Optional[str] = None) -> str:
@@ -205,6 +266,15 @@ def create_jwt_token(user_id: str, email: str, role: Optional[str] = None) -> st
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def create_stream_token(user_id: str) -> str:
+    """Token for opening the live feed, which EventSource has to send in the URL"""
+    payload = {
+        "user_id": user_id,
+        "scope": LIVE_FEED_SCOPE,
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=LIVE_FEED_TOKEN_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
 def verify_jwt_token(token: str) -> Dict[str, Any]:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -215,27 +285,206 @@ def verify_jwt_token(token: str) -> Dict[str, Any]:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    token = credentials.credentials
+    return await user_from_token(credentials.credentials)
+
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    token: Optional[str] = Query(None)
+) -> Dict[str, Any]:
+    """Like get_current_user, but also takes ?token= since EventSource cannot send headers.
+
+    URLs end up in access and proxy logs, so ?token= only accepts a
+    short-lived feed token from POST /live/token.
+    """
+    if credentials:
+        return await user_from_token(credentials.credentials)
+    if token:
+        return await user_from_token(token, scope=LIVE_FEED_SCOPE)
+    raise HTTPException(status_code=403, detail="Not authenticated")
+
+async def user_from_token(token: str, scope: Optional[str] = None) -> Dict[str, Any]:
+    """The user a token belongs to; session tokens have no scope, feed tokens work only for the feed"""
     payload = verify_jwt_token(token)
-    user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    if payload.get("scope") != scope:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user = user_cache.get(payload["user_id"])
+    if user is None:
+        generation = user_cache.generation
+        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_cache.set(payload["user_id"], user, generation)
+    # Handlers get their own copy so they cannot mutate the cached entry
+    return dict(user)
 
 async def require_role(required_roles: List[str], user: Dict = Depends(get_current_user)) -> Dict:
     if user.get("role") not in required_roles:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     return user
 
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate the great circle distance in km between two points."""
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Radius of earth in kilometers
-    return c * r
+def to_geojson_point(location: Optional[Dict[str, float]]) -> Optional[Dict[str, Any]]:
+    """Convert a {lat, lng} dict into a GeoJSON Point for 2dsphere indexes."""
+    if not location or location.get("lat") is None or location.get("lng") is None:
+        return None
+    return {"type": "Point", "coordinates": [float(location["lng"]), float(location["lat"])]}
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    """Encode a pagination position as an opaque URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a token produced by encode_cursor."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data
+
+def bbox_polygon(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Dict[str, Any]:
+    """GeoJSON polygon for a lat/lng bounding box, usable with $geoWithin."""
+    return {"type": "Polygon", "coordinates": [[
+        [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+    ]]}
+
+async def geo_near_page(
+    collection,
+    key: str,
+    lat: float,
+    lng: float,
+    query: Dict[str, Any],
+    limit: int,
+    after: Optional[Dict[str, Any]] = None,
+    radius_km: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Fetch one nearest-first page via $geoNear on a 2dsphere-indexed field.
+
+    Each document gets a `distance` in km. Returns the page and the cursor
+    for the next one (None on the last page).
+    """
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lng, lat]},
+        "key": key,
+        "distanceField": "distance_m",
+        "spherical": True,
+        "query": query
+    }
+    if radius_km:
+        geo_near["maxDistance"] = radius_km * 1000
+    pipeline = [{"$geoNear": geo_near}]
+    if after:
+        if "d" not in after:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Resume at the last distance seen, skipping ties already returned
+        geo_near["minDistance"] = after["d"]
+        pipeline.append({"$match": {"$or": [
+            {"distance_m": {"$gt": after["d"]}},
+            {"id": {"$nin": after.get("ids", [])}}
+        ]}})
+    pipeline += [{"$limit": limit + 1}, {"$project": {"_id": 0, key: 0}}]
+    docs = await collection.aggregate(pipeline).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last_d = docs[-1]["distance_m"]
+        tie_ids = [d["id"] for d in docs if d["distance_m"] == last_d]
+        if after and after["d"] == last_d:
+            tie_ids += after.get("ids", [])
+        next_cursor = encode_cursor({"d": last_d, "ids": tie_ids})
+    for doc in docs:
+        doc["distance"] = doc.pop("distance_m") / 1000
+    return docs, next_cursor
+
+async def keyset_page(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    limit: int,
+    after: Optional[Dict[str, Any]] = None,
+    descending: bool = True
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Fetch one page ordered by (created_at, id) using keyset pagination.
+
+    Returns the page and the cursor for the next one (None on the last page).
+    """
+    direction = -1 if descending else 1
+    if after:
+        if "c" not in after or "id" not in after:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        op = "$lt" if descending else "$gt"
+        query = {"$and": [query, {"$or": [
+            {"created_at": {op: after["c"]}},
+            {"created_at": after["c"], "id": {op: after["id"]}}
+        ]}]}
+    docs = await collection.find(query, projection).sort(
+        [("created_at", direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor({"c": docs[-1]["created_at"], "id": docs[-1]["id"]})
+    return docs, next_cursor
+
+async def user_history(
+    collection: str,
+    query: Dict[str, Any],
+    owner_id: str,
+    include_archived: bool = False,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """A user's records newest first, merged with their archived ones when asked"""
+    docs = await db[collection].find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+    if include_archived:
+        docs = newest_first(docs + await archive_store.find(collection, owner_id, limit), limit)
+    return docs
+
+EXPORT_BATCH_SIZE = 500
+
+def export_response(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    fmt: str,
+    columns: List[str],
+    filename: str,
+    descending: bool = True
+) -> StreamingResponse:
+    """Stream every matching document as NDJSON or CSV straight off the cursor"""
+    direction = -1 if descending else 1
+    
+    def csv_line(values: List[Any]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+    
+    def csv_value(value: Any) -> Any:
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        return value
+    
+    async def rows():
+        cursor = collection.find(query, projection).sort(
+            [("created_at", direction), ("id", direction)]
+        ).batch_size(EXPORT_BATCH_SIZE)
+        if fmt == "csv":
+            yield csv_line(columns)
+        async for doc in cursor:
+            if fmt == "csv":
+                yield csv_line([csv_value(doc.get(c)) for c in columns])
+            else:
+                yield json.dumps(doc, default=str) + "\n"
+    
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
 
 # ============ ROOT ENDPOINT ============
 
@@ -308,6 +557,8 @@ async def register(request: RegisterRequest):
             vol_dict = volunteer.model_dump()
             vol_dict['created_at'] = vol_dict['created_at'].isoformat()
             await db.volunteers.insert_one(vol_dict)
+        elif request.role == "donor":
+            await bump_impact(donors_registered=1)
         
         # Create JWT token
         token = create_jwt_token(new_user.id, new_user.email, request.role)
@@ -426,6 +677,7 @@ async def verify_phone(request: PhoneVerifyRequest, user: Dict = Depends(get_cur
         {"id": user["id"]},
         {"$set": {"phone": request.phone, "phone_verified": True}}
     )
+    user_cache.invalidate(user["id"])
     
     return {"message": "Phone verified successfully", "phone": request.phone}
 
@@ -442,6 +694,7 @@ async def select_role(request: RoleSelectRequest, user: Dict = Depends(get_curre
         {"id": user["id"]},
         {"$set": {"role": request.role}}
     )
+    user_cache.invalidate(user["id"])
     
     # Create role-specific record
     if request.role == "volunteer":
@@ -449,6 +702,8 @@ async def select_role(request: RoleSelectRequest, user: Dict = Depends(get_curre
         vol_dict = volunteer.model_dump()
         vol_dict['created_at'] = vol_dict['created_at'].isoformat()
         await db.volunteers.insert_one(vol_dict)
+    elif request.role == "donor":
+        await bump_impact(donors_registered=1)
     
     updated_user = await db.users.find_one({"id": user["id"]}, {"_id": 0})
     # Remove password from response
@@ -506,13 +761,16 @@ async def get_ngo_verification(user: Dict = Depends(get_current_user)):
     return verification
 
 @api_router.get("/ngo/requests")
-async def get_ngo_requests(user: Dict = Depends(get_current_user)):
-    """Get all food requests created by this NGO"""
+async def get_ngo_requests(
+    include_archived: bool = False,
+    limit: int = Query(100, ge=1, le=500),
+    user: Dict = Depends(get_current_user)
+):
+    """Get the food requests created by this NGO, newest first"""
     if user.get("role") != "ngo":
         raise HTTPException(status_code=403, detail="Only NGO users can access this")
     
-    requests = await db.food_requests.find({"ngo_id": user["id"]}, {"_id": 0}).to_list(100)
-    return requests
+    return await user_history("food_requests", {"ngo_id": user["id"]}, user["id"], include_archived, limit)
 
 # ============ FOOD REQUEST ENDPOINTS ============
 
@@ -536,6 +794,19 @@ async def create_food_request(data: FoodRequestCreate, user: Dict = Depends(get_
     if not verification or verification.get("status") != "approved":
         raise HTTPException(status_code=403, detail="NGO must be verified to create requests")
     
+    req_dict = build_food_request_doc(data, user, verification)
+    
+    # GeoJSON copy of location backs the 2dsphere index used by nearby search
+    await db.food_requests.insert_one({**req_dict, "location_geo": to_geojson_point(req_dict["location"])})
+    await bump_impact(total_requests=1)
+    await rollups.record("requests_created", 1, req_dict.get("city"))
+    await announce("food_requests", {"id": req_dict["id"]}, "insert")
+    urgency_scorer.submit(req_dict)
+    
+    return {"message": "Request created", "request": req_dict}
+
+def build_food_request_doc(data: FoodRequestCreate, user: Dict, verification: Dict) -> Dict:
+    """Build the stored form of a new food request"""
     request_data = data.model_dump()
     if request_data.get('expires_at'):
         request_data['expires_at'] = datetime.fromisoformat(request_data['expires_at'].replace('Z', '+00:00'))
@@ -543,27 +814,113 @@ async def create_food_request(data: FoodRequestCreate, user: Dict = Depends(get_
     food_request = FoodRequest(
         ngo_id=user["id"],
         ngo_name=verification.get("organization_name", "Unknown NGO"),
+        city=verification.get("city"),
         **request_data
     )
     
     req_dict = food_request.model_dump()
     req_dict['created_at'] = req_dict['created_at'].isoformat()
     if req_dict.get('expires_at'):
-        req_dict['expires_at'] = req_dict['expires_at'].isoformat()
+        req_dict['expires_at'] = utc_isoformat(req_dict['expires_at'])
+    return req_dict
+
+def utc_isoformat(moment: datetime) -> str:
+    """ISO string in UTC, so stored times compare correctly as strings.
+
+    A time without an offset is taken to be UTC already.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+BULK_MAX_ITEMS = 500
+
+class BulkItems(BaseModel):
+    # Items are validated one by one so a bad item fails alone
+    items: List[Dict[str, Any]]
+
+def item_error(index: int, detail: Any) -> Dict[str, Any]:
+    return {"index": index, "status": "error", "detail": detail}
+
+def validation_detail(e: ValidationError) -> List[Dict[str, Any]]:
+    return [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+
+def failed_indexes(e: BulkWriteError, positions: List[int]) -> Dict[int, str]:
+    """Map the write errors of an unordered insert_many back to item indexes"""
+    return {positions[err["index"]]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+
+@api_router.post("/requests/bulk")
+async def create_food_requests_bulk(data: BulkItems, user: Dict = Depends(get_current_user)):
+    """Create many food requests in one call (NGO only, must be verified).
+
+    The verification is checked once and every valid item is written with
+    one unordered insert_many. The response reports each item's outcome
+    by its index.
+    """
+    if user.get("role") != "ngo":
+        raise HTTPException(status_code=403, detail="Only NGO users can create requests")
+    if len(data.items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per batch")
     
-    await db.food_requests.insert_one(req_dict)
+    verification = await db.ngo_verifications.find_one({"user_id": user["id"]}, {"_id": 0})
+    if not verification or verification.get("status") != "approved":
+        raise HTTPException(status_code=403, detail="NGO must be verified to create requests")
     
-    return {"message": "Request created", "request": req_dict}
+    results: List[Optional[Dict[str, Any]]] = [None] * len(data.items)
+    docs, positions = [], []
+    for i, raw in enumerate(data.items):
+        try:
+            req_dict = build_food_request_doc(FoodRequestCreate.model_validate(raw), user, verification)
+        except ValidationError as e:
+            results[i] = item_error(i, validation_detail(e))
+            continue
+        except ValueError as e:
+            results[i] = item_error(i, str(e))
+            continue
+        docs.append({**req_dict, "location_geo": to_geojson_point(req_dict["location"])})
+        positions.append(i)
+    
+    failed: Dict[int, str] = {}
+    if docs:
+        try:
+            await db.food_requests.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = failed_indexes(e, positions)
+    
+    created_ids = []
+    for doc, i in zip(docs, positions):
+        if i in failed:
+            results[i] = item_error(i, failed[i])
+        else:
+            results[i] = {"index": i, "status": "created", "id": doc["id"]}
+            created_ids.append(doc["id"])
+            urgency_scorer.submit(doc)
+    created = len(created_ids)
+    await bump_impact(total_requests=created)
+    await rollups.record("requests_created", created, verification.get("city"))
+    if created_ids:
+        await announce("food_requests", {"id": {"$in": created_ids}}, "insert")
+    
+    return {"created": created, "failed": len(data.items) - created, "results": results}
 
 @api_router.get("/requests")
 async def get_food_requests(
+    response: Response,
     status: Optional[str] = None,
     food_type: Optional[str] = None,
     lat: Optional[float] = None,
     lng: Optional[float] = None,
+    radius_km: Optional[float] = Query(None, gt=0),
+    limit: int = Query(100, ge=1, le=200),
+    cursor: Optional[str] = None,
     user: Dict = Depends(get_current_user)
 ):
-    """Get all active food requests (for donors and volunteers)"""
+    """Get active food requests (for donors and volunteers).
+
+    With lat/lng the database returns requests nearest-first via $geoNear,
+    each carrying its distance in km; otherwise newest-first. The token for
+    the next page is returned in the X-Next-Cursor header.
+    """
     query = {}
     if status:
         query["status"] = status
@@ -573,14 +930,19 @@ async def get_food_requests(
     if food_type:
         query["food_type"] = food_type
     
-    requests = await db.food_requests.find(query, {"_id": 0}).to_list(100)
+    after = decode_cursor(cursor) if cursor else None
     
-    # Sort by distance if location provided
     if lat is not None and lng is not None:
-        for req in requests:
-            if req.get("location"):
-                req["distance"] = haversine(lat, lng, req["location"]["lat"], req["location"]["lng"])
-        requests.sort(key=lambda x: x.get("distance", 999999))
+        requests, next_cursor = await geo_near_page(
+            db.food_requests, "location_geo", lat, lng, query, limit, after, radius_km
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return requests
+    
+    requests, next_cursor = await keyset_page(db.food_requests, query, {"_id": 0, "location_geo": 0}, limit, after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return requests
 
@@ -588,6 +950,8 @@ async def get_food_requests(
 async def get_food_request(request_id: str, user: Dict = Depends(get_current_user)):
     """Get a specific food request"""
     request = await db.food_requests.find_one({"id": request_id}, {"_id": 0})
+    if not request:
+        request = await archive_store.get("food_requests", request_id)
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
     return request
@@ -598,13 +962,21 @@ async def confirm_receipt(request_id: str, user: Dict = Depends(get_current_user
     if user.get("role") != "ngo":
         raise HTTPException(status_code=403, detail="Only NGO can confirm receipt")
     
-    request = await db.food_requests.find_one({"id": request_id, "ngo_id": user["id"]}, {"_id": 0})
+    # Marking the receipt atomically makes repeat confirmations no-ops, so
+    # meals are counted once; the pre-update document tells us the old status
+    request = await db.food_requests.find_one_and_update(
+        {"id": request_id, "ngo_id": user["id"], "receipt_confirmed_at": None},
+        {"$set": {"status": "fulfilled", "receipt_confirmed_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0}
+    )
     if not request:
+        if await db.food_requests.find_one({"id": request_id, "ngo_id": user["id"]}, {"_id": 0, "id": 1}):
+            return {"message": "Receipt already confirmed"}
         raise HTTPException(status_code=404, detail="Request not found")
     
-    await db.food_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "fulfilled"}}
+    await bump_impact(
+        meals_delivered=request.get("fulfilled_quantity", 0),
+        requests_fulfilled=1 if request.get("status") != "fulfilled" else 0
     )
     
     # Update related deliveries
@@ -613,8 +985,9 @@ async def confirm_receipt(request_id: str, user: Dict = Depends(get_current_user
         {"$set": {"status": "confirmed", "confirmed_at": datetime.now(timezone.utc).isoformat()}}
     )
     
-    # Update analytics
-    await update_analytics("meals_delivered", request.get("fulfilled_quantity", 0))
+    await rollups.record("meals_delivered", request.get("fulfilled_quantity", 0), request.get("city"))
+    await announce("food_requests", {"id": request_id})
+    await announce("deliveries", {"request_id": request_id})
     
     return {"message": "Receipt confirmed"}
 
@@ -629,27 +1002,25 @@ class FulfillmentCreate(BaseModel):
     geo_tag: Optional[Dict[str, float]] = None
     delivery_method: str
 
-@api_router.post("/donor/fulfill")
-async def create_fulfillment(data: FulfillmentCreate, user: Dict = Depends(get_current_user)):
-    """Donor accepts to fulfill a food request"""
-    if user.get("role") != "donor":
-        raise HTTPException(status_code=403, detail="Only donors can fulfill requests")
-    
-    # Check request exists and is active
-    request = await db.food_requests.find_one({"id": data.request_id}, {"_id": 0})
-    if not request:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    if request.get("status") not in ["approved", "active"]:
-        raise HTTPException(status_code=400, detail="Request is not available for fulfillment")
-    
+def build_fulfillment_docs(data: FulfillmentCreate, user: Dict, request: Dict) -> Tuple[Dict, Optional[Dict]]:
+    """Build the fulfillment document and, for volunteer delivery, its delivery document.
+
+    Raises ValueError for an unreadable availability_time or geo_tag, so
+    callers can reject the item before reserving any quantity.
+    """
+    try:
+        availability_time = datetime.fromisoformat(data.availability_time.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError("availability_time must be an ISO 8601 datetime")
+    if data.geo_tag is not None and not {"lat", "lng"} <= data.geo_tag.keys():
+        raise ValueError("geo_tag needs lat and lng")
     fulfillment = DonorFulfillment(
         request_id=data.request_id,
         donor_id=user["id"],
         donor_name=user.get("name", "Anonymous Donor"),
         quantity=data.quantity,
         food_condition=data.food_condition,
-        availability_time=datetime.fromisoformat(data.availability_time.replace('Z', '+00:00')),
+        availability_time=availability_time,
         food_photo=data.food_photo,
         geo_tag=data.geo_tag,
         delivery_method=data.delivery_method
@@ -658,45 +1029,395 @@ async def create_fulfillment(data: FulfillmentCreate, user: Dict = Depends(get_c
     ful_dict = fulfillment.model_dump()
     ful_dict['created_at'] = ful_dict['created_at'].isoformat()
     ful_dict['availability_time'] = ful_dict['availability_time'].isoformat()
-    await db.fulfillments.insert_one(ful_dict)
     
-    # Update request status
-    new_fulfilled = request.get("fulfilled_quantity", 0) + data.quantity
-    new_status = "active" if new_fulfilled < request.get("quantity", 0) else "fulfilled"
+    if data.delivery_method != "volunteer":
+        return ful_dict, None
     
-    await db.food_requests.update_one(
-        {"id": data.request_id},
-        {"$set": {"status": new_status, "fulfilled_quantity": new_fulfilled}}
+    delivery = Delivery(
+        fulfillment_id=fulfillment.id,
+        request_id=data.request_id,
+        donor_id=user["id"],
+        ngo_id=request["ngo_id"],
+        pickup_location=data.geo_tag or {"lat": 0, "lng": 0},
+        pickup_address="Donor location",
+        dropoff_location=request.get("location", {"lat": 0, "lng": 0}),
+        dropoff_address=request.get("address", "NGO location"),
+        city=request.get("city")
     )
-    
-    # Create delivery record if volunteer delivery
-    if data.delivery_method == "volunteer":
-        ngo_verification = await db.ngo_verifications.find_one({"user_id": request["ngo_id"]}, {"_id": 0})
-        
-        delivery = Delivery(
-            fulfillment_id=fulfillment.id,
-            request_id=data.request_id,
-            donor_id=user["id"],
-            ngo_id=request["ngo_id"],
-            pickup_location=data.geo_tag or {"lat": 0, "lng": 0},
-            pickup_address="Donor location",
-            dropoff_location=request.get("location", {"lat": 0, "lng": 0}),
-            dropoff_address=request.get("address", "NGO location")
+    del_dict = delivery.model_dump()
+    del_dict['created_at'] = del_dict['created_at'].isoformat()
+    del_dict['pickup_geo'] = to_geojson_point(del_dict['pickup_location'])
+    del_dict['trip_km'] = haversine(
+        del_dict['pickup_location']['lat'], del_dict['pickup_location']['lng'],
+        del_dict['dropoff_location']['lat'], del_dict['dropoff_location']['lng']
+    )
+    return ful_dict, del_dict
+
+async def reserve_request_quantity(request_id: str, quantity: int, session=None) -> Optional[Dict]:
+    """Atomically add `quantity` to a request's fulfilled_quantity, never past its quantity.
+
+    The status flips to fulfilled in the same update once the cap is reached.
+    Returns the request as it was before the update, or None if it is
+    unavailable or the quantity would overshoot.
+    """
+    new_total = {"$add": [{"$ifNull": ["$fulfilled_quantity", 0]}, quantity]}
+    return await db.food_requests.find_one_and_update(
+        {
+            "id": request_id,
+            "status": {"$in": ["approved", "active"]},
+            "$expr": {"$lte": [new_total, "$quantity"]}
+        },
+        [{"$set": {
+            "fulfilled_quantity": new_total,
+            "status": {"$cond": [{"$gte": [new_total, "$quantity"]}, "fulfilled", "active"]}
+        }}],
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+
+def fills_request(request: Dict, quantity: int) -> bool:
+    """Whether adding `quantity` to the pre-update request filled it"""
+    return request.get("fulfilled_quantity", 0) + quantity >= request.get("quantity", 0)
+
+async def release_request_quantity(request_id: str, quantity: int, session=None) -> bool:
+    """Undo reserve_request_quantity, reopening the request if it had been filled.
+
+    Returns whether the release reopened the request.
+    """
+    new_total = {"$subtract": [{"$ifNull": ["$fulfilled_quantity", 0]}, quantity]}
+    previous = await db.food_requests.find_one_and_update(
+        {"id": request_id},
+        [{"$set": {
+            "fulfilled_quantity": new_total,
+            "status": {"$cond": [
+                {"$and": [{"$eq": ["$status", "fulfilled"]}, {"$lt": [new_total, "$quantity"]}]},
+                "active",
+                "$status"
+            ]}
+        }}],
+        projection={"_id": 0, "status": 1, "quantity": 1, "fulfilled_quantity": 1},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    return bool(previous) and previous.get("status") == "fulfilled" and (
+        previous.get("fulfilled_quantity", 0) - quantity < previous.get("quantity", 0)
+    )
+
+async def quantity_rejection(request_id: str, quantity: int) -> HTTPException:
+    """Explain why reserve_request_quantity refused a request"""
+    request = await db.food_requests.find_one({"id": request_id}, {"_id": 0, "status": 1, "quantity": 1, "fulfilled_quantity": 1})
+    if not request:
+        return HTTPException(status_code=404, detail="Request not found")
+    if request.get("status") not in ["approved", "active"]:
+        return HTTPException(status_code=400, detail="Request is not available for fulfillment")
+    remaining = request.get("quantity", 0) - request.get("fulfilled_quantity", 0)
+    return HTTPException(status_code=400, detail=f"Quantity exceeds remaining need ({remaining} servings left)")
+
+# Multi-document transactions need a replica set or sharded cluster;
+# init_database detects which one we are talking to.
+transactions_supported = False
+
+async def run_in_transaction(fn, retries: int = 3):
+    """Run `fn(session)` in a transaction when supported, else `fn(None)`"""
+    if not transactions_supported:
+        return await fn(None)
+    for attempt in range(retries):
+        try:
+            async with await client.start_session() as session:
+                async with session.start_transaction():
+                    return await fn(session)
+        except PyMongoError as e:
+            if not e.has_error_label("TransientTransactionError") or attempt == retries - 1:
+                raise
+
+# An in_progress key whose lease has lapsed belongs to a worker that died
+# mid-request, and a retry may take it over
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+async def begin_idempotent(scope: str, user_id: str, key: Optional[str]) -> Tuple[Optional[Dict], Optional[str]]:
+    """Reserve an idempotency key.
+
+    Returns (stored response, None) if the key already completed, else
+    (None, lease) where `lease` identifies this reservation for
+    finish_idempotent.
+    """
+    if not key:
+        return None, None
+    now = datetime.now(timezone.utc)
+    lease = str(uuid.uuid4())
+    lease_fields = {"status": "in_progress", "lease": lease, "lease_expires_at": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}
+    try:
+        await db.idempotency_keys.insert_one({
+            "scope": scope,
+            "user_id": user_id,
+            "key": key,
+            **lease_fields,
+            "created_at": now
+        })
+        return None, lease
+    except DuplicateKeyError:
+        pass
+    taken = await db.idempotency_keys.find_one_and_update(
+        {"scope": scope, "user_id": user_id, "key": key, "status": "in_progress", "lease_expires_at": {"$lt": now}},
+        {"$set": lease_fields}
+    )
+    if taken:
+        logger.warning(f"Took over the lapsed Idempotency-Key {key} for {scope}")
+        return None, lease
+    existing = await db.idempotency_keys.find_one({"scope": scope, "user_id": user_id, "key": key}, {"_id": 0})
+    if existing and existing.get("status") == "done":
+        return existing["response"], None
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+async def finish_idempotent(scope: str, user_id: str, key: Optional[str], lease: Optional[str], response: Optional[Dict]):
+    """Store the response for a key, or release the key (response=None) so a retry can run.
+
+    Only the holder of the current lease may do either; a request whose
+    lease was taken over leaves the key to the one that took it.
+    """
+    if not key:
+        return
+    query = {"scope": scope, "user_id": user_id, "key": key, "status": "in_progress", "lease": lease}
+    if response is None:
+        await db.idempotency_keys.delete_one(query)
+    else:
+        await db.idempotency_keys.update_one(
+            query,
+            {"$set": {"status": "done", "response": response}, "$unset": {"lease": "", "lease_expires_at": ""}}
         )
-        del_dict = delivery.model_dump()
-        del_dict['created_at'] = del_dict['created_at'].isoformat()
-        await db.deliveries.insert_one(del_dict)
+
+@api_router.post("/donor/fulfill")
+async def create_fulfillment(
+    data: FulfillmentCreate,
+    idempotency_key: Optional[str] = Header(None),
+    user: Dict = Depends(get_current_user)
+):
+    """Donor accepts to fulfill a food request.
+
+    The quantity is added with a capped atomic update, in one transaction
+    with the fulfillment and delivery inserts where the deployment
+    supports it. Retries carrying the same Idempotency-Key header get the
+    original response back instead of counting twice.
+    """
+    if user.get("role") != "donor":
+        raise HTTPException(status_code=403, detail="Only donors can fulfill requests")
+    if data.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    
+    stored, lease = await begin_idempotent("donor_fulfill", user["id"], idempotency_key)
+    if stored is not None:
+        return stored
+    
+    try:
+        result = await fulfill_request(data, user)
+    except BaseException:
+        await finish_idempotent("donor_fulfill", user["id"], idempotency_key, lease, None)
+        raise
+    await finish_idempotent("donor_fulfill", user["id"], idempotency_key, lease, result)
+    return result
+
+async def fulfill_request(data: FulfillmentCreate, user: Dict) -> Dict:
+    # Check request exists and is active
+    request = await db.food_requests.find_one({"id": data.request_id}, {"_id": 0})
+    if not request:
+        raise HTTPException(status_code=404, detail="Request not found")
+    
+    if request.get("status") not in ["approved", "active"]:
+        raise HTTPException(status_code=400, detail="Request is not available for fulfillment")
+    
+    try:
+        ful_dict, del_dict = build_fulfillment_docs(data, user, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def write(session):
+        previous = await reserve_request_quantity(data.request_id, data.quantity, session)
+        if previous is None:
+            raise await quantity_rejection(data.request_id, data.quantity)
+        try:
+            await db.fulfillments.insert_one({**ful_dict}, session=session)
+            if del_dict:
+                await db.deliveries.insert_one({**del_dict}, session=session)
+        except PyMongoError:
+            # Inside a transaction the abort undoes the reservation; without
+            # one it has to be given back by hand
+            if session is None:
+                await release_request_quantity(data.request_id, data.quantity)
+                await db.fulfillments.delete_one({"id": ful_dict["id"]})
+            raise
+        return previous
+    
+    previous = await run_in_transaction(write)
+    filled = fills_request(previous, data.quantity)
+    if filled:
+        await bump_impact(requests_fulfilled=1)
+    await rollups.record_many([
+        ("meals_donated", data.quantity, request.get("city"), None),
+        ("requests_fulfilled", int(filled), request.get("city"), None)
+    ])
+    await announce("food_requests", {"id": data.request_id})
+    if del_dict:
+        await announce("deliveries", {"id": del_dict["id"]}, "insert")
     
     return {"message": "Fulfillment created", "fulfillment": ful_dict}
 
+@api_router.post("/donor/fulfill/bulk")
+async def create_fulfillments_bulk(
+    data: BulkItems,
+    idempotency_key: Optional[str] = Header(None),
+    user: Dict = Depends(get_current_user)
+):
+    """Fulfill many food requests in one call.
+
+    Requests are loaded in one $in query. Each request's quantity is
+    reserved with one capped atomic update for all of its items.
+    Fulfillments and deliveries are written with unordered insert_many.
+    Items that do not fit within a request's remaining need are rejected
+    individually, in order. Idempotency-Key works as on /donor/fulfill.
+    """
+    if user.get("role") != "donor":
+        raise HTTPException(status_code=403, detail="Only donors can fulfill requests")
+    if len(data.items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per batch")
+    
+    stored, lease = await begin_idempotent("donor_fulfill_bulk", user["id"], idempotency_key)
+    if stored is not None:
+        return stored
+    try:
+        result = await fulfill_requests_bulk(data.items, user)
+    except BaseException:
+        await finish_idempotent("donor_fulfill_bulk", user["id"], idempotency_key, lease, None)
+        raise
+    await finish_idempotent("donor_fulfill_bulk", user["id"], idempotency_key, lease, result)
+    return result
+
+async def fulfill_requests_bulk(items: List[Dict[str, Any]], user: Dict) -> Dict:
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    valid: List[Tuple[int, FulfillmentCreate]] = []
+    for i, raw in enumerate(items):
+        try:
+            item = FulfillmentCreate.model_validate(raw)
+        except ValidationError as e:
+            results[i] = item_error(i, validation_detail(e))
+            continue
+        if item.quantity <= 0:
+            results[i] = item_error(i, "Quantity must be positive")
+            continue
+        valid.append((i, item))
+    
+    request_ids = list({item.request_id for _, item in valid})
+    requests = {
+        r["id"]: r for r in await db.food_requests.find({"id": {"$in": request_ids}}, {"_id": 0}).to_list(None)
+    }
+    
+    # Plan each request's items against the remaining need, in item order.
+    # Documents are built first so a bad item is rejected before anything is reserved.
+    planned: Dict[str, List[Tuple[int, FulfillmentCreate]]] = {}
+    built: Dict[int, Tuple[Dict, Optional[Dict]]] = {}
+    for i, item in valid:
+        request = requests.get(item.request_id)
+        if not request:
+            results[i] = item_error(i, "Request not found")
+            continue
+        if request.get("status") not in ["approved", "active"]:
+            results[i] = item_error(i, "Request is not available for fulfillment")
+            continue
+        try:
+            built[i] = build_fulfillment_docs(item, user, request)
+        except ValueError as e:
+            results[i] = item_error(i, str(e))
+            continue
+        planned.setdefault(item.request_id, []).append((i, item))
+    
+    async def reserve(request_id: str, group: List[Tuple[int, FulfillmentCreate]]) -> Tuple[List[Tuple[int, FulfillmentCreate]], int]:
+        """Reserve as many of the group's items as fit; returns them and how many requests got filled"""
+        request = requests[request_id]
+        remaining = request.get("quantity", 0) - request.get("fulfilled_quantity", 0)
+        accepted = []
+        for i, item in group:
+            if item.quantity <= remaining:
+                accepted.append((i, item))
+                remaining -= item.quantity
+            else:
+                results[i] = item_error(i, f"Quantity exceeds remaining need ({remaining} servings left)")
+        if not accepted:
+            return [], 0
+        total = sum(item.quantity for _, item in accepted)
+        previous = await reserve_request_quantity(request_id, total)
+        if previous is not None:
+            return accepted, int(fills_request(previous, total))
+        # The request changed since we read it: fall back to one capped update per item
+        reserved, filled = [], 0
+        for i, item in accepted:
+            previous = await reserve_request_quantity(request_id, item.quantity)
+            if previous is None:
+                results[i] = item_error(i, (await quantity_rejection(request_id, item.quantity)).detail)
+            else:
+                reserved.append((i, item))
+                filled += int(fills_request(previous, item.quantity))
+        return reserved, filled
+    
+    reservations = await asyncio.gather(*(reserve(rid, group) for rid, group in planned.items()))
+    
+    planned_docs = [(i, *built[i]) for accepted, _ in reservations for i, _ in accepted]
+    positions = [i for i, _, _ in planned_docs]
+    
+    failed: Dict[int, str] = {}
+    if planned_docs:
+        try:
+            await db.fulfillments.insert_many([{**ful} for _, ful, _ in planned_docs], ordered=False)
+        except BulkWriteError as e:
+            failed = failed_indexes(e, positions)
+    delivery_docs = [(i, dlv) for i, _, dlv in planned_docs if dlv and i not in failed]
+    if delivery_docs:
+        try:
+            await db.deliveries.insert_many([{**dlv} for _, dlv in delivery_docs], ordered=False)
+        except BulkWriteError as e:
+            # A fulfillment whose delivery could not be written is withdrawn with it
+            undelivered = failed_indexes(e, [i for i, _ in delivery_docs])
+            await db.fulfillments.delete_many({"id": {"$in": [built[i][0]["id"] for i in undelivered]}})
+            failed.update(undelivered)
+    deliveries = [dlv for i, dlv in delivery_docs if i not in failed]
+    
+    created = 0
+    reopened = set()
+    for i, ful_dict, _ in planned_docs:
+        if i in failed:
+            # Give back the quantity of fulfillments that could not be written
+            if await release_request_quantity(ful_dict["request_id"], ful_dict["quantity"]):
+                reopened.add(ful_dict["request_id"])
+            results[i] = item_error(i, failed[i])
+        else:
+            results[i] = {"index": i, "status": "created", "fulfillment": ful_dict}
+            created += 1
+    
+    # A request reopened by a release is no longer filled
+    filled = {rid: 0 if rid in reopened else f for rid, (_, f) in zip(planned, reservations)}
+    await bump_impact(requests_fulfilled=sum(filled.values()))
+    await rollups.record_many(
+        [("meals_donated", ful["quantity"], requests[ful["request_id"]].get("city"), None)
+         for i, ful, _ in planned_docs if i not in failed]
+        + [("requests_fulfilled", f, requests[rid].get("city"), None) for rid, f in filled.items()]
+    )
+    if planned:
+        await announce("food_requests", {"id": {"$in": list(planned)}})
+    if deliveries:
+        await announce("deliveries", {"id": {"$in": [d["id"] for d in deliveries]}}, "insert")
+    
+    return {"created": created, "failed": len(items) - created, "results": results}
+
 @api_router.get("/donor/fulfillments")
-async def get_donor_fulfillments(user: Dict = Depends(get_current_user)):
-    """Get all fulfillments by this donor"""
+async def get_donor_fulfillments(
+    include_archived: bool = False,
+    limit: int = Query(100, ge=1, le=500),
+    user: Dict = Depends(get_current_user)
+):
+    """Get the fulfillments by this donor, newest first"""
     if user.get("role") != "donor":
         raise HTTPException(status_code=403, detail="Only donors can access this")
     
-    fulfillments = await db.fulfillments.find({"donor_id": user["id"]}, {"_id": 0}).to_list(100)
-    return fulfillments
+    return await user_history("fulfillments", {"donor_id": user["id"]}, user["id"], include_archived, limit)
 
 # ============ VOLUNTEER ENDPOINTS ============
 
@@ -713,9 +1434,11 @@ async def get_volunteer_profile(user: Dict = Depends(get_current_user)):
 async def update_volunteer_profile(
     transport_mode: Optional[str] = None,
     id_document: Optional[str] = None,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
     user: Dict = Depends(get_current_user)
 ):
-    """Update volunteer profile"""
+    """Update volunteer profile, optionally with the volunteer's current position"""
     if user.get("role") != "volunteer":
         raise HTTPException(status_code=403, detail="Only volunteers can access this")
     
@@ -724,6 +1447,8 @@ async def update_volunteer_profile(
         update_data["transport_mode"] = transport_mode
     if id_document:
         update_data["id_document"] = id_document
+    if lat is not None and lng is not None:
+        update_data.update(volunteer_location_fields(lat, lng))
     
     if update_data:
         await db.volunteers.update_one(
@@ -735,8 +1460,12 @@ async def update_volunteer_profile(
     return volunteer
 
 @api_router.get("/volunteer/deliveries")
-async def get_volunteer_deliveries(user: Dict = Depends(get_current_user)):
-    """Get deliveries assigned to this volunteer"""
+async def get_volunteer_deliveries(
+    include_archived: bool = False,
+    limit: int = Query(100, ge=1, le=500),
+    user: Dict = Depends(get_current_user)
+):
+    """Get deliveries assigned to this volunteer, newest first"""
     if user.get("role") != "volunteer":
         raise HTTPException(status_code=403, detail="Only volunteers can access this")
     
@@ -745,19 +1474,40 @@ async def get_volunteer_deliveries(user: Dict = Depends(get_current_user)):
     if not volunteer or volunteer.get("status") != "approved":
         return []
     
-    deliveries = await db.deliveries.find(
+    return await user_history(
+        "deliveries",
         {"$or": [{"volunteer_id": user["id"]}, {"additional_volunteers": user["id"]}]},
-        {"_id": 0}
-    ).to_list(100)
-    return deliveries
+        user["id"], include_archived, limit
+    )
+
+# Search radius for detour ranking, which has to sort its candidates in full
+DETOUR_SEARCH_RADIUS_KM = float(os.environ.get('DETOUR_SEARCH_RADIUS_KM', '15'))
 
 @api_router.get("/volunteer/available-deliveries")
 async def get_available_deliveries(
+    response: Response,
+    background_tasks: BackgroundTasks,
     lat: Optional[float] = None,
     lng: Optional[float] = None,
+    radius_km: Optional[float] = Query(None, gt=0),
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    rank_by: str = Query("distance", pattern="^(distance|detour)$"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     user: Dict = Depends(get_current_user)
 ):
-    """Get available deliveries near volunteer"""
+    """Get available deliveries near volunteer.
+
+    With lat/lng, pending pickups come back nearest-first, ranked by the
+    in-memory dispatch index while a change stream keeps it current and by
+    the (pickup_geo, status, volunteer_id) index otherwise. rank_by=detour orders them by
+    the full trip instead: volunteer to pickup plus pickup to drop-off.
+    The bounding box and radius filters apply to the pickup point. The
+    token for the next page is returned in the X-Next-Cursor header.
+    """
     if user.get("role") != "volunteer":
         raise HTTPException(status_code=403, detail="Only volunteers can access this")
     
@@ -765,24 +1515,380 @@ async def get_available_deliveries(
     if not volunteer or volunteer.get("status") != "approved":
         raise HTTPException(status_code=403, detail="Volunteer must be verified")
     
-    deliveries = await db.deliveries.find(
-        {"status": "pending", "volunteer_id": None},
-        {"_id": 0}
-    ).to_list(100)
+    query = {"status": "pending", "volunteer_id": None}
+    
+    bbox = [min_lat, min_lng, max_lat, max_lng]
+    if any(v is not None for v in bbox):
+        if any(v is None for v in bbox):
+            raise HTTPException(status_code=400, detail="Bounding box needs min_lat, min_lng, max_lat and max_lng")
+        query["pickup_geo"] = {"$geoWithin": {"$geometry": bbox_polygon(min_lat, min_lng, max_lat, max_lng)}}
+    
+    after = decode_cursor(cursor) if cursor else None
+    has_location = lat is not None and lng is not None
+    if has_location and not cursor:
+        # Batch assignment needs to know where volunteers are; record it after responding
+        background_tasks.add_task(record_volunteer_location, user["id"], lat, lng)
+    
+    if rank_by == "detour":
+        if not has_location:
+            raise HTTPException(status_code=400, detail="lat and lng are required to rank by detour")
+        pipeline = [
+            {"$geoNear": {
+                "near": {"type": "Point", "coordinates": [lng, lat]},
+                "key": "pickup_geo",
+                "distanceField": "distance_m",
+                "spherical": True,
+                "maxDistance": (radius_km or DETOUR_SEARCH_RADIUS_KM) * 1000,
+                "query": query
+            }},
+            {"$addFields": {
+                "distance": {"$divide": ["$distance_m", 1000]},
+                "detour_km": {"$add": [{"$divide": ["$distance_m", 1000]}, {"$ifNull": ["$trip_km", 0]}]}
+            }},
+            {"$sort": {"detour_km": 1, "id": 1}}
+        ]
+        if after:
+            if "t" not in after or "id" not in after:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            pipeline.append({"$match": {"$or": [
+                {"detour_km": {"$gt": after["t"]}},
+                {"detour_km": after["t"], "id": {"$gt": after["id"]}}
+            ]}})
+        pipeline += [{"$limit": limit + 1}, {"$project": {"_id": 0, "pickup_geo": 0, "distance_m": 0}}]
+        deliveries = await db.deliveries.aggregate(pipeline).to_list(limit + 1)
+        if len(deliveries) > limit:
+            deliveries = deliveries[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor({"t": deliveries[-1]["detour_km"], "id": deliveries[-1]["id"]})
+        return deliveries
+    
+    if has_location and dispatch_index_live():
+        deliveries, next_cursor = await dispatch_index_page(
+            lat, lng, limit, after, radius_km, None if min_lat is None else (min_lat, min_lng, max_lat, max_lng)
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return deliveries
     
-    # Sort by distance if location provided
-    if lat is not None and lng is not None:
-        for delivery in deliveries:
-            if delivery.get("pickup_location"):
-                delivery["distance"] = haversine(
-                    lat, lng,
-                    delivery["pickup_location"]["lat"],
-                    delivery["pickup_location"]["lng"]
-                )
-        deliveries.sort(key=lambda x: x.get("distance", 999999))
+    if has_location:
+        deliveries, next_cursor = await geo_near_page(
+            db.deliveries, "pickup_geo", lat, lng, query, limit, after, radius_km
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return deliveries
+    
+    # Without a location, oldest pending pickups come first
+    deliveries, next_cursor = await keyset_page(
+        db.deliveries, query, {"_id": 0, "pickup_geo": 0}, limit, after, descending=False
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return deliveries
 
+OPEN_DELIVERY_QUERY = {"status": "pending", "volunteer_id": None}
+
+def volunteer_location_fields(lat: float, lng: float) -> Dict[str, Any]:
+    return {"last_location": {"lat": lat, "lng": lng}, "last_location_at": datetime.now(timezone.utc).isoformat()}
+
+async def record_volunteer_location(user_id: str, lat: float, lng: float):
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return
+    try:
+        await db.volunteers.update_one({"user_id": user_id}, {"$set": volunteer_location_fields(lat, lng)})
+    except PyMongoError as e:
+        logger.warning(f"Could not record volunteer location: {e}")
+
+def is_open_delivery(doc: Dict[str, Any]) -> bool:
+    location = doc.get("pickup_location") or {}
+    return (
+        doc.get("status") == "pending" and not doc.get("volunteer_id")
+        and location.get("lat") is not None and location.get("lng") is not None
+    )
+
+async def dispatch_index_page(
+    lat: float,
+    lng: float,
+    limit: int,
+    after: Optional[Dict[str, Any]],
+    radius_km: Optional[float],
+    bbox: Optional[Tuple[float, float, float, float]]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Nearest-first page of open deliveries ranked by the in-memory index.
+
+    Only the page's documents are read from MongoDB, re-checked against
+    OPEN_DELIVERY_QUERY in case another worker claimed them. Ids that no
+    longer match are dropped from the index.
+    """
+    if after is not None and ("k" not in after or "id" not in after):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    position = (after["k"], after["id"]) if after else None
+    ranked = dispatch_index.nearest(lat, lng, limit + 1, max_km=radius_km, after=position, bbox=bbox)
+    page = ranked[:limit]
+    docs = await db.deliveries.find(
+        {"id": {"$in": [i for _, i in page]}, **OPEN_DELIVERY_QUERY}, {"_id": 0, "pickup_geo": 0}
+    ).to_list(None)
+    by_id = {d["id"]: d for d in docs}
+    deliveries = []
+    for km, delivery_id in page:
+        doc = by_id.get(delivery_id)
+        if doc is None:
+            dispatch_index.remove(delivery_id)
+            continue
+        doc["distance"] = km
+        deliveries.append(doc)
+    
+    next_cursor = None
+    if len(ranked) > limit:
+        next_cursor = encode_cursor({"k": page[-1][0], "id": page[-1][1]})
+    return deliveries, next_cursor
+
+def dispatch_index_live() -> bool:
+    """Whether the dispatch index can rank deliveries.
+
+    Without a change stream a worker only hears about its own writes, so
+    deliveries created or claimed on other workers would be missing or
+    stale until the next consistency check.
+    """
+    return dispatch_index.ready and event_bus.external
+
+def track_open_delivery(event) -> None:
+    """Event bus listener keeping the dispatch index in step with delivery writes"""
+    if event.collection != "deliveries" or not dispatch_index.ready:
+        return
+    doc = event.doc
+    if is_open_delivery(doc):
+        dispatch_index.upsert(doc["id"], doc["pickup_location"]["lat"], doc["pickup_location"]["lng"])
+    else:
+        dispatch_index.remove(doc["id"])
+
+event_bus.listeners.append(track_open_delivery)
+
+async def open_delivery_points() -> List[Tuple[str, float, float]]:
+    docs = await db.deliveries.find(OPEN_DELIVERY_QUERY, {"_id": 0, "id": 1, "pickup_location": 1, "status": 1}).to_list(None)
+    return [(d["id"], d["pickup_location"]["lat"], d["pickup_location"]["lng"]) for d in docs if is_open_delivery(d)]
+
+async def check_dispatch_index(repair: bool = False) -> Dict[str, Any]:
+    """Compare the dispatch index with MongoDB, optionally fixing what differs"""
+    points = await open_delivery_points()
+    diff = dispatch_index.diff(points)
+    if repair:
+        by_id = {p[0]: p for p in points}
+        for delivery_id in diff["missing"] + diff["moved"]:
+            dispatch_index.upsert(*by_id[delivery_id])
+        for delivery_id in diff["stale"]:
+            dispatch_index.remove(delivery_id)
+    counts = {name: len(ids) for name, ids in diff.items()}
+    if any(counts.values()):
+        logger.info(f"Dispatch index drift: {counts}{' (repaired)' if repair else ''}")
+    return {
+        "consistent": not any(counts.values()),
+        "repaired": repair,
+        **counts,
+        # A sample is enough to investigate; the full lists can be large
+        "sample": {name: ids[:20] for name, ids in diff.items()},
+        "index": dispatch_index.stats()
+    }
+
+async def resync_dispatch_index() -> None:
+    """Load or catch up the dispatch index once the change stream is open, so no later write is missed"""
+    if not DISPATCH_INDEX_ENABLED:
+        return
+    if dispatch_index.ready:
+        await check_dispatch_index(repair=True)
+        return
+    start = time.perf_counter()
+    dispatch_index.load(await open_delivery_points())
+    logger.info(f"Dispatch index loaded {len(dispatch_index)} open deliveries in {time.perf_counter() - start:.2f}s")
+
+async def maintain_dispatch_index() -> Dict[str, Any]:
+    """Periodic check of the dispatch index; without a change stream the index is unused and unloaded"""
+    if not event_bus.external:
+        if dispatch_index.ready:
+            dispatch_index.unload()
+            logger.info("Dispatch index unloaded: no change stream is feeding it")
+        return {"loaded": False}
+    return await check_dispatch_index(repair=True)
+
+# An accepted delivery is held for the volunteer until pickup; once the lease
+# lapses without a pickup, another volunteer may claim it.
+DELIVERY_CLAIM_LEASE_MINUTES = int(os.environ.get('DELIVERY_CLAIM_LEASE_MINUTES', '30'))
+dispatch_stats = {"claims": 0, "reclaims": 0, "repeat_claims": 0, "conflicts": 0, "batch_assigned": 0, "released": 0}
+
+async def claim_delivery(delivery_id: str, volunteer_id: str) -> Optional[Dict[str, Any]]:
+    """Atomically assign a delivery to a volunteer.
+
+    Succeeds only if the delivery is unclaimed, already held by this
+    volunteer, or held under a lease that has lapsed. Returns the document
+    as it was before the claim, or None if someone else holds it.
+    """
+    now = datetime.now(timezone.utc)
+    return await db.deliveries.find_one_and_update(
+        {"id": delivery_id, "$or": [
+            {"status": "pending", "volunteer_id": None},
+            {"status": "assigned", "volunteer_id": volunteer_id},
+            {"status": "assigned", "claim_expires_at": {"$lt": now.isoformat()}}
+        ]},
+        {"$set": {
+            "volunteer_id": volunteer_id,
+            "status": "assigned",
+            "assigned_at": now.isoformat(),
+            "claim_expires_at": (now + timedelta(minutes=DELIVERY_CLAIM_LEASE_MINUTES)).isoformat()
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+
+# Batch assignment: a volunteer's position is usable for this long after it was reported
+VOLUNTEER_LOCATION_MAX_AGE_MINUTES = int(os.environ.get('VOLUNTEER_LOCATION_MAX_AGE_MINUTES', '60'))
+DISPATCH_ASSIGN_SECONDS = int(os.environ.get('DISPATCH_ASSIGN_SECONDS', '0'))
+ACTIVE_DELIVERY_STATUSES = ["assigned", "picked_up"]
+
+async def load_assignment_inputs() -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Open deliveries, and approved volunteers with a recent position and spare capacity"""
+    seen_since = (datetime.now(timezone.utc) - timedelta(minutes=VOLUNTEER_LOCATION_MAX_AGE_MINUTES)).isoformat()
+    deliveries, volunteers = await asyncio.gather(
+        db.deliveries.find(OPEN_DELIVERY_QUERY, {"_id": 0, "id": 1, "status": 1, "pickup_location": 1, "trip_km": 1}).to_list(None),
+        db.volunteers.find(
+            {"status": "approved", "last_location_at": {"$gte": seen_since}},
+            {"_id": 0, "user_id": 1, "transport_mode": 1, "last_location": 1}
+        ).to_list(None)
+    )
+    deliveries = [d for d in deliveries if is_open_delivery(d)]
+    
+    # Deliveries a volunteer already carries use up part of their capacity
+    load = {}
+    if volunteers:
+        load = {g["_id"]: g["count"] async for g in db.deliveries.aggregate([
+            {"$match": {"volunteer_id": {"$in": [v["user_id"] for v in volunteers]}, "status": {"$in": ACTIVE_DELIVERY_STATUSES}}},
+            {"$group": {"_id": "$volunteer_id", "count": {"$sum": 1}}}
+        ])}
+    available = []
+    for v in volunteers:
+        capacity = mode_profile(v.get("transport_mode"))[1] - load.get(v["user_id"], 0)
+        if capacity > 0 and v.get("last_location"):
+            available.append({**v, "location": v["last_location"], "capacity": capacity})
+    return deliveries, available
+
+async def run_batch_assignment(apply: bool = False, candidates: int = 32) -> Dict[str, Any]:
+    """Assign every open delivery at once; with apply, claim the chosen pairs.
+
+    Claims go through claim_delivery, so a delivery taken by a volunteer
+    while the batch was being solved is skipped and counted as a conflict.
+    """
+    start = time.perf_counter()
+    deliveries, volunteers = await load_assignment_inputs()
+    loaded = time.perf_counter()
+    # The solver is CPU-bound NumPy; keep it off the event loop
+    result = await asyncio.to_thread(assign, deliveries, volunteers, candidates)
+    solved = time.perf_counter()
+    
+    applied, conflicts = 0, 0
+    if apply and result["pairs"]:
+        claims = await asyncio.gather(*(claim_delivery(p["delivery_id"], p["volunteer_id"]) for p in result["pairs"]))
+        claimed = [p["delivery_id"] for p, previous in zip(result["pairs"], claims) if previous is not None]
+        applied, conflicts = len(claimed), len(claims) - len(claimed)
+        dispatch_stats["batch_assigned"] += applied
+        dispatch_stats["conflicts"] += conflicts
+        if claimed:
+            await announce("deliveries", {"id": {"$in": claimed}})
+        logger.info(f"Batch assignment claimed {applied} deliveries ({conflicts} conflicts)")
+    
+    return {
+        **result,
+        "applied": applied,
+        "conflicts": conflicts,
+        "deliveries": len(deliveries),
+        "volunteers": len(volunteers),
+        "timings_ms": {
+            "load": round((loaded - start) * 1000, 1),
+            "solve": round((solved - loaded) * 1000, 1),
+            "apply": round((time.perf_counter() - solved) * 1000, 1)
+        }
+    }
+
+# Route planning: how long the planner may search, and how many open deliveries it may consider adding
+ROUTE_BUDGET_MS = float(os.environ.get('ROUTE_BUDGET_MS', '200'))
+ROUTE_OPEN_CANDIDATES = int(os.environ.get('ROUTE_OPEN_CANDIDATES', '15'))
+
+@api_router.get("/volunteer/route")
+async def get_volunteer_route(
+    background_tasks: BackgroundTasks,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    include_open: bool = True,
+    radius_km: Optional[float] = Query(None, gt=0),
+    max_minutes: float = Query(240, gt=0, le=720),
+    max_added_minutes: float = Query(30, ge=0),
+    budget_ms: float = Query(ROUTE_BUDGET_MS, gt=0, le=2000),
+    user: Dict = Depends(get_current_user)
+):
+    """Plan one multi-stop run through the volunteer's deliveries.
+
+    Deliveries the volunteer already holds are always planned. With
+    include_open, nearby open deliveries are added when each one
+    lengthens the run by at most max_added_minutes; they come back in
+    `added` and still have to be accepted. Without lat/lng the last
+    reported position is used. Stops respect the donor's availability
+    time, how long the food keeps, and how much the transport mode
+    carries. Deliveries in `renew_claims` are reached after their claim
+    lapses; accepting them again renews it.
+    """
+    if user.get("role") != "volunteer":
+        raise HTTPException(status_code=403, detail="Only volunteers can access this")
+    
+    volunteer = await db.volunteers.find_one({"user_id": user["id"]}, {"_id": 0})
+    if not volunteer or volunteer.get("status") != "approved":
+        raise HTTPException(status_code=403, detail="Volunteer must be verified")
+    
+    if lat is not None and lng is not None:
+        background_tasks.add_task(record_volunteer_location, user["id"], lat, lng)
+    elif volunteer.get("last_location"):
+        lat, lng = volunteer["last_location"]["lat"], volunteer["last_location"]["lng"]
+    else:
+        raise HTTPException(status_code=400, detail="lat and lng are required until a location has been reported")
+    
+    speed, capacity, reach = mode_profile(volunteer.get("transport_mode"))
+    held = await db.deliveries.find(
+        {"volunteer_id": user["id"], "status": {"$in": ACTIVE_DELIVERY_STATUSES}}, {"_id": 0, "pickup_geo": 0}
+    ).to_list(None)
+    held = [d for d in held if d.get("pickup_location") and d.get("dropoff_location")]
+    
+    open_deliveries = []
+    if include_open:
+        radius = radius_km or reach
+        if dispatch_index_live():
+            open_deliveries, _ = await dispatch_index_page(lat, lng, ROUTE_OPEN_CANDIDATES, None, radius, None)
+        else:
+            open_deliveries, _ = await geo_near_page(
+                db.deliveries, "pickup_geo", lat, lng, dict(OPEN_DELIVERY_QUERY), ROUTE_OPEN_CANDIDATES, None, radius
+            )
+        open_deliveries = [d for d in open_deliveries if d.get("dropoff_location")]
+    
+    deliveries = held + open_deliveries
+    fulfillments = {}
+    if deliveries:
+        fulfillments = {f["id"]: f async for f in db.fulfillments.find(
+            {"id": {"$in": [d["fulfillment_id"] for d in deliveries]}},
+            {"_id": 0, "id": 1, "food_condition": 1, "availability_time": 1}
+        )}
+    now = datetime.now(timezone.utc)
+    jobs = [delivery_job(d, fulfillments.get(d["fulfillment_id"]), now) for d in held]
+    jobs += [delivery_job(d, fulfillments.get(d["fulfillment_id"]), now, required=False) for d in open_deliveries]
+    
+    # The search is CPU-bound; keep it off the event loop
+    plan = await asyncio.to_thread(
+        plan_route, {"lat": lat, "lng": lng}, jobs, speed, capacity,
+        budget_ms=budget_ms, max_minutes=max_minutes, max_added_minutes=max_added_minutes, now=now
+    )
+    return {
+        **plan,
+        "start": {"lat": lat, "lng": lng},
+        "transport_mode": volunteer.get("transport_mode"),
+        "capacity": capacity,
+        "planned_at": now.isoformat()
+    }
+
 @api_router.post("/volunteer/deliveries/{delivery_id}/accept")
 async def accept_delivery(delivery_id: str, user: Dict = Depends(get_current_user)):
     """Accept a delivery assignment"""
@@ -793,17 +1899,24 @@ async def accept_delivery(delivery_id: str, user: Dict = Depends(get_current_use
     if not volunteer or volunteer.get("status") != "approved":
         raise HTTPException(status_code=403, detail="Volunteer must be verified")
     
-    delivery = await db.deliveries.find_one({"id": delivery_id}, {"_id": 0})
-    if not delivery:
-        raise HTTPException(status_code=404, detail="Delivery not found")
-    
-    if delivery.get("volunteer_id") and delivery.get("volunteer_id") != user["id"]:
+    previous = await claim_delivery(delivery_id, user["id"])
+    if previous is None:
+        delivery = await db.deliveries.find_one({"id": delivery_id}, {"_id": 0, "volunteer_id": 1})
+        if not delivery:
+            raise HTTPException(status_code=404, detail="Delivery not found")
+        if delivery.get("volunteer_id") == user["id"]:
+            # Already past the assigned stage for this volunteer
+            return {"message": "Delivery accepted"}
+        dispatch_stats["conflicts"] += 1
         raise HTTPException(status_code=400, detail="Delivery already assigned")
     
-    await db.deliveries.update_one(
-        {"id": delivery_id},
-        {"$set": {"volunteer_id": user["id"], "status": "assigned"}}
-    )
+    if previous.get("volunteer_id") == user["id"]:
+        dispatch_stats["repeat_claims"] += 1
+    elif previous.get("volunteer_id"):
+        dispatch_stats["reclaims"] += 1
+    else:
+        dispatch_stats["claims"] += 1
+    await announce("deliveries", {"id": delivery_id})
     
     return {"message": "Delivery accepted"}
 
@@ -816,8 +1929,13 @@ async def pickup_delivery(delivery_id: str, user: Dict = Depends(get_current_use
     
     await db.deliveries.update_one(
         {"id": delivery_id},
-        {"$set": {"status": "picked_up", "picked_up_at": datetime.now(timezone.utc).isoformat()}}
+        {
+            "$set": {"status": "picked_up", "picked_up_at": datetime.now(timezone.utc).isoformat()},
+            # The food is on its way; the claim no longer needs a lease
+            "$unset": {"claim_expires_at": ""}
+        }
     )
+    await announce("deliveries", {"id": delivery_id})
     
     return {"message": "Pickup confirmed"}
 
@@ -846,9 +1964,138 @@ async def complete_delivery(
         {"user_id": user["id"]},
         {"$inc": {"delivery_count": 1}}
     )
+    await rollups.record("deliveries_completed", 1, delivery.get("city"))
+    await announce("deliveries", {"id": delivery_id})
     
     return {"message": "Delivery completed"}
 
+# ============ LIVE FEED ============
+
+# Fields carried by feed events; enough for dashboards to patch their lists
+FEED_FIELDS = {
+    "food_requests": [
+        "id", "ngo_id", "ngo_name", "food_type", "quantity", "fulfilled_quantity", "urgency_level",
+        "ai_urgency_score", "description", "location", "address", "status", "created_at", "expires_at"
+    ],
+    "deliveries": [
+        "id", "request_id", "fulfillment_id", "donor_id", "ngo_id", "volunteer_id", "additional_volunteers",
+        "pickup_location", "pickup_address", "dropoff_location", "dropoff_address", "status",
+        "extra_volunteer_required", "created_at"
+    ]
+}
+LIVE_FEED_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_FEED_HEARTBEAT_SECONDS', '15'))
+
+async def announce(collection: str, query: Dict[str, Any], op: str = "update"):
+    """Publish the current state of changed documents to the live feed.
+
+    Does nothing while a change stream feeds the bus, since the stream
+    already sees the write. A failure here never fails the write itself.
+    """
+    if event_bus.external:
+        return
+    try:
+        projection = {"_id": 0, **{f: 1 for f in FEED_FIELDS[collection]}}
+        async for doc in db[collection].find(query, projection):
+            event_bus.publish(collection, op, doc)
+    except PyMongoError as e:
+        logger.warning(f"Live feed announce failed for {collection}: {e}")
+
+def in_area(
+    location: Optional[Dict[str, float]],
+    lat: Optional[float], lng: Optional[float], radius_km: Optional[float],
+    bbox: Optional[Tuple[float, float, float, float]]
+) -> bool:
+    if lat is None and bbox is None:
+        return True
+    if not location or location.get("lat") is None or location.get("lng") is None:
+        return False
+    if bbox is not None:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        if not (min_lat <= location["lat"] <= max_lat and min_lng <= location["lng"] <= max_lng):
+            return False
+    if lat is not None and radius_km is not None:
+        return haversine(lat, lng, location["lat"], location["lng"]) <= radius_km
+    return True
+
+def feed_view(
+    user: Dict[str, Any],
+    lat: Optional[float] = None, lng: Optional[float] = None, radius_km: Optional[float] = None,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    collections: Optional[List[str]] = None
+):
+    """What this user may see of each event; the area filter applies to open work only"""
+    role, user_id = user.get("role"), user["id"]
+    
+    def view(event) -> Optional[Dict[str, Any]]:
+        if collections and event.collection not in collections:
+            return None
+        doc = event.doc
+        if role == "admin":
+            return doc if in_area(doc.get("location") or doc.get("pickup_location"), lat, lng, radius_km, bbox) else None
+        if event.collection == "food_requests":
+            if role == "ngo":
+                return doc if doc.get("ngo_id") == user_id else None
+            if role == "donor" and in_area(doc.get("location"), lat, lng, radius_km, bbox):
+                # Donors only act on open requests; others arrive as status-only updates
+                return doc if doc.get("status") in ["approved", "active"] else {"id": doc["id"], "status": doc.get("status")}
+            return None
+        if user_id in (doc.get("donor_id"), doc.get("ngo_id"), doc.get("volunteer_id")) or user_id in (doc.get("additional_volunteers") or []):
+            return doc
+        if role == "volunteer" and in_area(doc.get("pickup_location"), lat, lng, radius_km, bbox):
+            # Other volunteers' deliveries only say that they are gone from the pool
+            return doc if doc.get("status") == "pending" else {"id": doc["id"], "status": doc.get("status")}
+        return None
+    
+    return view
+
+@api_router.post("/live/token")
+async def get_live_feed_token(user: Dict = Depends(get_current_user)):
+    """Short-lived token for the ?token= parameter of /live/feed"""
+    return {"token": create_stream_token(user["id"]), "expires_in": LIVE_FEED_TOKEN_SECONDS}
+
+@api_router.get("/live/feed")
+async def live_feed(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: Optional[float] = Query(None, gt=0),
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    collections: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    user: Dict = Depends(get_stream_user)
+):
+    """Server-Sent Events stream of food request and delivery changes.
+
+    Events are named after the collection and carry {"op", "doc"}; what a
+    user receives depends on their role and the optional area filter, and
+    `collections` (comma-separated) limits the stream to those collections. On
+    reconnect, EventSource sends Last-Event-ID and missed events are
+    replayed. A `resync` event means the client must refetch its lists.
+    Authenticate with the Authorization header, or with ?token= carrying a
+    token from POST /live/token.
+    """
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be given together")
+    if lat is not None and radius_km is None:
+        radius_km = 25.0
+    bbox_params = (min_lat, min_lng, max_lat, max_lng)
+    if any(v is not None for v in bbox_params) and any(v is None for v in bbox_params):
+        raise HTTPException(status_code=400, detail="Bounding box needs min_lat, min_lng, max_lat and max_lng")
+    bbox = bbox_params if min_lat is not None else None
+    names = collections.split(",") if collections else None
+    if names and any(name not in FEED_FIELDS for name in names):
+        raise HTTPException(status_code=400, detail=f"collections must be among: {', '.join(FEED_FIELDS)}")
+    
+    sub = event_bus.subscribe(feed_view(user, lat, lng, radius_km, bbox, names), last_event_id)
+    return StreamingResponse(
+        sse_stream(event_bus, sub, LIVE_FEED_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        # No proxy buffering, or events would arrive in bursts
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============ ADMIN ENDPOINTS ============
 
 async def require_admin(user: Dict = Depends(get_current_user)) -> Dict:
@@ -856,41 +2103,89 @@ async def require_admin(user: Dict = Depends(get_current_user)) -> Dict:
         raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
+async def group_counts(collection, field: str) -> Dict[str, int]:
+    """Count documents per value of `field` in a single $group pass"""
+    rows = await collection.aggregate([
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    return {(row["_id"] if row["_id"] is not None else "none"): row["count"] for row in rows}
+
+async def timed(name: str, coro, timings: Dict[str, float]):
+    """Await `coro`, recording its wall time in milliseconds under `name`"""
+    start = time.perf_counter()
+    result = await coro
+    timings[name] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
 @api_router.get("/admin/dashboard")
 async def get_admin_dashboard(user: Dict = Depends(require_admin)):
-    """Get admin dashboard data"""
-    # Get counts
-    total_users = await db.users.count_documents({})
-    total_ngos = await db.users.count_documents({"role": "ngo"})
-    total_donors = await db.users.count_documents({"role": "donor"})
-    total_volunteers = await db.users.count_documents({"role": "volunteer"})
-    
-    pending_ngo_verifications = await db.ngo_verifications.count_documents({"status": "pending"})
-    pending_volunteer_verifications = await db.volunteers.count_documents({"status": "pending"})
-    
-    active_requests = await db.food_requests.count_documents({"status": {"$in": ["approved", "active"]}})
-    active_deliveries = await db.deliveries.count_documents({"status": {"$nin": ["delivered", "confirmed"]}})
+    """Get admin dashboard data.
+
+    Every breakdown is one $group per collection, and the five run
+    concurrently. _meta.timings_ms reports how long each one took.
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    users_by_role, ngo_by_status, volunteers_by_status, requests_by_status, deliveries_by_status = await asyncio.gather(
+        timed("users", group_counts(db.users, "role"), timings),
+        timed("ngo_verifications", group_counts(db.ngo_verifications, "status"), timings),
+        timed("volunteers", group_counts(db.volunteers, "status"), timings),
+        timed("food_requests", group_counts(db.food_requests, "status"), timings),
+        timed("deliveries", group_counts(db.deliveries, "status"), timings)
+    )
     
     return {
-        "total_users": total_users,
-        "total_ngos": total_ngos,
-        "total_donors": total_donors,
-        "total_volunteers": total_volunteers,
-        "pending_ngo_verifications": pending_ngo_verifications,
-        "pending_volunteer_verifications": pending_volunteer_verifications,
-        "active_requests": active_requests,
-        "active_deliveries": active_deliveries
+        "total_users": sum(users_by_role.values()),
+        "total_ngos": users_by_role.get("ngo", 0),
+        "total_donors": users_by_role.get("donor", 0),
+        "total_volunteers": users_by_role.get("volunteer", 0),
+        "pending_ngo_verifications": ngo_by_status.get("pending", 0),
+        "pending_volunteer_verifications": volunteers_by_status.get("pending", 0),
+        "active_requests": requests_by_status.get("approved", 0) + requests_by_status.get("active", 0),
+        "active_deliveries": sum(
+            count for s, count in deliveries_by_status.items() if s not in ("delivered", "confirmed")
+        ),
+        "users_by_role": users_by_role,
+        "ngo_verifications_by_status": ngo_by_status,
+        "volunteers_by_status": volunteers_by_status,
+        "requests_by_status": requests_by_status,
+        "deliveries_by_status": deliveries_by_status,
+        "_meta": {
+            "timings_ms": timings,
+            "total_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
     }
 
+# Fields the admin review screens render
+NGO_REVIEW_FIELDS = {
+    "_id": 0, "id": 1, "user_id": 1, "organization_name": 1, "registration_number": 1, "address": 1,
+    "city": 1, "state": 1, "pincode": 1, "website": 1, "description": 1, "location": 1,
+    "documents": 1, "status": 1, "created_at": 1
+}
+VOLUNTEER_REVIEW_FIELDS = {
+    "_id": 0, "id": 1, "user_id": 1, "id_document": 1, "transport_mode": 1, "status": 1, "created_at": 1
+}
+
+async def users_by_id(user_ids: List[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch many users in one $in query, keyed by id"""
+    if not user_ids:
+        return {}
+    projection = {"_id": 0, "id": 1, **{f: 1 for f in fields}}
+    users = await db.users.find({"id": {"$in": list(set(user_ids))}}, projection).to_list(None)
+    return {u["id"]: u for u in users}
+
 @api_router.get("/admin/pending-verifications")
 async def get_pending_verifications(user: Dict = Depends(require_admin)):
     """Get all pending verifications"""
-    ngo_verifications = await db.ngo_verifications.find({"status": "pending"}, {"_id": 0}).to_list(100)
-    volunteer_verifications = await db.volunteers.find({"status": "pending"}, {"_id": 0}).to_list(100)
+    ngo_verifications, volunteer_verifications = await asyncio.gather(
+        db.ngo_verifications.find({"status": "pending"}, NGO_REVIEW_FIELDS).to_list(100),
+        db.volunteers.find({"status": "pending"}, VOLUNTEER_REVIEW_FIELDS).to_list(100)
+    )
     
-    # Get user details for volunteers
+    # Get user details for volunteers in one batched lookup
+    vol_users = await users_by_id([v["user_id"] for v in volunteer_verifications], ["name", "email"])
     for vol in volunteer_verifications:
-        vol_user = await db.users.find_one({"id": vol["user_id"]}, {"_id": 0})
+        vol_user = vol_users.get(vol["user_id"])
         if vol_user:
             vol["user_name"] = vol_user.get("name")
             vol["user_email"] = vol_user.get("email")
@@ -977,10 +2272,15 @@ async def review_ngo_verification(
             )
             
             # Update user verification status
-            await db.users.update_one(
-                {"id": verification["user_id"]},
+            result = await db.users.update_one(
+                {"id": verification["user_id"], "is_verified": {"$ne": True}},
                 {"$set": {"is_verified": True}}
             )
+            user_cache.invalidate(verification["user_id"])
+            if result.modified_count:
+                await bump_impact(ngos_served=1)
+            # The public NGO map should show the new NGO without waiting out its TTL
+            await response_cache.invalidate("ngos_verified")
             
             return {"message": "NGO verification approved"}
 
@@ -1052,10 +2352,13 @@ async def review_volunteer_verification(
                 }}
             )
             
-            await db.users.update_one(
-                {"id": user_id},
+            result = await db.users.update_one(
+                {"id": user_id, "is_verified": {"$ne": True}},
                 {"$set": {"is_verified": True}}
             )
+            user_cache.invalidate(user_id)
+            if result.modified_count:
+                await bump_impact(active_volunteers=1)
             
             return {"message": "Volunteer verification approved"}
 
@@ -1074,6 +2377,7 @@ async def approve_food_request(request_id: str, user: Dict = Depends(require_adm
             "approved_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    await announce("food_requests", {"id": request_id})
     
     return {"message": "Request approved"}
 
@@ -1088,6 +2392,7 @@ async def mark_extra_volunteer_required(delivery_id: str, user: Dict = Depends(r
         {"id": delivery_id},
         {"$set": {"extra_volunteer_required": True}}
     )
+    await announce("deliveries", {"id": delivery_id})
     
     return {"message": "Marked as requiring extra volunteer"}
 
@@ -1110,85 +2415,284 @@ async def assign_additional_volunteer(
         {"id": delivery_id},
         {"$push": {"additional_volunteers": volunteer_id}}
     )
+    await announce("deliveries", {"id": delivery_id})
     
     return {"message": "Volunteer assigned"}
 
+REQUEST_EXPORT_COLUMNS = [
+    "id", "ngo_id", "ngo_name", "food_type", "quantity", "fulfilled_quantity", "urgency_level",
+    "ai_urgency_score", "status", "address", "location", "created_at", "expires_at", "approved_by", "approved_at"
+]
+DELIVERY_EXPORT_COLUMNS = [
+    "id", "request_id", "fulfillment_id", "donor_id", "ngo_id", "volunteer_id", "additional_volunteers", "status",
+    "pickup_address", "pickup_location", "dropoff_address", "dropoff_location", "created_at", "picked_up_at",
+    "delivered_at", "confirmed_at"
+]
+USER_EXPORT_COLUMNS = [
+    "id", "email", "name", "role", "phone", "phone_verified", "email_verified", "is_verified", "is_active", "created_at"
+]
+EXPORT_FORMAT_PATTERN = "^(json|ndjson|csv)$"
+
+def created_range(created_after: Optional[str], created_before: Optional[str]) -> Dict[str, Any]:
+    """Filter on the ISO created_at strings"""
+    created = {}
+    if created_after:
+        created["$gte"] = created_after
+    if created_before:
+        created["$lt"] = created_before
+    return {"created_at": created} if created else {}
+
 @api_router.get("/admin/all-requests")
-async def get_all_requests(user: Dict = Depends(require_admin)):
-    """Get all food requests for admin"""
-    requests = await db.food_requests.find({}, {"_id": 0}).to_list(500)
+async def get_all_requests(
+    response: Response,
+    status: Optional[str] = None,
+    ngo_id: Optional[str] = None,
+    food_type: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(500, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern=EXPORT_FORMAT_PATTERN),
+    user: Dict = Depends(require_admin)
+):
+    """Get all food requests for admin.
+
+    Pages by (created_at, id) with the next cursor in X-Next-Cursor;
+    format=ndjson|csv streams every matching request instead.
+    """
+    query = created_range(created_after, created_before)
+    if status:
+        query["status"] = status
+    if ngo_id:
+        query["ngo_id"] = ngo_id
+    if food_type:
+        query["food_type"] = food_type
+    projection = {"_id": 0, "location_geo": 0}
+    
+    if format != "json":
+        return export_response(db.food_requests, query, projection, format, REQUEST_EXPORT_COLUMNS, "food_requests", order == "desc")
+    
+    after = decode_cursor(cursor) if cursor else None
+    requests, next_cursor = await keyset_page(db.food_requests, query, projection, limit, after, order == "desc")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return requests
 
 @api_router.get("/admin/all-deliveries")
-async def get_all_deliveries(user: Dict = Depends(require_admin)):
-    """Get all deliveries for admin"""
-    deliveries = await db.deliveries.find({}, {"_id": 0}).to_list(500)
+async def get_all_deliveries(
+    response: Response,
+    status: Optional[str] = None,
+    volunteer_id: Optional[str] = None,
+    donor_id: Optional[str] = None,
+    ngo_id: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(500, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern=EXPORT_FORMAT_PATTERN),
+    user: Dict = Depends(require_admin)
+):
+    """Get all deliveries for admin (paged, or streamed with format=ndjson|csv)"""
+    query = created_range(created_after, created_before)
+    if status:
+        query["status"] = status
+    if volunteer_id:
+        query["volunteer_id"] = volunteer_id
+    if donor_id:
+        query["donor_id"] = donor_id
+    if ngo_id:
+        query["ngo_id"] = ngo_id
+    projection = {"_id": 0, "pickup_geo": 0}
+    
+    if format != "json":
+        return export_response(db.deliveries, query, projection, format, DELIVERY_EXPORT_COLUMNS, "deliveries", order == "desc")
+    
+    after = decode_cursor(cursor) if cursor else None
+    deliveries, next_cursor = await keyset_page(db.deliveries, query, projection, limit, after, order == "desc")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return deliveries
 
 @api_router.get("/admin/users")
-async def get_all_users(user: Dict = Depends(require_admin)):
-    """Get all users"""
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(500)
+async def get_all_users(
+    response: Response,
+    role: Optional[str] = None,
+    is_verified: Optional[bool] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(500, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern=EXPORT_FORMAT_PATTERN),
+    user: Dict = Depends(require_admin)
+):
+    """Get all users (paged, or streamed with format=ndjson|csv)"""
+    query = created_range(created_after, created_before)
+    if role:
+        query["role"] = role
+    if is_verified is not None:
+        query["is_verified"] = is_verified
+    projection = {"_id": 0, "password": 0}
+    
+    if format != "json":
+        return export_response(db.users, query, projection, format, USER_EXPORT_COLUMNS, "users", order == "desc")
+    
+    after = decode_cursor(cursor) if cursor else None
+    users, next_cursor = await keyset_page(db.users, query, projection, limit, after, order == "desc")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return users
 
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(user: Dict = Depends(require_admin)):
+    """Get hit/miss counters for the in-process caches of this worker"""
+    return {"user_cache": user_cache.stats(), "response_cache": response_cache.stats()}
+
+@api_router.get("/admin/live-feed-stats")
+async def get_live_feed_stats(user: Dict = Depends(require_admin)):
+    return event_bus.stats()
+
+@api_router.get("/admin/dispatch-stats")
+async def get_dispatch_stats(user: Dict = Depends(require_admin)):
+    """Get delivery claim counters for this worker, including lost races"""
+    attempts = sum(dispatch_stats.values())
+    return {
+        **dispatch_stats,
+        "contention_rate": dispatch_stats["conflicts"] / attempts if attempts else 0
+    }
+
+@api_router.post("/admin/dispatch/assign")
+async def batch_assign_deliveries(
+    apply: bool = False,
+    candidates: int = Query(32, ge=1, le=256),
+    user: Dict = Depends(require_admin)
+):
+    """Compute a minimum-travel-time assignment of open deliveries to volunteers.
+
+    Dry run by default; apply=true claims the chosen pairs.
+    """
+    return await run_batch_assignment(apply, candidates)
+
+@api_router.get("/admin/dispatch-index/check")
+async def get_dispatch_index_check(repair: bool = False, user: Dict = Depends(require_admin)):
+    """Compare this worker's in-memory dispatch index with the database"""
+    if not dispatch_index.ready:
+        raise HTTPException(status_code=409, detail="Dispatch index is not loaded")
+    return await check_dispatch_index(repair)
+
+@api_router.get("/admin/diagnostics/query-plans")
+async def get_query_plans(user: Dict = Depends(require_admin)):
+    """Explain every query shape the API uses and flag collection scans"""
+    results = await verify_query_plans(db)
+    return {
+        "collscan_count": sum(1 for r in results if r["collscan"]),
+        "results": results
+    }
+
 # ============ ANALYTICS ENDPOINTS ============
 
-async def update_analytics(metric_type: str, value: float):
-    """Helper to update analytics"""
-    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    existing = await db.analytics.find_one({
-        "metric_type": metric_type,
-        "period": "daily",
-        "date": {"$gte": today.isoformat()}
-    }, {"_id": 0})
-    
-    if existing:
-        await db.analytics.update_one(
-            {"id": existing["id"]},
-            {"$inc": {"value": value}}
-        )
-    else:
-        metric = AnalyticsMetric(
-            metric_type=metric_type,
-            value=value,
-            period="daily",
-            date=today
-        )
-        met_dict = metric.model_dump()
-        met_dict['date'] = met_dict['date'].isoformat()
-        await db.analytics.insert_one(met_dict)
+# Materialized public counters. Write paths keep them current with $inc via
+# bump_impact; rebuild_impact_summary recomputes them from the source
+# collections on a schedule and reports any drift.
+IMPACT_SUMMARY_ID = "global"
+IMPACT_COUNTERS = ["meals_delivered", "ngos_served", "active_volunteers", "donors_registered", "requests_fulfilled", "total_requests"]
+IMPACT_RECONCILE_SECONDS = int(os.environ.get('IMPACT_RECONCILE_SECONDS', '3600'))
+
+async def bump_impact(**deltas: float):
+    """Atomically adjust public impact counters"""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    await db.impact_summary.update_one(
+        {"id": IMPACT_SUMMARY_ID},
+        {"$inc": deltas, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+
+async def compute_impact_counters() -> Dict[str, float]:
+    """Count every public counter from the source collections, the archive and the rollups (full scans)"""
+    meals, ngos, volunteers, donors, fulfilled, total, archived = await asyncio.gather(
+        rollups.total("meals_delivered"),
+        db.users.count_documents({"role": "ngo", "is_verified": True}),
+        db.users.count_documents({"role": "volunteer", "is_verified": True}),
+        db.users.count_documents({"role": "donor"}),
+        db.food_requests.count_documents({"status": "fulfilled"}),
+        db.food_requests.count_documents({}),
+        archive_store.status_counts("food_requests")
+    )
+    return {
+        "meals_delivered": meals,
+        "ngos_served": ngos,
+        "active_volunteers": volunteers,
+        "donors_registered": donors,
+        "requests_fulfilled": fulfilled + archived.get("fulfilled", 0),
+        "total_requests": total + sum(archived.values())
+    }
+
+async def rebuild_impact_summary() -> Dict[str, Any]:
+    """Recompute the impact summary from scratch, returning the drift that was corrected.
+
+    An increment landing between the counts and the write is overwritten;
+    the source collections already reflect it, so the next run restores it.
+    """
+    current = await db.impact_summary.find_one({"id": IMPACT_SUMMARY_ID}, {"_id": 0}) or {}
+    counters = await compute_impact_counters()
+    drift = {k: v - current.get(k, 0) for k, v in counters.items() if v != current.get(k, 0)}
+    if drift and current:
+        logger.warning(f"Impact summary drift corrected: {drift}")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    await db.impact_summary.update_one(
+        {"id": IMPACT_SUMMARY_ID},
+        {"$set": {**counters, "updated_at": now, "reconciled_at": now}},
+        upsert=True
+    )
+    return {"counters": counters, "drift": drift}
+
+async def cached_json_response(route: str, compute, if_none_match: Optional[str] = None) -> Response:
+    """Serve `compute()`'s JSON through the response cache, honouring If-None-Match"""
+    ttl, stale_ttl = RESPONSE_CACHE_TTLS[route]
+    entry = await response_cache.get(route, compute, ttl, stale_ttl)
+    etag = f'"{entry["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={ttl}, stale-while-revalidate={stale_ttl}"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
 
 @api_router.get("/analytics/public")
-async def get_public_analytics():
+async def get_public_analytics(if_none_match: Optional[str] = Header(None)):
     """Get public impact metrics"""
-    # Calculate totals
-    total_meals = await db.analytics.aggregate([
-        {"$match": {"metric_type": "meals_delivered"}},
-        {"$group": {"_id": None, "total": {"$sum": "$value"}}}
-    ]).to_list(1)
-    
-    total_ngos = await db.users.count_documents({"role": "ngo", "is_verified": True})
-    total_volunteers = await db.users.count_documents({"role": "volunteer", "is_verified": True})
-    total_donors = await db.users.count_documents({"role": "donor"})
-    
-    fulfilled_requests = await db.food_requests.count_documents({"status": "fulfilled"})
-    total_requests = await db.food_requests.count_documents({})
+    return await cached_json_response("analytics_public", compute_public_analytics, if_none_match)
+
+async def compute_public_analytics() -> Dict[str, Any]:
+    summary = await db.impact_summary.find_one({"id": IMPACT_SUMMARY_ID}, {"_id": 0})
+    if not summary or "reconciled_at" not in summary:
+        await rebuild_impact_summary()
+        summary = await db.impact_summary.find_one({"id": IMPACT_SUMMARY_ID}, {"_id": 0})
     
+    fulfilled_requests = summary.get("requests_fulfilled", 0)
+    total_requests = summary.get("total_requests", 0)
     return {
-        "meals_delivered": total_meals[0]["total"] if total_meals else 0,
-        "ngos_served": total_ngos,
-        "active_volunteers": total_volunteers,
-        "donors_registered": total_donors,
+        "meals_delivered": summary.get("meals_delivered", 0),
+        "ngos_served": summary.get("ngos_served", 0),
+        "active_volunteers": summary.get("active_volunteers", 0),
+        "donors_registered": summary.get("donors_registered", 0),
         "requests_fulfilled": fulfilled_requests,
         "success_rate": (fulfilled_requests / total_requests * 100) if total_requests > 0 else 0
     }
 
+@api_router.post("/admin/impact-summary/reconcile")
+async def reconcile_impact_summary(user: Dict = Depends(require_admin)):
+    """Rebuild the public impact counters now and report the drift"""
+    return await rebuild_impact_summary()
+
 @api_router.get("/analytics/user")
 async def get_user_analytics(user: Dict = Depends(get_current_user)):
     """Get user-specific analytics"""
     if user.get("role") == "ngo":
-        requests = await db.food_requests.find({"ngo_id": user["id"]}, {"_id": 0}).to_list(100)
+        requests = await user_history("food_requests", {"ngo_id": user["id"]}, user["id"], include_archived=True)
         total_requested = sum(r.get("quantity", 0) for r in requests)
         total_received = sum(r.get("fulfilled_quantity", 0) for r in requests)
         return {
@@ -1199,7 +2703,7 @@ async def get_user_analytics(user: Dict = Depends(get_current_user)):
         }
     
     elif user.get("role") == "donor":
-        fulfillments = await db.fulfillments.find({"donor_id": user["id"]}, {"_id": 0}).to_list(100)
+        fulfillments = await user_history("fulfillments", {"donor_id": user["id"]}, user["id"], include_archived=True)
         total_donated = sum(f.get("quantity", 0) for f in fulfillments)
         return {
             "total_donations": len(fulfillments),
@@ -1216,81 +2720,467 @@ async def get_user_analytics(user: Dict = Depends(get_current_user)):
     
     return {}
 
+ROLLUP_PERIOD_PATTERN = "^(daily|weekly|monthly)$"
+# Range covered when a rollup query gives no start
+ROLLUP_DEFAULT_SPANS = {"daily": timedelta(days=29), "weekly": timedelta(weeks=11), "monthly": timedelta(days=334)}
+
+def rollup_range(period: str, start: Optional[str], end: Optional[str]) -> Tuple[date, date]:
+    try:
+        last = to_date(end) if end else datetime.now(timezone.utc).date()
+        first = to_date(start) if start else last - ROLLUP_DEFAULT_SPANS[period]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates")
+    if first > last:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return first, last
+
+def rollup_metric(metric: str) -> str:
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRICS)}")
+    return metric
+
+@api_router.get("/analytics/rollups")
+async def get_analytics_rollups(
+    metric: str,
+    period: str = Query("daily", pattern=ROLLUP_PERIOD_PATTERN),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    city: Optional[str] = None
+):
+    """A metric's daily, weekly or monthly series, for one city or all of them.
+
+    Only the buckets in range are read. Buckets with no activity come back
+    as zeros. Without a start, the series covers the last 30 days, 12 weeks
+    or 12 months.
+    """
+    first, last = rollup_range(period, start, end)
+    try:
+        buckets = await rollups.series(rollup_metric(metric), period, first, last, city)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "metric": metric,
+        "period": period,
+        "city": city_key(city) if city else ALL_CITIES,
+        "start": buckets[0]["start"],
+        "end": last.isoformat(),
+        "total": sum(b["value"] for b in buckets),
+        "buckets": buckets
+    }
+
+@api_router.get("/analytics/rollups/cities")
+async def get_city_rollups(
+    metric: str,
+    period: str = Query("monthly", pattern=ROLLUP_PERIOD_PATTERN),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Cities ranked by a metric's total over a date range"""
+    first, last = rollup_range(period, start, end)
+    try:
+        cities = await rollups.by_city(rollup_metric(metric), period, first, last, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"metric": metric, "period": period, "start": first.isoformat(), "end": last.isoformat(), "cities": cities}
+
+async def migrate_legacy_analytics() -> int:
+    """Fold the old per-day `analytics` documents into the rollups, once.
+
+    Each document is claimed with an atomic update before it is added, so
+    workers starting together never add one twice. Old documents carry no
+    city and land under "unknown".
+    """
+    pending = await db.analytics.find({"rolled_up_at": None}, {"_id": 1}).to_list(None)
+    migrated = 0
+    for row in pending:
+        doc = await db.analytics.find_one_and_update(
+            {"_id": row["_id"], "rolled_up_at": None},
+            {"$set": {"rolled_up_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        if doc is None or not doc.get("metric_type") or not doc.get("date"):
+            continue
+        await rollups.record(doc["metric_type"], doc.get("value", 0), None, doc["date"])
+        migrated += 1
+    if migrated:
+        logger.info(f"Migrated {migrated} legacy analytics documents into the rollups")
+    return migrated
+
 # ============ AI ENDPOINTS ============
 
+# Urgency scoring (see urgency.py): URGENCY_MODEL is llm, stub or heuristic
+URGENCY_TIMEOUT_SECONDS = float(os.environ.get('URGENCY_TIMEOUT_SECONDS', '10'))
+URGENCY_OPEN_STATUSES = ["pending", "approved", "active"]
+
+def make_urgency_model():
+    mode = os.environ.get('URGENCY_MODEL', 'llm')
+    if mode == 'stub':
+        return StubUrgencyModel(delay=float(os.environ.get('URGENCY_STUB_DELAY_SECONDS', '0')))
+    if mode == 'heuristic':
+        return None
+    llm_key = os.environ.get('EMERGENT_LLM_KEY')
+    if not llm_key:
+        logger.warning("EMERGENT_LLM_KEY is not set; urgency scores come from the local heuristic")
+        return None
+    return LlmUrgencyModel(
+        llm_key,
+        provider=os.environ.get('URGENCY_LLM_PROVIDER', 'openai'),
+        model=os.environ.get('URGENCY_LLM_MODEL', 'gpt-5.2')
+    )
+
+async def store_urgency_scores(results: List[Dict[str, Any]]):
+    """Save a scored batch, log it and tell live feed clients"""
+    if not results:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.food_requests.bulk_write([
+        UpdateOne({"id": r["id"]}, {"$set": {
+            "ai_urgency_score": r["score"],
+            # A cached score came from the model earlier
+            "urgency_source": "heuristic" if r["source"] == "heuristic" else "model",
+            "urgency_hash": r["hash"],
+            "urgency_scored_at": now
+        }}) for r in results
+    ], ordered=False)
+    await db.ai_logs.insert_many([{
+        "id": str(uuid.uuid4()),
+        "action": "urgency_score",
+        "target_id": r["id"],
+        "result": r["score"],
+        "source": r["source"],
+        "created_at": now
+    } for r in results])
+    await announce("food_requests", {"id": {"$in": [r["id"] for r in results]}})
+
+urgency_scorer = UrgencyScorer(
+    make_urgency_model(),
+    on_scored=store_urgency_scores,
+    batch_size=int(os.environ.get('URGENCY_BATCH_SIZE', '20')),
+    concurrency=int(os.environ.get('URGENCY_CONCURRENCY', '4')),
+    timeout=URGENCY_TIMEOUT_SECONDS
+)
+
 @api_router.post("/ai/urgency-score")
 async def calculate_urgency_score(request_id: str, user: Dict = Depends(require_admin)):
-    """Calculate AI urgency score for a request"""
-    request = await db.food_requests.find_one({"id": request_id}, {"_id": 0})
+    """Score one request now.
+
+    Waits at most URGENCY_TIMEOUT_SECONDS for the model before falling
+    back to the local heuristic; `source` says which one answered.
+    """
+    request = await db.food_requests.find_one({"id": request_id}, {"_id": 0, "location_geo": 0})
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
     
-    try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
-        llm_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not llm_key:
-            raise HTTPException(status_code=500, detail="LLM key not configured")
-        
-        chat = LlmChat(
-            api_key=llm_key,
-            session_id=f"urgency-{request_id}",
-            system_message="You are an AI assistant that calculates urgency scores for food requests. Return ONLY a number between 0 and 10."
-        ).with_model("openai", "gpt-5.2")
-        
-        prompt = f"""Calculate urgency score (0-10) for this food request:
-- Food type: {request.get('food_type')}
-- Quantity needed: {request.get('quantity')} servings
-- Current urgency level: {request.get('urgency_level')}
-- Description: {request.get('description', 'N/A')}
-- Created: {request.get('created_at')}
-- Expires: {request.get('expires_at', 'Not specified')}
-
-Return ONLY a single number between 0 and 10."""
-        
-        response = await chat.send_message(UserMessage(text=prompt))
-        
-        try:
-            score = float(response.strip())
-            score = max(0, min(10, score))
-        except:
-            score = 5.0
-        
-        await db.food_requests.update_one(
-            {"id": request_id},
-            {"$set": {"ai_urgency_score": score}}
-        )
-        
-        # Log AI action
-        ai_log = {
-            "id": str(uuid.uuid4()),
-            "action": "urgency_score",
-            "target_id": request_id,
-            "result": score,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.ai_logs.insert_one(ai_log)
-        
-        return {"urgency_score": score}
+    [result] = await urgency_scorer.score_now([request])
+    return {"urgency_score": result["score"], "source": result["source"]}
+
+@api_router.post("/admin/urgency/rescore")
+async def rescore_urgency(
+    missing_only: bool = True,
+    limit: int = Query(1000, ge=1, le=10000),
+    user: Dict = Depends(require_admin)
+):
+    """Queue open requests for model scoring, by default only those the model has not scored"""
+    query: Dict[str, Any] = {"status": {"$in": URGENCY_OPEN_STATUSES}}
+    if missing_only:
+        query["urgency_source"] = {"$ne": "model"}
+    requests = await db.food_requests.find(query, {"_id": 0, "location_geo": 0}).to_list(limit)
+    queued = sum(urgency_scorer.submit(r) for r in requests)
+    return {"queued": queued, "dropped": len(requests) - queued}
+
+# Rule-based urgency for every open request; 0 disables the periodic run
+URGENCY_RULES_SECONDS = int(os.environ.get('URGENCY_RULES_SECONDS', '900'))
+DONOR_DENSITY_CELL_KM = float(os.environ.get('DONOR_DENSITY_CELL_KM', '5'))
+URGENCY_RULES_FIELDS = [
+    "id", "ngo_id", "location", "urgency_level", "food_type", "quantity", "fulfilled_quantity",
+    "expires_at", "created_at", "ai_urgency_score", "urgency_source"
+]
+
+async def rescore_open_requests() -> Dict[str, Any]:
+    """Score every open request with the local rules and write the scores that changed.
+
+    Requests scored by the model keep that score, but still count towards
+    their NGO's backlog.
+    """
+    start = time.perf_counter()
+    requests, matcher = await asyncio.gather(
+        db.food_requests.find(
+            {"status": {"$in": URGENCY_OPEN_STATUSES}}, {"_id": 0, **{f: 1 for f in URGENCY_RULES_FIELDS}}
+        ).to_list(None),
+        refresh_donor_matcher()
+    )
+    loaded = time.perf_counter()
     
-    except Exception as e:
-        logger.error(f"AI urgency score error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    scored = await asyncio.to_thread(
+        rescore_by_rules, requests, lambda lat, lng: matcher.nearby_counts(lat, lng, DONOR_DENSITY_CELL_KM)
+    )
+    solved = time.perf_counter()
+    changed = [
+        (r, value) for r, value in scored
+        if r.get("urgency_source") != "rules" or r.get("ai_urgency_score") is None
+        or abs(r["ai_urgency_score"] - value) >= 0.05
+    ]
+    if changed:
+        now = datetime.now(timezone.utc).isoformat()
+        await db.food_requests.bulk_write([
+            UpdateOne({"id": r["id"]}, {"$set": {"ai_urgency_score": value, "urgency_source": "rules", "urgency_scored_at": now}})
+            for r, value in changed
+        ], ordered=False)
+        await announce("food_requests", {"id": {"$in": [r["id"] for r, _ in changed]}})
+    
+    return {
+        "open": len(requests),
+        "scored": len(scored),
+        "updated": len(changed),
+        "timings_ms": {
+            "load": round((loaded - start) * 1000, 1),
+            "score": round((solved - loaded) * 1000, 1),
+            "write": round((time.perf_counter() - solved) * 1000, 1)
+        }
+    }
+
+@api_router.post("/admin/urgency/rules-run")
+async def run_urgency_rules(user: Dict = Depends(require_admin)):
+    """Rescore every open request with the local rules now"""
+    return await rescore_open_requests()
+
+@api_router.get("/admin/urgency-stats")
+async def get_urgency_stats(user: Dict = Depends(require_admin)):
+    return urgency_scorer.stats()
+
+# Donor profiles are rebuilt from fulfillments at most this often; suggestions may lag new donors by as much
+MATCH_PROFILE_TTL_SECONDS = int(os.environ.get('MATCH_PROFILE_TTL_SECONDS', '900'))
+MATCH_RADIUS_KM = float(os.environ.get('MATCH_RADIUS_KM', '25'))
+donor_matcher = DonorMatcher()
+donor_matcher_lock = asyncio.Lock()
+
+async def refresh_donor_matcher(force: bool = False) -> DonorMatcher:
+    """Return the donor profiles, rebuilding them once they are older than the TTL"""
+    global donor_matcher
+    if not force and time.time() - donor_matcher.built_at < MATCH_PROFILE_TTL_SECONDS and len(donor_matcher):
+        return donor_matcher
+    async with donor_matcher_lock:
+        if not force and time.time() - donor_matcher.built_at < MATCH_PROFILE_TTL_SECONDS and len(donor_matcher):
+            return donor_matcher
+        hot, archived = await asyncio.gather(
+            db.fulfillments.aggregate(donor_profile_pipeline(), allowDiskUse=True).to_list(None),
+            archive_store.aggregate("fulfillments", donor_profile_pipeline())
+        )
+        profiles = merge_profiles(hot, archived)
+        # Built off the event loop and swapped in whole, so readers never see a half-loaded matcher
+        donor_matcher = await asyncio.to_thread(DonorMatcher, profiles)
+    return donor_matcher
 
 @api_router.post("/ai/match-suggestions")
-async def get_match_suggestions(request_id: str, user: Dict = Depends(require_admin)):
-    """Get AI suggestions for donor-NGO matching"""
+async def get_match_suggestions(
+    request_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    radius_km: float = Query(MATCH_RADIUS_KM, gt=0, le=400),
+    user: Dict = Depends(require_admin)
+):
+    """Suggest donors for a request by proximity, history, food type and recency.
+
+    Donors who already gave to this request are left out.
+    """
     request = await db.food_requests.find_one({"id": request_id}, {"_id": 0})
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
+    location = request.get("location") or {}
+    if location.get("lat") is None or location.get("lng") is None:
+        raise HTTPException(status_code=400, detail="Request has no location")
     
-    # Get nearby donors (simplified - in production would use geo queries)
-    donors = await db.users.find({"role": "donor"}, {"_id": 0, "password": 0}).to_list(50)
+    matcher, already = await asyncio.gather(
+        refresh_donor_matcher(),
+        db.fulfillments.distinct("donor_id", {"request_id": request_id})
+    )
+    # Donors who are inactive or gone are only found after ranking, so rank
+    # again without them until `limit` usable donors are found or none are left
+    exclude = set(already)
+    suggested = []
+    while len(suggested) < limit:
+        matches = matcher.top(
+            location["lat"], location["lng"], request.get("food_type"),
+            k=limit - len(suggested), radius_km=radius_km, exclude=exclude
+        )
+        if not matches:
+            break
+        donors = await users_by_id([m["donor_id"] for m in matches], ["name", "email", "phone", "is_active"])
+        for m in matches:
+            exclude.add(m["donor_id"])
+            if m["donor_id"] in donors and donors[m["donor_id"]].get("is_active", True):
+                suggested.append({**donors[m["donor_id"]], **m})
+    suggested.sort(key=lambda d: d["score"], reverse=True)
     
     return {
         "request_id": request_id,
-        "suggested_donors": donors[:5],
-        "matching_criteria": "proximity and food type compatibility"
+        "suggested_donors": suggested,
+        "matching_criteria": "proximity, past fulfillments, food type compatibility and recency",
+        "profiles": matcher.stats()
+    }
+
+# ============ SCHEDULED SWEEPS ============
+
+# Periodic jobs run on one worker at a time (see scheduler.py)
+SCHEDULER_LEASE_SECONDS = float(os.environ.get('SCHEDULER_LEASE_SECONDS', '30'))
+SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', '500'))
+REQUEST_EXPIRY_SWEEP_SECONDS = int(os.environ.get('REQUEST_EXPIRY_SWEEP_SECONDS', '60'))
+STALLED_DELIVERY_SWEEP_SECONDS = int(os.environ.get('STALLED_DELIVERY_SWEEP_SECONDS', '300'))
+# A picked-up delivery still not delivered after this many hours is flagged for help
+DELIVERY_STALL_HOURS = float(os.environ.get('DELIVERY_STALL_HOURS', '6'))
+ARCHIVE_SWEEP_SECONDS = int(os.environ.get('ARCHIVE_SWEEP_SECONDS', '3600'))
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+
+async def sweep_batches(collection, query: Dict[str, Any], update: Dict[str, Any]) -> List[str]:
+    """Apply `update` to every document matching `query`, SWEEP_BATCH_SIZE at a time.
+
+    Each update_many repeats `query`, so a document changed by someone
+    else since it was read is left alone. `update` must move documents
+    out of `query`. Returns the ids of every batch.
+    """
+    ids: List[str] = []
+    while True:
+        batch = [d["id"] for d in await collection.find(query, {"_id": 0, "id": 1}).limit(SWEEP_BATCH_SIZE).to_list(None)]
+        if not batch:
+            break
+        result = await collection.update_many({**query, "id": {"$in": batch}}, update)
+        ids.extend(batch)
+        if len(batch) < SWEEP_BATCH_SIZE or not result.modified_count:
+            break
+    return ids
+
+async def expire_overdue_requests() -> Dict[str, Any]:
+    """Mark open requests whose expires_at has passed as expired"""
+    now = datetime.now(timezone.utc).isoformat()
+    ids = await sweep_batches(
+        db.food_requests,
+        {"status": {"$in": URGENCY_OPEN_STATUSES}, "expires_at": {"$lt": now}},
+        {"$set": {"status": "expired", "expired_at": now}}
+    )
+    if ids:
+        await announce("food_requests", {"id": {"$in": ids}})
+        logger.info(f"Expired {len(ids)} overdue food requests")
+    return {"expired": len(ids)}
+
+async def release_stalled_deliveries() -> Dict[str, Any]:
+    """Reopen deliveries whose claim lapsed, and flag pickups that never arrived.
+
+    A lapsed claim can already be taken over, but the delivery only shows up
+    in open lists and batch assignment once it is pending again. A picked-up
+    delivery cannot be reopened, as the food is with the volunteer, so it is
+    marked as needing an extra volunteer instead.
+    """
+    now = datetime.now(timezone.utc)
+    released = await sweep_batches(
+        db.deliveries,
+        {"status": "assigned", "claim_expires_at": {"$lt": now.isoformat()}},
+        {
+            "$set": {"status": "pending", "volunteer_id": None, "released_at": now.isoformat()},
+            "$unset": {"claim_expires_at": "", "assigned_at": ""}
+        }
+    )
+    stalled = await sweep_batches(
+        db.deliveries,
+        {
+            "status": "picked_up",
+            "stalled_at": None,
+            "picked_up_at": {"$lt": (now - timedelta(hours=DELIVERY_STALL_HOURS)).isoformat()}
+        },
+        {"$set": {"stalled_at": now.isoformat(), "extra_volunteer_required": True}}
+    )
+    dispatch_stats["released"] += len(released)
+    if released or stalled:
+        await announce("deliveries", {"id": {"$in": released + stalled}})
+        logger.info(f"Released {len(released)} lapsed delivery claims; flagged {len(stalled)} stalled pickups")
+    return {"released": len(released), "stalled": len(stalled)}
+
+async def archive_finished_records() -> Dict[str, Any]:
+    """Move records finished more than ARCHIVE_AFTER_DAYS ago to the archive store.
+
+    Requests go once their receipt is confirmed or they expire, and their
+    fulfillments go with them. Deliveries go once confirmed.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    requests, fulfillments = [], []
+    for query in (
+        {"status": "fulfilled", "receipt_confirmed_at": {"$lt": cutoff}},
+        {"status": "expired", "expired_at": {"$lt": cutoff}}
+    ):
+        while True:
+            batch = [r["id"] for r in await db.food_requests.find(query, {"_id": 0, "id": 1}).limit(SWEEP_BATCH_SIZE).to_list(None)]
+            if not batch:
+                break
+            # Fulfillments go before their request, so a run that stops in
+            # between leaves the request hot for the next run to find
+            fulfillments += await archive_matching(
+                db.fulfillments, archive_store, "fulfillments", {"request_id": {"$in": batch}}, SWEEP_BATCH_SIZE
+            )
+            requests += await archive_matching(
+                db.food_requests, archive_store, "food_requests", {**query, "id": {"$in": batch}}, SWEEP_BATCH_SIZE
+            )
+            if len(batch) < SWEEP_BATCH_SIZE:
+                break
+    deliveries = await archive_matching(
+        db.deliveries, archive_store, "deliveries",
+        {"status": "confirmed", "confirmed_at": {"$lt": cutoff}}, SWEEP_BATCH_SIZE
+    )
+    moved = {"food_requests": len(requests), "fulfillments": len(fulfillments), "deliveries": len(deliveries)}
+    if any(moved.values()):
+        logger.info(f"Archived {moved} to the {archive_store.name} store")
+    return moved
+
+async def record_job_run(name: str, record: Dict[str, Any]):
+    """Keep each job's latest run where the stats endpoint of any worker can read it"""
+    await db.scheduler_jobs.update_one(
+        {"name": name},
+        {
+            "$set": {
+                **{k: record[k] for k in ("last_started_at", "last_duration_ms", "last_result", "last_error", "interval_seconds")},
+                "owner": scheduler.owner
+            },
+            "$inc": {"failures" if record["last_error"] else "runs": 1}
+        },
+        upsert=True
+    )
+
+scheduler = Scheduler(db.scheduler_leases, lease_seconds=SCHEDULER_LEASE_SECONDS, on_run=record_job_run)
+scheduler.add("request_expiry", REQUEST_EXPIRY_SWEEP_SECONDS, expire_overdue_requests)
+scheduler.add("stalled_deliveries", STALLED_DELIVERY_SWEEP_SECONDS, release_stalled_deliveries)
+if ARCHIVE_AFTER_DAYS > 0:
+    scheduler.add("archive", ARCHIVE_SWEEP_SECONDS, archive_finished_records)
+scheduler.add("impact_reconcile", IMPACT_RECONCILE_SECONDS, rebuild_impact_summary)
+scheduler.add("batch_assignment", DISPATCH_ASSIGN_SECONDS, lambda: run_batch_assignment(apply=True))
+scheduler.add("urgency_rules", URGENCY_RULES_SECONDS, rescore_open_requests)
+if DISPATCH_INDEX_ENABLED:
+    # Each worker has its own index, kept by the change stream; this repairs
+    # any drift and drops the index while there is no stream
+    scheduler.add("dispatch_index_check", DISPATCH_INDEX_CHECK_SECONDS, maintain_dispatch_index, leader_only=False)
+
+@api_router.get("/admin/scheduler-stats")
+async def get_scheduler_stats(user: Dict = Depends(require_admin)):
+    """This worker's view of the scheduler, the current lease, and each job's last run anywhere"""
+    lease, jobs = await asyncio.gather(
+        db.scheduler_leases.find_one({"name": scheduler.name}, {"_id": 0}),
+        db.scheduler_jobs.find({}, {"_id": 0}).to_list(None)
+    )
+    return {"worker": scheduler.stats(), "lease": lease, "jobs": jobs}
+
+@api_router.post("/admin/scheduler/jobs/{name}/run")
+async def run_scheduled_job(name: str, user: Dict = Depends(require_admin)):
+    """Run a scheduled job now on this worker, whether or not it leads"""
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return await scheduler.run(name)
+
+@api_router.get("/admin/archive-stats")
+async def get_archive_stats(user: Dict = Depends(require_admin)):
+    """Record counts in the operational collections and in the archive store"""
+    names = ["food_requests", "fulfillments", "deliveries"]
+    hot = await asyncio.gather(*(db[name].estimated_document_count() for name in names))
+    return {
+        "store": archive_store.name,
+        "archive_after_days": ARCHIVE_AFTER_DAYS,
+        "hot": dict(zip(names, hot)),
+        "archived": await archive_store.stats()
     }
 
 # ============ FILE UPLOAD ENDPOINT ============
@@ -1301,49 +3191,207 @@ async def upload_file(
     user: Dict = Depends(get_current_user)
 ):
     """Upload a file (documents, photos)"""
-    # Read file content
-    content = await file.read()
-    
-    # For MVP, store as base64 in a simple way
-    # In production, would use cloud storage
     file_id = str(uuid.uuid4())
+    
+    async def chunks():
+        received = 0
+        while chunk := await file.read(CHUNK_SIZE):
+            received += len(chunk)
+            if received > UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="File too large")
+            yield chunk
+    
+    # Stream to the blob store; only metadata is kept in Mongo
+    info = await blob_store.write(file_id, chunks())
+    
     file_data = {
         "id": file_id,
         "filename": file.filename,
-        "content_type": file.content_type,
-        "data": base64.b64encode(content).decode('utf-8'),
+        "content_type": file.content_type or "application/octet-stream",
+        "size": info.size,
+        "etag": info.etag,
+        "storage": blob_store.name,
         "user_id": user["id"],
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
     await db.uploads.insert_one(file_data)
     
+    if file_data["content_type"].startswith("image/"):
+        schedule_derivatives(file_id)
+    
     return {"file_id": file_id, "filename": file.filename}
 
+# Thumbnails and downscaled variants are built off the event loop in a process
+# pool and stored next to the original as "<file_id>.<size>.<ext>" blobs.
+_image_pool: Optional[ProcessPoolExecutor] = None
+_derivative_jobs: Dict[str, asyncio.Task] = {}
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _image_pool
+
+def schedule_derivatives(file_id: str) -> asyncio.Task:
+    """Start building derivatives for an upload, or join the job already running."""
+    task = _derivative_jobs.get(file_id)
+    if task is None:
+        task = asyncio.create_task(generate_derivatives(file_id))
+        _derivative_jobs[file_id] = task
+        task.add_done_callback(lambda _: _derivative_jobs.pop(file_id, None))
+    return task
+
+async def generate_derivatives(file_id: str):
+    """Build and store every derivative of an image upload.
+
+    Only content Pillow cannot decode is marked unsupported. Other failures
+    are logged and leave the status unset, so the next request for a
+    derivative tries again.
+    """
+    global _image_pool
+    file_data = await db.uploads.find_one({"id": file_id}, {"_id": 0})
+    if not file_data:
+        return
+    try:
+        if "data" in file_data:
+            content = base64.b64decode(file_data["data"])
+        else:
+            content = b"".join([chunk async for chunk in blob_store.read(file_id)])
+        result = await asyncio.get_running_loop().run_in_executor(get_image_pool(), make_derivatives, content)
+        
+        derivatives = {}
+        for name, variant in result["variants"].items():
+            info = await blob_store.write(f"{file_id}.{name}", _single_chunk(variant["data"]))
+            derivatives[name] = {
+                "content_type": variant["content_type"],
+                "width": variant["width"],
+                "height": variant["height"],
+                "size": info.size,
+                "etag": info.etag
+            }
+        await db.uploads.update_one(
+            {"id": file_id},
+            {"$set": {"derivatives": derivatives, "derivatives_status": "ready", "exif_geo": result["geo"]}}
+        )
+    except UnsupportedImage as e:
+        logger.warning(f"No derivatives for upload {file_id}: {e}")
+        await db.uploads.update_one({"id": file_id}, {"$set": {"derivatives_status": "unsupported"}})
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            # A pool whose worker died stays broken; start a fresh one next time
+            _image_pool = None
+        logger.error(f"Building derivatives for upload {file_id} failed: {e}")
+
+async def _single_chunk(data: bytes):
+    yield data
+
 @api_router.get("/uploads/{file_id}")
-async def get_file(file_id: str):
-    """Get an uploaded file"""
+async def get_file(
+    file_id: str,
+    size: str = Query("original", pattern="^(thumb|medium|original)$"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    """Stream an uploaded file's raw bytes, with ETag and single-range support.
+
+    size=thumb|medium returns a downscaled, EXIF-free WebP (or JPEG when the
+    client does not accept WebP) for images, and the original otherwise.
+    """
     file_data = await db.uploads.find_one({"id": file_id}, {"_id": 0})
     if not file_data:
         raise HTTPException(status_code=404, detail="File not found")
     
-    return {
-        "id": file_data["id"],
-        "filename": file_data["filename"],
-        "content_type": file_data["content_type"],
-        "data": file_data["data"]
+    if size != "original" and file_data.get("content_type", "").startswith("image/"):
+        if file_data.get("derivatives_status") not in ("ready", "unsupported"):
+            await schedule_derivatives(file_id)
+            file_data = await db.uploads.find_one({"id": file_id}, {"_id": 0})
+        ext = "webp" if accept and "image/webp" in accept else "jpg"
+        variant = (file_data.get("derivatives") or {}).get(f"{size}.{ext}")
+        if variant:
+            response = await serve_blob(
+                f"{file_id}.{size}.{ext}", variant["content_type"], variant["size"], variant["etag"],
+                f"{size}-{file_data.get('filename') or file_id}", range_header, if_none_match
+            )
+            response.headers["Vary"] = "Accept"
+            return response
+    
+    # Files stored before the blob store kept their bytes inline as base64
+    legacy_content = base64.b64decode(file_data["data"]) if "data" in file_data else None
+    return await serve_blob(
+        file_id,
+        file_data["content_type"],
+        len(legacy_content) if legacy_content is not None else file_data["size"],
+        file_data.get("etag") or file_data["id"],
+        file_data.get("filename") or file_id,
+        range_header,
+        if_none_match,
+        legacy_content
+    )
+
+async def serve_blob(
+    key: str,
+    content_type: str,
+    size: int,
+    etag: str,
+    filename: str,
+    range_header: Optional[str],
+    if_none_match: Optional[str],
+    content: Optional[bytes] = None
+) -> Response:
+    """Build the (partial) response for a stored blob, or for inline `content`"""
+    etag = f'"{etag}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Blob keys always refer to the same bytes
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(filename)}"
     }
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    start, end, status_code = 0, size - 1, 200
+    if range_header and size > 0:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        # A Range header that cannot be parsed is ignored and the whole file sent
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1 if size > 0 else 0)
+    
+    if content is not None:
+        return Response(content=content[start:end + 1], status_code=status_code, media_type=content_type, headers=headers)
+    
+    return StreamingResponse(
+        blob_store.read(key, start, end) if size > 0 else iter([]),
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers
+    )
 
 # ============ NGO MAP ENDPOINTS ============
 
 @api_router.get("/ngos/verified")
-async def get_verified_ngos():
+async def get_verified_ngos(if_none_match: Optional[str] = Header(None)):
     """Get all verified NGOs with their locations"""
-    verifications = await db.ngo_verifications.find({"status": "approved"}, {"_id": 0}).to_list(500)
+    return await cached_json_response("ngos_verified", compute_verified_ngos, if_none_match)
+
+async def compute_verified_ngos() -> List[Dict[str, Any]]:
+    verifications = await db.ngo_verifications.find(
+        {"status": "approved"},
+        {"_id": 0, "user_id": 1, "organization_name": 1, "location": 1, "address": 1, "city": 1}
+    ).to_list(500)
+    users = await users_by_id([v["user_id"] for v in verifications], ["name"])
     
     ngos = []
     for v in verifications:
-        user = await db.users.find_one({"id": v["user_id"]}, {"_id": 0, "password": 0})
+        user = users.get(v["user_id"])
         ngos.append({
             "id": v["user_id"],
             "organization_name": v.get("organization_name"),
@@ -1393,6 +3441,15 @@ async def make_admin(email: str):
         {"email": email},
         {"$set": {"role": "admin", "is_verified": True, "phone_verified": True}}
     )
+    user_cache.invalidate(user["id"])
+    
+    # The user leaves whichever public counter their old role was part of
+    if user.get("role") == "donor":
+        await bump_impact(donors_registered=-1)
+    elif user.get("role") == "ngo" and user.get("is_verified"):
+        await bump_impact(ngos_served=-1)
+    elif user.get("role") == "volunteer" and user.get("is_verified"):
+        await bump_impact(active_volunteers=-1)
     
     return {"message": f"User {email} is now an admin. Go to /admin to access the dashboard."}
 
@@ -1407,8 +3464,93 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.on_event("startup")
+async def init_database():
+    """Backfill derived fields, then create indexes and optionally check query plans"""
+    global transactions_supported
+    hello = await client.admin.command("hello")
+    transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    if not transactions_supported:
+        logger.info("MongoDB is standalone; multi-document writes fall back to compensation")
+    
+    await db.food_requests.update_many(
+        {"location_geo": {"$exists": False}, "location.lat": {"$type": "number"}, "location.lng": {"$type": "number"}},
+        [{"$set": {"location_geo": {"type": "Point", "coordinates": ["$location.lng", "$location.lat"]}}}]
+    )
+    
+    await db.deliveries.update_many(
+        {"pickup_geo": {"$exists": False}, "pickup_location.lat": {"$type": "number"}, "pickup_location.lng": {"$type": "number"}},
+        [{"$set": {"pickup_geo": {"type": "Point", "coordinates": ["$pickup_location.lng", "$pickup_location.lat"]}}}]
+    )
+    missing = await db.deliveries.find(
+        {"trip_km": {"$exists": False}, "pickup_location": {"$ne": None}, "dropoff_location": {"$ne": None}},
+        {"_id": 0, "id": 1, "pickup_location": 1, "dropoff_location": 1}
+    ).to_list(None)
+    if missing:
+        trip_km = haversine_pairwise(
+            [d["pickup_location"]["lat"] for d in missing], [d["pickup_location"]["lng"] for d in missing],
+            [d["dropoff_location"]["lat"] for d in missing], [d["dropoff_location"]["lng"] for d in missing]
+        )
+        await db.deliveries.bulk_write(
+            [UpdateOne({"id": d["id"]}, {"$set": {"trip_km": float(km)}}) for d, km in zip(missing, trip_km)],
+            ordered=False
+        )
+    
+    # The expiry sweep compares expires_at as a string, which only works in UTC
+    local_expiry = await db.food_requests.find(
+        {"expires_at": {"$type": "string", "$not": {"$regex": r"\+00:00$"}}},
+        {"_id": 0, "id": 1, "expires_at": 1}
+    ).to_list(None)
+    fixes = []
+    for r in local_expiry:
+        try:
+            expires_at = utc_isoformat(datetime.fromisoformat(r["expires_at"].replace('Z', '+00:00')))
+        except ValueError:
+            logger.warning(f"Food request {r['id']} has an unreadable expires_at: {r['expires_at']!r}")
+            continue
+        fixes.append(UpdateOne({"id": r["id"]}, {"$set": {"expires_at": expires_at}}))
+    if fixes:
+        await db.food_requests.bulk_write(fixes, ordered=False)
+    
+    # Requests and deliveries carry their NGO's city for the per-city rollups
+    ngo_ids = set(await db.food_requests.distinct("ngo_id", {"city": {"$exists": False}}))
+    ngo_ids |= set(await db.deliveries.distinct("ngo_id", {"city": {"$exists": False}}))
+    if ngo_ids:
+        async for v in db.ngo_verifications.find({"user_id": {"$in": list(ngo_ids)}}, {"_id": 0, "user_id": 1, "city": 1}):
+            for collection in (db.food_requests, db.deliveries):
+                await collection.update_many({"ngo_id": v["user_id"], "city": {"$exists": False}}, {"$set": {"city": v.get("city")}})
+    
+    await ensure_indexes(db)
+    await migrate_legacy_analytics()
+    if os.environ.get('QUERY_PLAN_CHECK', '').lower() in ('1', 'true', 'yes'):
+        results = await verify_query_plans(db)
+        scans = [r for r in results if r["collscan"]]
+        logger.info(f"Query plan check: {len(scans)} of {len(results)} query shapes scan a collection")
+
+_background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_periodic_jobs():
+    urgency_scorer.start()
+    scheduler.start()
+    # Change streams need a replica set; otherwise handlers publish in process
+    if transactions_supported and os.environ.get('LIVE_FEED_SOURCE', 'auto') != 'in_process':
+        _background_tasks.append(asyncio.create_task(
+            watch_changes(
+                db, event_bus, list(FEED_FIELDS), sorted({f for fs in FEED_FIELDS.values() for f in fs}),
+                on_open=resync_dispatch_index
+            )
+        ))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in _background_tasks:
+        task.cancel()
+    await scheduler.stop()
+    await urgency_scorer.stop()
     client.close()
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,216 @@
+"""Blob storage for uploaded files.
+
+Uploads are streamed to a `BlobStore` in chunks, and only their metadata is
+kept in the `uploads` collection. Two backends are available:
+
+- `LocalBlobStore` writes files under a directory on local disk (default).
+- `S3BlobStore` writes to any S3-compatible service through boto3. Point
+  `S3_ENDPOINT_URL` at a local MinIO to develop against it offline.
+
+`get_blob_store` picks the backend from the BLOB_STORE environment variable.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+# S3 multipart parts must be at least 5 MiB, except the last one
+S3_PART_SIZE = 8 * 1024 * 1024
+
+@dataclass
+class BlobInfo:
+    size: int
+    etag: str  # hex sha256 of the content
+
+class BlobStore(ABC):
+    """Interface implemented by the storage backends."""
+
+    name = "base"
+
+    @abstractmethod
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> BlobInfo:
+        """Store the chunks under `key`, replacing any blob already there."""
+
+    @abstractmethod
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes of `key` from `start` to `end` inclusive (end of blob if None)."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove `key`; removing a missing blob is not an error."""
+
+class LocalBlobStore(BlobStore):
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        # Fan out by key prefix so one directory never holds every upload
+        return self.root / key[:2] / key
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> BlobInfo:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique per write: variants such as <id>.thumb.webp and <id>.thumb.jpg share a stem,
+        # and two workers may write the same key at once
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            tmp_path.unlink(missing_ok=True)
+            raise
+        await asyncio.to_thread(f.close)
+        os.replace(tmp_path, path)
+        return BlobInfo(size=size, etag=digest.hexdigest())
+
+    async def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+class S3BlobStore(BlobStore):
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> BlobInfo:
+        s3_key = self._key(key)
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                buffer += chunk
+                if len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        created = await asyncio.to_thread(
+                            self.client.create_multipart_upload, Bucket=self.bucket, Key=s3_key
+                        )
+                        upload_id = created["UploadId"]
+                    part_number = len(parts) + 1
+                    uploaded = await asyncio.to_thread(
+                        self.client.upload_part, Bucket=self.bucket, Key=s3_key, UploadId=upload_id,
+                        PartNumber=part_number, Body=bytes(buffer)
+                    )
+                    parts.append({"ETag": uploaded["ETag"], "PartNumber": part_number})
+                    buffer.clear()
+            if upload_id is None:
+                # Small object: a single PUT is cheaper than a multipart upload
+                await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=s3_key, Body=bytes(buffer))
+            else:
+                if buffer:
+                    part_number = len(parts) + 1
+                    uploaded = await asyncio.to_thread(
+                        self.client.upload_part, Bucket=self.bucket, Key=s3_key, UploadId=upload_id,
+                        PartNumber=part_number, Body=bytes(buffer)
+                    )
+                    parts.append({"ETag": uploaded["ETag"], "PartNumber": part_number})
+                await asyncio.to_thread(
+                    self.client.complete_multipart_upload, Bucket=self.bucket, Key=s3_key,
+                    UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+        except BaseException:
+            if upload_id is not None:
+                await asyncio.to_thread(
+                    self.client.abort_multipart_upload, Bucket=self.bucket, Key=s3_key, UploadId=upload_id
+                )
+            raise
+        return BlobInfo(size=size, etag=digest.hexdigest())
+
+    async def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        byte_range = f"bytes={start}-" if end is None else f"bytes={start}-{end}"
+        obj = await asyncio.to_thread(self.client.get_object, Bucket=self.bucket, Key=self._key(key), Range=byte_range)
+        body = obj["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+
+def get_blob_store(default_root: Path) -> BlobStore:
+    """Build the blob store selected by BLOB_STORE (local or s3)."""
+    backend = os.environ.get('BLOB_STORE', 'local')
+    if backend == "local":
+        return LocalBlobStore(Path(os.environ.get('BLOB_STORE_PATH', default_root)))
+    if backend == "s3":
+        return S3BlobStore(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', 'uploads/'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL')
+        )
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$", re.IGNORECASE)
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `Range` header into inclusive (start, end) offsets.
+
+    Returns None for a header to ignore: malformed, in another unit, or
+    asking for several ranges. RFC 9110 says to serve the full content
+    then. Raises ValueError when a valid range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        # A last-pos before first-pos makes the range invalid, not unsatisfiable
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
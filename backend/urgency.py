@@ -0,0 +1,368 @@
+"""Urgency scoring for food requests, from 0 (can wait) to 10 (urgent).
+
+`UrgencyScorer` runs in the background. Requests are queued with
+`submit`, which never waits, and a worker collects them into batches of
+up to `batch_size`. Each batch goes to the model as one prompt, and at
+most `concurrency` batches are in flight at once.
+
+Results are cached by a hash of the fields the prompt uses, so an
+unchanged request is never sent twice. When the model is slow (past
+`timeout` seconds), fails, or leaves an item out, that item falls back
+to the local rules. Fallback scores are not cached, so the request is
+tried again the next time it is scored.
+
+`rule_scores` is the local scorer: deterministic rules over the
+urgency level, perishability, unfilled servings, time to expiry, time
+waiting, the NGO's backlog and how many donors are nearby, computed for
+thousands of requests in one NumPy pass. It costs nothing per call, so
+the server also runs it periodically over every open request.
+
+Models implement `score(items) -> {request_id: score}`. `LlmUrgencyModel`
+calls the hosted LLM. `StubUrgencyModel` scores locally with optional
+delays and failures, so the pipeline can be exercised offline.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Fields the prompt shows the model; the cache key is a hash of these
+PROMPT_FIELDS = ("food_type", "quantity", "urgency_level", "description", "created_at", "expires_at")
+
+URGENCY_LEVEL_BASE = {"low": 2.0, "medium": 4.0, "high": 6.5, "critical": 8.5}
+# Perishability by food_type
+FOOD_TYPE_BONUS = {"cooked": 1.0, "raw": 0.5, "mixed": 0.5, "packaged": 0.0}
+# A request expiring within this many hours gains up to EXPIRY_BONUS
+EXPIRY_WINDOW_HOURS = 6.0
+EXPIRY_BONUS = 1.5
+# Waiting this long unfulfilled adds the full WAITING_BONUS
+WAITING_FULL_HOURS = 48.0
+WAITING_BONUS = 1.0
+# Other open requests from the same NGO add up to BACKLOG_BONUS
+BACKLOG_BONUS = 0.5
+BACKLOG_SCALE = 5.0
+# Few donors nearby add up to SCARCITY_BONUS; it halves about every 7 donors
+SCARCITY_BONUS = 1.0
+SCARCITY_SCALE = 10.0
+
+SYSTEM_MESSAGE = (
+    "You are an AI assistant that calculates urgency scores for food requests. "
+    "Reply with a JSON object mapping each request id to a number between 0 and 10, and nothing else."
+)
+
+def prompt_fields(request: Dict[str, Any]) -> Dict[str, Any]:
+    return {f: request.get(f) for f in PROMPT_FIELDS}
+
+def content_hash(request: Dict[str, Any]) -> str:
+    payload = json.dumps(prompt_fields(request), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+def hours_between(start: Any, end: datetime) -> Optional[float]:
+    if not start:
+        return None
+    try:
+        moment = start if isinstance(start, datetime) else datetime.fromisoformat(str(start).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (end - moment).total_seconds() / 3600.0
+
+def rule_scores(
+    requests: Sequence[Dict[str, Any]],
+    now: Optional[datetime] = None,
+    backlog: Optional[np.ndarray] = None,
+    donors_nearby: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Rule-based urgency for many requests in one vectorised pass.
+
+    Uses the urgency level, perishability of the food type, unfilled
+    servings, time to expiry and time waiting. `backlog` (open requests
+    from the same NGO) and `donors_nearby` are optional per-request
+    counts; when left out they add nothing.
+    """
+    now = now or datetime.now(timezone.utc)
+    n = len(requests)
+    medium = URGENCY_LEVEL_BASE["medium"]
+    score = np.fromiter((URGENCY_LEVEL_BASE.get(r.get("urgency_level") or "medium", medium) for r in requests), np.float64, n)
+    score += np.fromiter((FOOD_TYPE_BONUS.get(r.get("food_type") or "", 0.0) for r in requests), np.float64, n)
+    unfilled = np.fromiter(((r.get("quantity") or 0) - (r.get("fulfilled_quantity") or 0) for r in requests), np.float64, n)
+    # 10 servings add a third of a point, 1,000 or more a full point
+    score += np.minimum(1.0, np.log10(1 + np.maximum(unfilled, 0.0)) / 3)
+
+    def hours(field: str) -> np.ndarray:
+        values = (hours_between(r.get(field), now) for r in requests)
+        return np.fromiter((np.nan if h is None else h for h in values), np.float64, n)
+
+    with np.errstate(invalid="ignore"):
+        hours_left = -hours("expires_at")
+        score += np.nan_to_num(EXPIRY_BONUS * np.clip(1 - hours_left / EXPIRY_WINDOW_HOURS, 0.0, 1.0))
+        score += np.nan_to_num(WAITING_BONUS * np.clip(hours("created_at") / WAITING_FULL_HOURS, 0.0, 1.0))
+    if backlog is not None:
+        score += BACKLOG_BONUS * (1 - np.exp(-np.maximum(backlog - 1, 0) / BACKLOG_SCALE))
+    if donors_nearby is not None:
+        score += SCARCITY_BONUS * np.exp(-donors_nearby / SCARCITY_SCALE)
+    return np.round(np.clip(score, 0.0, 10.0), 1)
+
+def ngo_backlog(requests: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """For each request, how many of the given requests share its NGO"""
+    _, inverse, counts = np.unique([r.get("ngo_id") or "" for r in requests], return_inverse=True, return_counts=True)
+    return counts[inverse].astype(np.float64)
+
+def rescore_by_rules(
+    requests: Sequence[Dict[str, Any]],
+    donors_nearby: Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]] = None,
+    now: Optional[datetime] = None
+) -> List[Tuple[Dict[str, Any], float]]:
+    """Rule scores for the open requests the model has not scored.
+
+    Every request counts towards its NGO's backlog. `donors_nearby`
+    maps latitude and longitude arrays to donor counts. Requests without
+    a location get no scarcity bonus.
+    """
+    if not requests:
+        return []
+    backlog = ngo_backlog(requests)
+    keep = np.array([r.get("urgency_source") != "model" for r in requests], dtype=bool)
+    rules = [r for r, k in zip(requests, keep) if k]
+    nearby = None
+    if donors_nearby is not None:
+        lat = np.array([(r.get("location") or {}).get("lat", np.nan) for r in rules], dtype=np.float64)
+        lng = np.array([(r.get("location") or {}).get("lng", np.nan) for r in rules], dtype=np.float64)
+        located = ~(np.isnan(lat) | np.isnan(lng))
+        nearby = np.full(len(rules), np.inf)
+        nearby[located] = donors_nearby(lat[located], lng[located])
+    return list(zip(rules, rule_scores(rules, now, backlog[keep], nearby).tolist()))
+
+def heuristic_score(request: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """`rule_scores` for a single request, without backlog or donor density"""
+    return float(rule_scores([request], now)[0])
+
+def build_prompt(items: Sequence[Dict[str, Any]]) -> str:
+    lines = [
+        "Calculate an urgency score (0-10) for each of these food requests.",
+        "Each line is one request as JSON:",
+    ]
+    for item in items:
+        fields = prompt_fields(item)
+        fields["description"] = fields["description"] or "N/A"
+        fields["expires_at"] = fields["expires_at"] or "Not specified"
+        lines.append(json.dumps({"id": item["id"], **fields}, default=str))
+    lines.append('Return ONLY a JSON object such as {"<id>": 7.5}, with every id above.')
+    return "\n".join(lines)
+
+def parse_scores(text: str, ids: Sequence[str]) -> Dict[str, float]:
+    """Scores for the known ids in a model reply; unusable entries are left out"""
+    text = (text or "").strip()
+    scores: Dict[str, float] = {}
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if match:
+        try:
+            raw = json.loads(match.group(0))
+        except ValueError:
+            raw = {}
+        for key in ids:
+            try:
+                value = float(raw[key])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if math.isfinite(value):
+                scores[key] = max(0.0, min(10.0, value))
+    elif len(ids) == 1:
+        # A bare number is fine for a single request
+        try:
+            value = float(text)
+        except ValueError:
+            return scores
+        if math.isfinite(value):
+            scores[ids[0]] = max(0.0, min(10.0, value))
+    return scores
+
+class LlmUrgencyModel:
+    """Scores a batch with one call to the hosted LLM"""
+
+    def __init__(self, api_key: str, provider: str = "openai", model: str = "gpt-5.2"):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+
+    async def score(self, items: Sequence[Dict[str, Any]]) -> Dict[str, float]:
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+        # A session per batch; reusing one would send the previous batches as history
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=f"urgency-{uuid.uuid4()}",
+            system_message=SYSTEM_MESSAGE
+        ).with_model(self.provider, self.model)
+        response = await chat.send_message(UserMessage(text=build_prompt(items)))
+        return parse_scores(response, [item["id"] for item in items])
+
+class StubUrgencyModel:
+    """Offline model: the heuristic plus `offset`, after `delay` seconds, optionally failing"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False, offset: float = 0.0):
+        self.delay = delay
+        self.fail = fail
+        self.offset = offset
+        self.batches: List[int] = []
+
+    async def score(self, items: Sequence[Dict[str, Any]]) -> Dict[str, float]:
+        self.batches.append(len(items))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("stub model failure")
+        return {item["id"]: max(0.0, min(10.0, heuristic_score(item) + self.offset)) for item in items}
+
+# Receives [{id, score, source, hash}] for each scored batch
+ScoreSink = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+class UrgencyScorer:
+    def __init__(
+        self,
+        model: Optional[Any],
+        on_scored: Optional[ScoreSink] = None,
+        batch_size: int = 20,
+        concurrency: int = 4,
+        timeout: float = 10.0,
+        batch_wait: float = 0.5,
+        queue_size: int = 10000,
+        cache_size: int = 10000,
+        cache_ttl: float = 24 * 3600
+    ):
+        self.model = model
+        self.on_scored = on_scored
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.batch_wait = batch_wait
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(queue_size)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        self.counts = {"submitted": 0, "batches": 0, "model_scored": 0, "cached": 0, "fallback": 0, "timeouts": 0, "errors": 0}
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        tasks = [t for t in [self._worker, *self._inflight] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker = None
+
+    def submit(self, request: Dict[str, Any]) -> bool:
+        """Queue a request for background scoring; False if the queue is full"""
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            return False
+        self.counts["submitted"] += 1
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # Give a burst of submissions a moment to fill the batch
+            deadline = asyncio.get_running_loop().time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Wait for a free slot here, so the queue (not tasks) holds the backlog
+            await self._slots.acquire()
+            task = asyncio.create_task(self._score_and_store(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _score_and_store(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            results = await self._score(batch)
+            if self.on_scored is not None:
+                await self.on_scored(results)
+        except Exception as e:
+            logger.error(f"Urgency scoring batch failed: {e}")
+        finally:
+            self._slots.release()
+
+    async def score_now(self, requests: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score and store right away, in batches, still within the concurrency limit"""
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(requests), self.batch_size):
+            async with self._slots:
+                batch = await self._score(requests[start:start + self.batch_size])
+            if self.on_scored is not None:
+                await self.on_scored(batch)
+            results += batch
+        return results
+
+    async def _score(self, batch: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Scores for a batch: cached, then from the model, then by heuristic"""
+        self.counts["batches"] += 1
+        hashes = {r["id"]: content_hash(r) for r in batch}
+        scores: Dict[str, Dict[str, Any]] = {}
+        pending = []
+        for request in batch:
+            cached = self.cache.get(hashes[request["id"]])
+            if cached is None and request.get("urgency_source") == "model" and request.get("urgency_hash") == hashes[request["id"]]:
+                # Scored by the model before, e.g. by another worker or before a restart
+                cached = request.get("ai_urgency_score")
+            if cached is not None:
+                scores[request["id"]] = {"score": cached, "source": "cached"}
+            else:
+                pending.append(request)
+
+        if pending and self.model is not None:
+            try:
+                answered = await asyncio.wait_for(self.model.score(pending), self.timeout)
+            except asyncio.TimeoutError:
+                self.counts["timeouts"] += 1
+                logger.warning(f"Urgency model timed out after {self.timeout}s; using the heuristic for {len(pending)} requests")
+                answered = {}
+            except Exception as e:
+                self.counts["errors"] += 1
+                logger.warning(f"Urgency model failed; using the heuristic for {len(pending)} requests: {e}")
+                answered = {}
+            for request in pending:
+                if request["id"] in answered:
+                    score = round(answered[request["id"]], 1)
+                    self.cache.set(hashes[request["id"]], score)
+                    scores[request["id"]] = {"score": score, "source": "model"}
+
+        missing = [r for r in batch if r["id"] not in scores]
+        if missing:
+            for request, score in zip(missing, rule_scores(missing).tolist()):
+                scores[request["id"]] = {"score": score, "source": "heuristic"}
+        results = []
+        for request in batch:
+            found = scores[request["id"]]
+            self.counts[{"cached": "cached", "model": "model_scored"}.get(found["source"], "fallback")] += 1
+            results.append({"id": request["id"], **found, "hash": hashes[request["id"]]})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counts,
+            "model": type(self.model).__name__ if self.model is not None else None,
+            "queued": self._queue.qsize(),
+            "in_flight": len(self._inflight),
+            "cache": self.cache.stats(),
+        }
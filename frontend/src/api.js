@@ -15,8 +15,8 @@ export const ngoApi = {
   getVerification: () => 
     axios.get(`${API}/ngo/verification`, { headers: getAuthHeader() }),
   
-  getRequests: () => 
-    axios.get(`${API}/ngo/requests`, { headers: getAuthHeader() }),
+  getRequests: (params) => 
+    axios.get(`${API}/ngo/requests`, { headers: getAuthHeader(), params }),
   
   confirmReceipt: (requestId) =>
     axios.post(`${API}/requests/${requestId}/confirm-receipt`, {}, { headers: getAuthHeader() }),
@@ -39,8 +39,8 @@ export const donorApi = {
   createFulfillment: (data) => 
     axios.post(`${API}/donor/fulfill`, data, { headers: getAuthHeader() }),
   
-  getFulfillments: () => 
-    axios.get(`${API}/donor/fulfillments`, { headers: getAuthHeader() }),
+  getFulfillments: (params) => 
+    axios.get(`${API}/donor/fulfillments`, { headers: getAuthHeader(), params }),
 };
 
 // Volunteer APIs
@@ -51,8 +51,8 @@ export const volunteerApi = {
   updateProfile: (data) => 
     axios.put(`${API}/volunteer/profile`, null, { headers: getAuthHeader(), params: data }),
   
-  getDeliveries: () => 
-    axios.get(`${API}/volunteer/deliveries`, { headers: getAuthHeader() }),
+  getDeliveries: (params) => 
+    axios.get(`${API}/volunteer/deliveries`, { headers: getAuthHeader(), params }),
   
   getAvailableDeliveries: (lat, lng) => 
     axios.get(`${API}/volunteer/available-deliveries`, { 
@@ -60,6 +60,9 @@ export const volunteerApi = {
       params: { lat, lng } 
     }),
   
+  getRoute: (params) =>
+    axios.get(`${API}/volunteer/route`, { headers: getAuthHeader(), params }),
+  
   acceptDelivery: (deliveryId) =>
     axios.post(`${API}/volunteer/deliveries/${deliveryId}/accept`, {}, { headers: getAuthHeader() }),
   
@@ -122,6 +125,12 @@ export const analyticsApi = {
   
   getUser: () => 
     axios.get(`${API}/analytics/user`, { headers: getAuthHeader() }),
+  
+  getRollups: (params) =>
+    axios.get(`${API}/analytics/rollups`, { params }),
+  
+  getCityRollups: (params) =>
+    axios.get(`${API}/analytics/rollups/cities`, { params }),
 };
 
 // Utility APIs
@@ -140,3 +149,19 @@ export const utilityApi = {
   seedAdmin: () =>
     axios.post(`${API}/seed/admin`),
 };
+
+// Live feed (Server-Sent Events); EventSource cannot send headers, so a
+// short-lived feed token (never the session token) goes in the URL
+export const liveApi = {
+  getToken: () =>
+    axios.post(`${API}/live/token`, {}, { headers: getAuthHeader() }),
+
+  feedUrl: async (params = {}) => {
+    const response = await liveApi.getToken();
+    const query = new URLSearchParams({ token: response.data.token });
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== undefined && value !== null) query.set(key, value);
+    });
+    return `${API}/live/feed?${query.toString()}`;
+  },
+};
@@ -0,0 +1,73 @@
+import { useEffect, useRef } from 'react';
+import { liveApi } from '@/api';
+
+// Merges a feed document into a list of records with ids. Feed documents
+// carry only the feed's fields, or just id and status once a record leaves
+// a user's view, so they are merged into what is already held. A record
+// that `keep` rejects is dropped; an unseen one it accepts goes first.
+export function applyFeedDoc(list, doc, keep = () => true) {
+  const index = list.findIndex((item) => item.id === doc.id);
+  if (index === -1) return keep(doc) ? [doc, ...list] : list;
+  const merged = { ...list[index], ...doc };
+  return keep(merged)
+    ? [...list.slice(0, index), merged, ...list.slice(index + 1)]
+    : [...list.slice(0, index), ...list.slice(index + 1)];
+}
+
+// Subscribes to the live feed. `handlers` maps a collection name to a
+// function called with (doc, op) for each change, and `resync` to one that
+// refetches everything; only the named collections are streamed. Resyncs
+// are debounced. EventSource reconnects by itself and resumes with
+// Last-Event-ID. Its URL token is short-lived, so once a reconnect is
+// refused the source closes; it is then reopened with a fresh token and a
+// resync run, since events may have been missed in between.
+export function useLiveFeed(handlers, params = {}, { enabled = true, debounceMs = 500, retryMs = 3000 } = {}) {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+  const collections = Object.keys(handlers).filter((name) => name !== 'resync').sort().join(',');
+  const paramsKey = JSON.stringify(params);
+
+  useEffect(() => {
+    if (!enabled || !collections || typeof EventSource === 'undefined') return undefined;
+
+    let source = null;
+    let timer = null;
+    let retryTimer = null;
+    let stopped = false;
+    const resync = () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => handlersRef.current.resync?.(), debounceMs);
+    };
+    const change = (event) => {
+      const { op, doc } = JSON.parse(event.data);
+      handlersRef.current[event.type]?.(doc, op);
+    };
+    const connect = async (reconnecting) => {
+      let url;
+      try {
+        url = await liveApi.feedUrl({ ...JSON.parse(paramsKey), collections });
+      } catch (error) {
+        if (!stopped) retryTimer = setTimeout(() => connect(reconnecting), retryMs);
+        return;
+      }
+      if (stopped) return;
+      source = new EventSource(url);
+      collections.split(',').forEach((name) => source.addEventListener(name, change));
+      source.addEventListener('resync', resync);
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && !stopped) {
+          retryTimer = setTimeout(() => connect(true), retryMs);
+        }
+      };
+      if (reconnecting) resync();
+    };
+    connect(false);
+
+    return () => {
+      stopped = true;
+      clearTimeout(timer);
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [enabled, debounceMs, retryMs, paramsKey, collections]);
+}
@@ -23,6 +23,7 @@ import {
   Brain
 } from 'lucide-react';
 import { toast } from 'sonner';
+import { useLiveFeed, applyFeedDoc } from '../hooks/use-live-feed';
 
 export const AdminDashboard = () => {
   const { user } = useAuth();
@@ -62,6 +63,12 @@ export const AdminDashboard = () => {
     fetchData();
   }, [fetchData]);
 
+  useLiveFeed({
+    food_requests: (doc) => setAllRequests((list) => applyFeedDoc(list, doc)),
+    deliveries: (doc) => setAllDeliveries((list) => applyFeedDoc(list, doc)),
+    resync: fetchData,
+  });
+
   const handleReview = async () => {
     try {
       if (reviewDialog.type === 'ngo') {
@@ -20,6 +20,7 @@ import {
   Building2
 } from 'lucide-react';
 import { toast } from 'sonner';
+import { useLiveFeed, applyFeedDoc } from '../hooks/use-live-feed';
 
 export const DonorDashboard = () => {
   const { user } = useAuth();
@@ -80,6 +81,13 @@ export const DonorDashboard = () => {
     fetchData();
   }, [fetchData]);
 
+  // Requests near the donor update in place; donors act on open requests only
+  useLiveFeed({
+    food_requests: (doc) => setRequests((list) =>
+      applyFeedDoc(list, doc, (request) => ['approved', 'active'].includes(request.status))),
+    resync: fetchData,
+  }, { lat: userLocation?.lat, lng: userLocation?.lng });
+
   const getUrgencyColor = (urgency) => {
     const colors = {
       critical: 'bg-destructive text-destructive-foreground',
@@ -20,6 +20,7 @@ import {
   MapPin
 } from 'lucide-react';
 import { toast } from 'sonner';
+import { useLiveFeed, applyFeedDoc } from '../hooks/use-live-feed';
 
 export const NGODashboard = () => {
   const { user } = useAuth();
@@ -51,6 +52,12 @@ export const NGODashboard = () => {
     fetchData();
   }, [fetchData]);
 
+  // The feed only carries this NGO's own requests to it
+  useLiveFeed({
+    food_requests: (doc) => setRequests((list) => applyFeedDoc(list, doc)),
+    resync: fetchData,
+  }, {}, { enabled: verification?.status === 'approved' });
+
   const handleConfirmReceipt = async (requestId) => {
     try {
       await ngoApi.confirmReceipt(requestId);
@@ -19,6 +19,7 @@ import {
   Camera
 } from 'lucide-react';
 import { toast } from 'sonner';
+import { useLiveFeed, applyFeedDoc } from '../hooks/use-live-feed';
 
 export const VolunteerDashboard = () => {
   const { user } = useAuth();
@@ -76,6 +77,20 @@ export const VolunteerDashboard = () => {
     fetchData();
   }, [fetchData]);
 
+  // Delivery changes near the volunteer update both lists in place
+  const isMine = (delivery) =>
+    delivery.volunteer_id === user?.id || (delivery.additional_volunteers || []).includes(user?.id);
+  useLiveFeed({
+    deliveries: (doc) => {
+      setDeliveries((list) => applyFeedDoc(list, doc, isMine));
+      setAvailableDeliveries((list) =>
+        applyFeedDoc(list, doc, (delivery) => delivery.status === 'pending' && !delivery.volunteer_id));
+    },
+    resync: fetchData,
+  }, { lat: userLocation?.lat, lng: userLocation?.lng }, {
+    enabled: profile?.status === 'approved',
+  });
+
   const handleAcceptDelivery = async (deliveryId) => {
     try {
       await volunteerApi.acceptDelivery(deliveryId);